@@ -0,0 +1,95 @@
+"""
+Rebuild the daily, weekly and monthly rollup tables from meals and drinks.
+
+The bot keeps the rollups current as entries are saved; run this once after
+deploying them, or after editing meals and drinks directly in the database.
+Each rebuild runs in one transaction, so reports keep showing the old rows
+until it commits. Days are snapshotted against each user's current target.
+
+    python backfill_rollups.py
+    python backfill_rollups.py --user 123456789
+"""
+import argparse
+import logging
+import time
+
+from config import Config
+from database import ROLLUPS, get_db, rollup_period_query
+from logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_DAYS = '''
+    INSERT INTO daily_totals (user_id, date, calories, protein, fat, carbs, meals, drinks, target_calories)
+    SELECT e.user_id, e.date, SUM(e.calories), SUM(e.protein), SUM(e.fat), SUM(e.carbs),
+           SUM(e.meals), SUM(e.drinks), MAX(u.daily_calories)
+    FROM (
+        SELECT user_id, date, total_calories AS calories, total_protein AS protein,
+               total_fat AS fat, total_carbs AS carbs, 1 AS meals, 0 AS drinks
+        FROM meals WHERE {where}
+        UNION ALL
+        SELECT user_id, date, calories, protein, fat, carbs, 0, 1
+        FROM drinks WHERE {where}
+    ) e
+    LEFT JOIN users u ON u.id = e.user_id
+    GROUP BY e.user_id, e.date
+'''
+
+
+def rebuild(cur, user_id=None, start=None, end=None):
+    """
+    Recompute rollups from meals and drinks in the caller's transaction,
+    for one user or all, optionally only for days between start and end;
+    returns rows written per table.
+    """
+    params = {'user_id': user_id, 'start': start, 'end': end, 'tolerance': Config.ADHERENCE_TOLERANCE}
+    users = ['user_id = %(user_id)s'] if user_id is not None else []
+    counts = {}
+
+    days = users + (['date BETWEEN %(start)s AND %(end)s'] if start is not None else [])
+    where = ' AND '.join(days) or 'TRUE'
+    cur.execute(f'DELETE FROM daily_totals WHERE {where}', params)
+    cur.execute(BACKFILL_DAYS.format(where=where), params)
+    counts['daily_totals'] = cur.rowcount
+
+    for period in ('week', 'month'):
+        table, column = ROLLUPS[period]
+        periods, days = list(users), list(users)
+        if start is not None:
+            # Whole weeks and months around the rebuilt days
+            periods.append(f"{column} BETWEEN date_trunc('{period}', %(start)s::date) AND %(end)s")
+            days.append(f"date >= date_trunc('{period}', %(start)s::date) "
+                        f"AND date < date_trunc('{period}', %(end)s::date) + interval '1 {period}'")
+        cur.execute(f"DELETE FROM {table} WHERE {' AND '.join(periods) or 'TRUE'}", params)
+        cur.execute(rollup_period_query(period, ' AND '.join(days) or 'TRUE'), params)
+        counts[table] = cur.rowcount
+    return counts
+
+
+def backfill(db, user_id=None):
+    """Rebuild all rollups, or one user's, in one transaction; returns rows written per table"""
+    try:
+        with db.cursor() as cur:
+            counts = rebuild(cur, user_id)
+        db.conn.commit()
+    except Exception as e:
+        logger.error(f"Error rebuilding rollups: {e}")
+        db.conn.rollback()
+        raise
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--user', type=int, help='only rebuild this user')
+    args = parser.parse_args()
+
+    configure_logging()
+    start = time.perf_counter()
+    counts = backfill(get_db(), args.user)
+    elapsed = time.perf_counter() - start
+    print(', '.join(f"{table}: {rows} rows" for table, rows in counts.items()) + f" in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
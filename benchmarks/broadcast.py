@@ -0,0 +1,124 @@
+"""
+A trainer broadcast to thousands of trainees.
+
+Needs a real PostgreSQL at DATABASE_URL. A scratch schema (dropped
+afterwards unless --keep) gets one trainer with --trainees trainees, a
+few of whom have blocked the bot. The broadcast runs through the outbox
+against a fake bot with Telegram-like flood control while the trainer
+keeps sending commands, whose replies are timed. Delivery rows are
+written in batches of BROADCAST_WRITE_BATCH, one INSERT per batch
+rather than one per trainee; the INSERTs are counted.
+
+Run from the repository root:
+    python -m benchmarks.broadcast [--trainees 3000] [--photo]
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from telegram.error import Forbidden
+
+import broadcast
+from benchmarks.fakes import FakeBot, scratch_schema
+from config import Config
+from database import get_db
+from outbox import Outbox
+
+SCHEMA = 'benchmark_broadcast'
+
+TRAINER_ID = 1
+
+# One in BLOCKED_EVERY trainees has blocked the bot
+BLOCKED_EVERY = 50
+
+
+class BlockingBot(FakeBot):
+    """Fake bot on which some trainees have blocked the bot"""
+
+    async def _post(self, endpoint, data, rate_limit_args):
+        result = await super()._post(endpoint, data, rate_limit_args)
+        if data['chat_id'] % BLOCKED_EVERY == 0:
+            raise Forbidden('Forbidden: bot was blocked by the user')
+        return result
+
+
+def setup(trainees):
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute('''
+            INSERT INTO users (id, first_name, user_type) VALUES (%(trainer)s, 'Coach', 'trainer');
+            INSERT INTO users (id, first_name, user_type, trainer_id)
+            SELECT %(trainer)s + t, 'Trainee ' || t, 'trainee', %(trainer)s
+            FROM generate_series(1, %(trainees)s) t;
+            INSERT INTO trainer_trainee (trainer_id, trainee_id)
+            SELECT %(trainer)s, %(trainer)s + t FROM generate_series(1, %(trainees)s) t;
+        ''', {'trainer': TRAINER_ID, 'trainees': trainees})
+    db.conn.commit()
+
+
+async def run(bot, trainee_ids, text, file_id, conn, reply_interval):
+    """Broadcast while the trainer keeps getting replies; returns (seconds, counts, reply waits)"""
+    waits = []
+    done = asyncio.Event()
+
+    async def replies():
+        while not done.is_set():
+            start = time.perf_counter()
+            await bot.send_message(TRAINER_ID, 'reply')
+            waits.append(time.perf_counter() - start - bot.latency)
+            await asyncio.sleep(reply_interval)
+
+    task = asyncio.create_task(replies())
+    start = time.perf_counter()
+    counts = await broadcast.run_broadcast(bot, TRAINER_ID, 'Coach', trainee_ids, text, file_id, conn=conn)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, counts, waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trainees', type=int, default=3000)
+    parser.add_argument('--photo', action='store_true', help='broadcast a photo by file_id')
+    parser.add_argument('--flood-limit', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=Config.TELEGRAM_MAX_RPS, help='outbox requests per second')
+    parser.add_argument('--reply-interval', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated Bot API round trip (s)')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with scratch_schema(SCHEMA, args.keep) as connect:
+        setup(args.trainees)
+        conn = connect()
+
+        writes = []
+        write_deliveries = broadcast.write_deliveries
+        broadcast.write_deliveries = lambda *a: writes.append(len(a[2])) or write_deliveries(*a)
+        try:
+            trainee_ids = [row['id'] for row in get_db().get_trainees(TRAINER_ID)]
+            file_id = 'AgACAgIAAxkBAAI' if args.photo else None
+            bot = BlockingBot(Outbox(rate=args.rate), args.latency, args.flood_limit)
+            elapsed, counts, waits = asyncio.run(run(bot, trainee_ids, 'Session moved to 7pm', file_id,
+                                                     conn, args.reply_interval))
+            with conn.cursor() as cur:
+                cur.execute('SELECT status, COUNT(*) FROM broadcast_deliveries GROUP BY status ORDER BY status')
+                recorded = dict(cur.fetchall())
+            conn.commit()
+
+            print(f"{len(trainee_ids):,} trainees, {'photo' if args.photo else 'text'} broadcast, "
+                  f"flood limit {args.flood_limit}/s")
+            print(f"Delivered in {elapsed:.1f}s ({len(bot.sent) / elapsed:.1f} requests/s): {counts}; 429s: {bot.floods}")
+            print(f"Delivery rows recorded: {recorded} in {len(writes)} INSERTs (batch {Config.BROADCAST_WRITE_BATCH})")
+            print(f"Trainer replies during the broadcast: {len(waits)}, "
+                  f"p50 {statistics.median(waits) * 1000:.1f} ms, max {max(waits) * 1000:.1f} ms")
+        finally:
+            broadcast.write_deliveries = write_deliveries
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Throughput of update processing versus concurrency.
+
+Many users send their onboarding and /add_meal messages in quick
+succession; each user's messages arrive back to back, as a polling batch
+would deliver them when users type faster than the bot replies.
+Each configuration replays the same burst through an update processor and
+reports throughput and whether every user ended up with a complete profile
+and exactly one meal (i.e. their updates were processed in order).
+
+Run from the repository root:
+    python -m benchmarks.concurrency --users 100 --reply-latency 0.03
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.fakes import FakeDatabase, FakeMessage, FakeVisionClient, fake_context, make_user, text_update
+
+SCRIPT = (
+    '/start',
+    'Trainee',
+    '175',
+    '70',
+    '25',
+    'Male',
+    'Moderate (exercise 3-5 days/week)',
+    'Maintenance',
+    '/add_meal',
+    'Lunch',
+    'Egg - 50\nRice - 150',
+    'Yes',
+)
+
+
+def build_bot():
+    import database
+    from bot import FithubBot
+    database.set_db(FakeDatabase())
+    logging.getLogger().setLevel(logging.WARNING)
+    bot = FithubBot()
+    bot.vision.client = FakeVisionClient(0)
+    return bot
+
+
+def route(bot, text):
+    if text == '/start':
+        return bot.start
+    if text == '/add_meal':
+        return bot.add_meal_command
+    return bot.handle_message
+
+
+async def replay(processor, users):
+    """Feed the burst through processor; return (seconds, users in a bad state)"""
+    bot = build_bot()
+    updates = [
+        (text_update(user, text), route(bot, text))
+        for user in users
+        for text in SCRIPT
+    ]
+
+    start = time.perf_counter()
+    async with processor:
+        tasks = [
+            asyncio.create_task(processor.process_update(update, handler(update, fake_context())))
+            for update, handler in updates
+        ]
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    db = bot.db
+    broken = 0
+    for user in users:
+        row = db.users.get(user.id, {})
+        meals = sum(1 for meal in db.meals if meal['user_id'] == user.id)
+        if row.get('goal') is None or row.get('weight') is None or meals != 1:
+            broken += 1
+    return elapsed, broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--reply-latency', type=float, default=0.03, help='simulated Bot API round trip (s)')
+    parser.add_argument('--levels', default='1,4,16,64', help='concurrency levels to measure')
+    args = parser.parse_args()
+
+    from telegram.ext import SimpleUpdateProcessor
+    from update_processor import PerUserUpdateProcessor
+
+    FakeMessage.latency = args.reply_latency
+    users = [make_user(10 ** 9 + i) for i in range(args.users)]
+    levels = [int(level) for level in args.levels.split(',')]
+    total = args.users * len(SCRIPT)
+
+    print(f"{args.users} users x {len(SCRIPT)} updates, reply latency {args.reply_latency * 1000:.0f} ms")
+    print(f"{'processor':<12} {'limit':>6} {'seconds':>8} {'updates/s':>10} {'speedup':>8} {'out of order':>13}")
+    baseline = None
+    for name, cls in (('per-user', PerUserUpdateProcessor), ('unordered', SimpleUpdateProcessor)):
+        for level in levels:
+            if name == 'unordered' and level == 1:
+                continue
+            elapsed, broken = asyncio.run(replay(cls(level), users))
+            baseline = baseline or elapsed
+            print(f"{name:<12} {level:>6} {elapsed:>8.2f} {total / elapsed:>10.1f} "
+                  f"{baseline / elapsed:>7.1f}x {broken:>13}")
+
+
+if __name__ == '__main__':
+    main()
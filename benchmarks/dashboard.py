@@ -0,0 +1,116 @@
+"""
+/stats for a trainer: per-trainee recomputation vs the dashboard cache.
+
+Needs a real PostgreSQL at DATABASE_URL. A scratch schema (dropped
+afterwards unless --keep) gets one trainer with --trainees trainees, each
+with a few meals and drinks today. Today's numbers are read four ways:
+get_remaining_cpfc per trainee as /stats used to, one dashboard query
+(a cache miss), a page of the cached dashboard after patches (a hit),
+and a keyset page query as used for trainers too large to cache, on the
+last page. A check against the database then confirms the patched
+dashboard has not drifted.
+
+Run from the repository root:
+    python -m benchmarks.dashboard [--trainees 200] [--reads 50]
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from datetime import date
+
+import dashboard
+from benchmarks.fakes import scratch_schema
+from config import Config
+from cpfc_calculator import CPFCCalculator
+from dashboard import TrainerDashboards
+from database import dedicated_connection, get_db
+
+SCHEMA = 'benchmark_dashboard'
+
+TRAINER_ID = 1
+
+GENERATE = '''
+    INSERT INTO users (id, first_name, user_type) VALUES (%(trainer)s, 'Coach', 'trainer');
+    INSERT INTO users (id, first_name, username, user_type, daily_calories)
+    SELECT %(trainer)s + t, 'Trainee ' || t, 'trainee' || t, 'trainee', 1800 + (t %% 7) * 100
+    FROM generate_series(1, %(trainees)s) t;
+    INSERT INTO trainer_trainee (trainer_id, trainee_id)
+    SELECT %(trainer)s, %(trainer)s + t FROM generate_series(1, %(trainees)s) t;
+'''
+
+
+def setup(trainees, today):
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(GENERATE, {'trainer': TRAINER_ID, 'trainees': trainees})
+    db.conn.commit()
+    for trainee_id in range(TRAINER_ID + 1, TRAINER_ID + trainees + 1):
+        for meal_type in ('Breakfast', 'Lunch'):
+            db.save_meal({'user_id': trainee_id, 'meal_type': meal_type, 'date': today,
+                          'calories': 550, 'protein': 30, 'fat': 18, 'carbs': 65})
+        db.save_drink({'user_id': trainee_id, 'drink_name': 'latte', 'volume_ml': 300, 'date': today,
+                       'calories': 150, 'protein': 8, 'fat': 6, 'carbs': 15})
+    with db.cursor() as cur:
+        cur.execute('ANALYZE')
+    db.conn.commit()
+
+
+def timed(fn, reads):
+    """Median milliseconds of `reads` calls"""
+    samples = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trainees', type=int, default=200)
+    parser.add_argument('--reads', type=int, default=50)
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    today = date.today().isoformat()
+    with scratch_schema(SCHEMA, args.keep) as connect:
+        setup(args.trainees, today)
+        dashboard.dedicated_connection = connect
+        try:
+            db = get_db()
+            calculator = CPFCCalculator()
+            dashboards = TrainerDashboards(max_trainees=args.trainees)
+            trainee_ids = [row['id'] for row in db.get_trainees(TRAINER_ID)]
+            recompute = timed(lambda: [calculator.get_remaining_cpfc(t, today) for t in trainee_ids], args.reads)
+            load = timed(lambda: TrainerDashboards(max_trainees=args.trainees).page(TRAINER_ID, today), args.reads)
+            uncached = TrainerDashboards(max_trainees=1)
+            uncached.uncached.add(TRAINER_ID)
+            last = timed(lambda: uncached.page(TRAINER_ID, today, before=trainee_ids[-1] + 1), args.reads)
+            dashboards.page(TRAINER_ID, today)
+
+            # Patches as trainees keep logging
+            for trainee_id in trainee_ids:
+                snack = {'user_id': trainee_id, 'meal_type': 'Snack', 'date': today,
+                         'calories': 200, 'protein': 10, 'fat': 8, 'carbs': 20}
+                db.save_meal(snack)
+                dashboards.add_intake(trainee_id, today, snack)
+            cached = timed(lambda: dashboards.page(TRAINER_ID, today, after=trainee_ids[-Config.TRAINEES_PAGE_SIZE]),
+                           args.reads)
+            drifted = asyncio.run(dashboards.check())
+
+            print(f"/stats for {len(trainee_ids)} trainees, median of {args.reads} reads")
+            print(f"{'path':<28} {'queries':>8} {'ms':>9}")
+            print(f"{'recompute per trainee':<28} {len(trainee_ids) * 3:>8} {recompute:>9.2f}")
+            print(f"{'dashboard query (miss)':<28} {1:>8} {load:>9.2f}")
+            print(f"{'cached dashboard page (hit)':<28} {0:>8} {cached:>9.3f}")
+            print(f"{'keyset page (uncached)':<28} {1:>8} {last:>9.2f}")
+            print(f"Drifted after {len(trainee_ids)} patches: {drifted}")
+        finally:
+            dashboard.dedicated_connection = dedicated_connection
+
+
+if __name__ == '__main__':
+    main()
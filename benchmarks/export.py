@@ -0,0 +1,112 @@
+"""
+History export throughput and memory on a million-row fixture.
+
+Needs a real PostgreSQL at DATABASE_URL. A scratch schema (dropped
+afterwards unless --keep) gets one user with --rows meals, meal items and
+drinks and one with a tenth of that. Each is exported through the
+streaming exporter (server-side cursor, gzip) as CSV and JSONL; peak
+Python memory is measured in a separate traced run and compared with
+fetching the whole history in one client-side query.
+
+Run from the repository root:
+    python -m benchmarks.export [--rows 1000000] [--itersize 2000]
+"""
+import argparse
+import gzip
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import scratch_schema
+from database import get_db
+from exporter import export_history, export_query
+
+SCHEMA = 'benchmark_export'
+LARGE_USER, SMALL_USER = 1, 2
+
+# A quarter meals with two items each, a quarter drinks, spread over three years
+GENERATE = '''
+    INSERT INTO meals (id, user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs, created_at)
+    SELECT n, %(user_id)s, 'Lunch', t::date, 300 + n %% 500, 20, 10, 40, t
+    FROM generate_series(%(offset)s + 1, %(offset)s + %(meals)s) n,
+         LATERAL (SELECT now() - make_interval(secs => (n - %(offset)s) * 94608000.0 / %(meals)s) AS t) s;
+
+    INSERT INTO meal_items (meal_id, name, weight)
+    SELECT n, (ARRAY['Rice', 'Chicken breast', 'Egg', 'Carrot'])[1 + (n + k) %% 4], 50 + k * 25
+    FROM generate_series(%(offset)s + 1, %(offset)s + %(meals)s) n, generate_series(1, 2) k;
+
+    INSERT INTO drinks (user_id, drink_name, volume_ml, calories, protein, fat, carbs, date, created_at)
+    SELECT %(user_id)s, 'Cola', 330, 139, 0, 0, 35, t::date, t
+    FROM generate_series(1, %(meals)s) n,
+         LATERAL (SELECT now() - make_interval(secs => n * 94608000.0 / %(meals)s + 1800) AS t) s;
+'''
+
+
+def setup(rows):
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(GENERATE, {'user_id': LARGE_USER, 'offset': 0, 'meals': rows // 4})
+        cur.execute(GENERATE, {'user_id': SMALL_USER, 'offset': rows, 'meals': rows // 40})
+        cur.execute('ANALYZE')
+    db.conn.commit()
+
+
+def traced(func):
+    """Peak traced Python memory (MB) of func()"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def fetch_all(conn, user_id):
+    """The naive alternative: one client-side query holding every row"""
+    with conn.cursor() as cur:
+        cur.execute(export_query(user_id), {'user_id': user_id})
+        return len(cur.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='rows for the large user')
+    parser.add_argument('--itersize', type=int, default=2000)
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with scratch_schema(SCHEMA, args.keep) as connect:
+        start = time.perf_counter()
+        setup(args.rows)
+        print(f"Fixture: {args.rows:,} + {args.rows // 10:,} rows in {time.perf_counter() - start:.1f}s")
+        conn = connect(readonly=True)
+
+        try:
+            print(f"{'user':<8} {'format':<6} {'rows':>9} {'seconds':>8} {'rows/s':>9} {'gzip MB':>8} "
+                  f"{'ratio':>6} {'peak MB':>8}")
+            for user_id, label in ((SMALL_USER, 'small'), (LARGE_USER, 'large')):
+                for fmt in ('csv', 'jsonl'):
+                    with tempfile.TemporaryFile() as output:
+                        start = time.perf_counter()
+                        rows = export_history(output, user_id, fmt, args.itersize, conn=conn)
+                        elapsed = time.perf_counter() - start
+                        size = output.tell()
+                        output.seek(0)
+                        with gzip.GzipFile(fileobj=output) as archive:
+                            raw = sum(len(block) for block in iter(lambda: archive.read(1 << 20), b''))
+                    with open(os.devnull, 'wb') as sink:
+                        peak = traced(lambda: export_history(sink, user_id, fmt, args.itersize, conn=conn))
+                    print(f"{label:<8} {fmt:<6} {rows:>9,} {elapsed:>8.2f} {rows / elapsed:>9,.0f} "
+                          f"{size / 2 ** 20:>8.1f} {raw / size:>5.1f}x {peak:>8.1f}")
+                peak = traced(lambda: fetch_all(conn, user_id))
+                conn.rollback()
+                print(f"{label:<8} {'fetchall (no streaming)':<44} {peak:>8.1f}")
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+"""
+In-process fakes for driving FithubBot handlers without Telegram,
+Postgres or Google Vision: synthetic updates, a Bot with simulated flood
+control, an in-memory Database and a Vision client returning canned
+detections. Benchmarks that do need PostgreSQL get a scratch schema from
+scratch_schema().
+"""
+import asyncio
+import contextvars
+import io
+import itertools
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+
+# Command currently being driven, used to attribute DB queries
+current_command = contextvars.ContextVar('current_command', default=None)
+
+
+class QueryCounter:
+    """Counts SQL statements per command"""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, statements=1):
+        command = current_command.get()
+        if command is not None:
+            self.counts[command] += statements
+
+
+# --- Telegram ---------------------------------------------------------------
+
+class FakeFile:
+    def __init__(self, content, latency):
+        self.content = content
+        self.latency = latency
+
+    async def download_as_bytearray(self):
+        await asyncio.sleep(self.latency)
+        return bytearray(self.content)
+
+
+class FakePhotoSize:
+    def __init__(self, content, latency):
+        self._file = FakeFile(content, latency)
+
+    async def get_file(self):
+        return self._file
+
+
+class FakeMessage:
+    """Message stand-in recording replies instead of sending them"""
+
+    # Simulated Bot API round trip per reply (s)
+    latency = 0.0
+
+    _ids = itertools.count(1)
+
+    def __init__(self, text=None, photo=None):
+        self.message_id = next(self._ids)
+        self.text = text
+        self.photo = photo or []
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.replies.append(text)
+        return SimpleNamespace(message_id=next(self._ids))
+
+    async def reply_html(self, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.replies.append(text)
+        return SimpleNamespace(message_id=next(self._ids))
+
+    async def reply_photo(self, photo, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.replies.append(photo)
+        # Uploads get a new file_id, re-sent file_ids come back unchanged
+        file_id = photo if isinstance(photo, str) else f'photo-{len(self.replies)}-{len(photo)}'
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+class FakeBot:
+    """
+    Bot sending through a rate limiter the way ExtBot does, with a simulated
+    Bot API round trip and, optionally, Telegram's flood control: more than
+    `flood_limit` requests within a second get a 429 RetryAfter.
+    """
+
+    def __init__(self, rate_limiter=None, latency=0.05, flood_limit=None):
+        self.rate_limiter = rate_limiter
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.sent = []        # (monotonic time, chat_id, rate_limit_args)
+        self.floods = 0
+        self._window = deque()
+
+    async def send_message(self, chat_id, text, rate_limit_args=None, **kwargs):
+        data = {'chat_id': chat_id, 'text': text}
+        if self.rate_limiter is None:
+            return await self._post('sendMessage', data, rate_limit_args)
+        return await self.rate_limiter.process_request(
+            self._post, ('sendMessage', data, rate_limit_args), {}, 'sendMessage', data, rate_limit_args
+        )
+
+    async def send_photo(self, chat_id, photo, caption=None, rate_limit_args=None, **kwargs):
+        data = {'chat_id': chat_id, 'photo': photo, 'caption': caption}
+        if self.rate_limiter is None:
+            return await self._post('sendPhoto', data, rate_limit_args)
+        return await self.rate_limiter.process_request(
+            self._post, ('sendPhoto', data, rate_limit_args), {}, 'sendPhoto', data, rate_limit_args
+        )
+
+    async def _post(self, endpoint, data, rate_limit_args):
+        now = time.monotonic()
+        if self.flood_limit:
+            while self._window and self._window[0] <= now - 1:
+                self._window.popleft()
+            if len(self._window) >= self.flood_limit:
+                self.floods += 1
+                raise RetryAfter(1)
+            self._window.append(now)
+        self.sent.append((now, data['chat_id'], rate_limit_args))
+        await asyncio.sleep(self.latency)
+        return True
+
+
+class FakeCallbackQuery:
+    """Press of an inline button under `message`"""
+
+    def __init__(self, user, data, message):
+        self.from_user = user
+        self.data = data
+        self.message = message
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+    async def edit_message_reply_markup(self, reply_markup=None, **kwargs):
+        if FakeMessage.latency:
+            await asyncio.sleep(FakeMessage.latency)
+
+
+class FakeUpdate:
+    _ids = itertools.count(1)
+
+    def __init__(self, user, message, callback_query=None):
+        self.update_id = next(self._ids)
+        self.effective_user = user
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_chat = SimpleNamespace(id=user.id)
+
+    @property
+    def effective_message(self):
+        return self.message or self.callback_query.message
+
+
+def make_user(user_id):
+    return SimpleNamespace(
+        id=user_id, username=f'user{user_id}', first_name=f'User{user_id}', last_name=None
+    )
+
+
+def text_update(user, text):
+    return FakeUpdate(user, FakeMessage(text=text))
+
+
+def photo_update(user, content, latency=0.0):
+    return FakeUpdate(user, FakeMessage(photo=[FakePhotoSize(content, latency)]))
+
+
+def callback_update(user, data, message_id=None):
+    """Press of a button sending `data` under the bot's message `message_id`"""
+    message = FakeMessage()
+    if message_id is not None:
+        message.message_id = message_id
+    return FakeUpdate(user, None, FakeCallbackQuery(user, data, message))
+
+
+def fake_context(args=()):
+    return SimpleNamespace(args=list(args), bot=None, application=None)
+
+
+def sample_jpeg(size=(1200, 900)):
+    """Small JPEG used as a photo payload"""
+    try:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (240, 240, 240)).save(buffer, format='JPEG')
+        return buffer.getvalue()
+    except ImportError:
+        return b'\xff\xd8\xff\xd9'
+
+
+# --- Vision -----------------------------------------------------------------
+
+def _box(x0, y0, x1, y1):
+    vertices = [SimpleNamespace(x=x, y=y) for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))]
+    return SimpleNamespace(normalized_vertices=vertices)
+
+
+class FakeVisionClient:
+    """Vision client with canned responses and simulated per-call latency"""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self, response):
+        self.calls += 1
+        time.sleep(self.latency)
+        return response
+
+    def object_localization(self, image):
+        objects = [
+            SimpleNamespace(name='Egg', score=0.9, bounding_poly=_box(0.25, 0.38, 0.38, 0.62)),
+            SimpleNamespace(name='Egg', score=0.88, bounding_poly=_box(0.46, 0.38, 0.59, 0.62)),
+            SimpleNamespace(name='Carrot', score=0.8, bounding_poly=_box(0.2, 0.7, 0.5, 0.78)),
+        ]
+        return self._call(SimpleNamespace(localized_object_annotations=objects))
+
+    def label_detection(self, image):
+        labels = [SimpleNamespace(description='Food', score=0.95), SimpleNamespace(description='Orange', score=0.7)]
+        return self._call(SimpleNamespace(label_annotations=labels))
+
+    def web_detection(self, image):
+        entities = [SimpleNamespace(description='Boiled egg', score=0.8)]
+        return self._call(SimpleNamespace(web_detection=SimpleNamespace(web_entities=entities)))
+
+
+# --- Database ---------------------------------------------------------------
+
+@contextmanager
+def scratch_schema(name, keep=False):
+    """
+    A fresh schema with the bot's tables, set as the shared connection's
+    search_path and dropped on exit unless `keep`. Yields a replacement for
+    database.dedicated_connection whose connections use the schema too.
+    """
+    from database import dedicated_connection, get_db
+
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(f'DROP SCHEMA IF EXISTS {name} CASCADE')
+        cur.execute(f'CREATE SCHEMA {name}')
+        cur.execute(f'SET search_path TO {name}')
+    db.conn.commit()
+    db.init_tables()
+
+    def connect(readonly=False):
+        conn = dedicated_connection(readonly)
+        with conn.cursor() as cur:
+            cur.execute(f'SET search_path TO {name}')
+        conn.commit()
+        return conn
+
+    try:
+        yield connect
+    finally:
+        # A failed statement leaves the transaction aborted, which would hide its error behind the DROP's
+        db.conn.rollback()
+        if not keep:
+            with db.cursor() as cur:
+                cur.execute(f'DROP SCHEMA {name} CASCADE')
+            db.conn.commit()
+
+
+# Statements Database._update_rollups adds to every meal or drink write: the day, week and month
+ROLLUP_STATEMENTS = 3
+
+
+class FakeDatabase:
+    """
+    In-memory replacement for database.Database.
+
+    Every method counts the SQL statements the real method would execute.
+    """
+
+    def __init__(self, counter=None):
+        self.counter = counter or QueryCounter()
+        self.users = {}
+        self.meals = []
+        self.drinks = []
+        self.links = set()
+        self._ids = itertools.count(1)
+
+    def save_user(self, user_data):
+        self.counter.add()
+        row = self.users.setdefault(user_data['id'], {'id': user_data['id']})
+        row.update(user_data)
+        return True
+
+    def update_user_profile(self, user_id, profile_data):
+        self.counter.add()
+        self.users.setdefault(user_id, {'id': user_id}).update(profile_data)
+        return True
+
+    def get_user_profile(self, user_id):
+        self.counter.add()
+        row = self.users.get(user_id)
+        return dict(row) if row else None
+
+    def save_meal(self, meal_data):
+        self.counter.add((2 if meal_data.get('items') else 1) + ROLLUP_STATEMENTS)
+        meal_id = next(self._ids)
+        self.meals.append({
+            'id': meal_id,
+            'user_id': meal_data['user_id'],
+            'meal_type': meal_data['meal_type'],
+            'date': meal_data['date'],
+            'total_calories': meal_data['calories'],
+            'total_protein': meal_data['protein'],
+            'total_fat': meal_data['fat'],
+            'total_carbs': meal_data['carbs'],
+            'created_at': datetime.now()
+        })
+        return meal_id
+
+    def get_daily_intake(self, user_id, date):
+        self.counter.add(2)
+        meals = [m for m in self.meals if m['user_id'] == user_id and m['date'] == date]
+        drinks = [d for d in self.drinks if d['user_id'] == user_id and d['date'] == date]
+        return meals + drinks
+
+    def get_food_nutrition(self, food_name):
+        self.counter.add()
+        return None
+
+    def get_foods_nutrition(self, food_names):
+        self.counter.add()
+        return {}
+
+    def get_custom_drinks(self):
+        self.counter.add()
+        return []
+
+    def save_drink(self, drink_data):
+        self.counter.add(1 + ROLLUP_STATEMENTS)
+        self.drinks.append({'id': next(self._ids), **drink_data, 'created_at': datetime.now()})
+        return True
+
+    def relog_meal(self, user_id, source, source_id, date):
+        self.counter.add(1 + ROLLUP_STATEMENTS)
+        # Templates are not kept in memory; only earlier meals can be re-logged
+        source_meal = next((m for m in self.meals if source == 'meal' and m['id'] == source_id
+                            and m['user_id'] == user_id), None)
+        if source_meal is None:
+            return None
+        meal = {**source_meal, 'id': next(self._ids), 'date': date, 'created_at': datetime.now()}
+        self.meals.append(meal)
+        return {'id': meal['id'], 'meal_type': meal['meal_type'],
+                **{key: meal[f'total_{key}'] for key in ('calories', 'protein', 'fat', 'carbs')}}
+
+    def get_totals(self, period, user_id, start, end):
+        """Rollup rows derived from the stored meals and drinks, shaped like the real tables'"""
+        from config import Config
+        self.counter.add()
+        target = self.users.get(user_id, {}).get('daily_calories')
+        days = {}
+        for entry in self.meals + self.drinks:
+            if entry['user_id'] != user_id:
+                continue
+            day = entry['date'] if isinstance(entry['date'], date) else date.fromisoformat(entry['date'])
+            row = days.setdefault(day, {'user_id': user_id, 'start': day, 'calories': 0, 'protein': 0, 'fat': 0,
+                                        'carbs': 0, 'meals': 0, 'drinks': 0, 'target_calories': target})
+            for key in ('calories', 'protein', 'fat', 'carbs'):
+                row[key] += entry.get(f'total_{key}', entry.get(key)) or 0
+            row['meals' if 'meal_type' in entry else 'drinks'] += 1
+        if period == 'day':
+            return [days[day] for day in sorted(days) if start <= day <= end]
+
+        periods = {}
+        tolerance = Config.ADHERENCE_TOLERANCE
+        for day, row in sorted(days.items()):
+            first = day - timedelta(days=day.weekday()) if period == 'week' else day.replace(day=1)
+            total = periods.setdefault(first, {'user_id': user_id, 'start': first, 'calories': 0, 'protein': 0,
+                                               'fat': 0, 'carbs': 0, 'days_logged': 0, 'days_on_target': 0,
+                                               'target_calories': target})
+            for key in ('calories', 'protein', 'fat', 'carbs'):
+                total[key] += row[key]
+            total['days_logged'] += 1
+            if target and target * (1 - tolerance) <= row['calories'] <= target * (1 + tolerance):
+                total['days_on_target'] += 1
+        return [periods[first] for first in sorted(periods) if start <= first <= end]
+
+    def link_trainer_trainee(self, trainer_id, trainee_id):
+        self.counter.add(2)
+        self.links.add((trainer_id, trainee_id))
+        self.users.setdefault(trainee_id, {'id': trainee_id})['trainer_id'] = trainer_id
+        return True
+
+    def get_trainees(self, trainer_id):
+        self.counter.add()
+        return [dict(self.users[t]) for tr, t in sorted(self.links) if tr == trainer_id and t in self.users]
+
+    def get_trainee(self, trainer_id, trainee_id):
+        self.counter.add()
+        if (trainer_id, trainee_id) not in self.links or trainee_id not in self.users:
+            return None
+        user = self.users[trainee_id]
+        return {'id': trainee_id, 'first_name': user.get('first_name'), 'username': user.get('username')}
+
+    def get_trainee_page(self, trainer_id, date, after=None, before=None, limit=10):
+        self.counter.add()
+        trainee_ids = [t for tr, t in sorted(self.links) if tr == trainer_id and t in self.users]
+        page = [t for t in trainee_ids if (after is None or t > after) and (before is None or t < before)]
+        page = page[-limit:] if before is not None else page[:limit]
+        rows = []
+        for trainee_id in page:
+            user = self.users[trainee_id]
+            intake = [e for e in self.meals + self.drinks if e['user_id'] == trainee_id and e['date'] == date]
+            rows.append({
+                'id': trainee_id, 'first_name': user.get('first_name'), 'username': user.get('username'),
+                'target_calories': user.get('daily_calories'), 'total': len(trainee_ids),
+                **{key: sum(entry.get(f'total_{key}', entry.get(key)) or 0 for entry in intake)
+                   for key in ('calories', 'protein', 'fat', 'carbs')}
+            })
+        return rows
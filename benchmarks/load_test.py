@@ -0,0 +1,230 @@
+"""
+End-to-end load test driving synthetic Telegram sessions into FithubBot.
+
+Trainee sessions go through onboarding, /add_meal with manual input
+(and optionally a photo), /add_drink and /today, pressing menu buttons
+where the bot shows them; trainer sessions link recently onboarded
+trainees and run /stats. Sessions start at a target
+rate; every step is timed and its DB statements are counted.
+
+Run from the repository root:
+    python -m benchmarks.load_test --sessions 200 --rate 20
+    python -m benchmarks.load_test --dsn postgresql://localhost/fithub_bench --profile-queries
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.fakes import (
+    FakeDatabase, FakeVisionClient, QueryCounter, callback_update, current_command,
+    fake_context, make_user, photo_update, sample_jpeg, text_update
+)
+
+
+class CountingCursor:
+    """Cursor proxy counting executed statements"""
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter.add()
+        return self._cursor.execute(*args, **kwargs)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    """Connection proxy handing out counting cursors"""
+
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def build_bot(args, counter):
+    """Create FithubBot wired to a fake or local database and a fake Vision client"""
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+        os.environ.setdefault('DATABASE_SSLMODE', 'disable')
+        import database
+        db = database.get_db()
+        db.conn = CountingConnection(db.conn, counter)
+    else:
+        import database
+        database.set_db(FakeDatabase(counter))
+
+    from bot import FithubBot
+    from query_profiler import profiler
+    logging.getLogger().setLevel(logging.WARNING)
+    profiler.enabled = args.profile_queries
+
+    bot = FithubBot()
+    bot.vision.client = FakeVisionClient(args.vision_latency)
+    return bot
+
+
+class LoadTest:
+    def __init__(self, bot, args, counter):
+        self.bot = bot
+        self.args = args
+        self.counter = counter
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.trainees = []
+        self.photo = sample_jpeg()
+        self.next_user_id = random.randint(10 ** 9, 2 * 10 ** 9)
+
+    async def step(self, command, handler, update, context=None):
+        from query_profiler import profiler
+
+        token = current_command.set(command)
+        start = time.perf_counter()
+        try:
+            with profiler.scope(command):
+                await handler(update, context or fake_context())
+        finally:
+            self.latencies[command].append(time.perf_counter() - start)
+            current_command.reset(token)
+        if any('error' in reply.lower() for reply in update.effective_message.replies):
+            self.errors[command] += 1
+        if self.args.think:
+            await asyncio.sleep(random.expovariate(1 / self.args.think))
+
+    async def trainee_session(self):
+        bot = self.bot
+        self.next_user_id += 1
+        user = make_user(self.next_user_id)
+        say = lambda text: text_update(user, text)
+        # Buttons are pressed under the message that showed them
+        press = lambda command, data: self.step(command, bot.handle_menu_callback, callback_update(
+            user, data, bot.user_manager.get_prompt(user.id)))
+
+        await self.step('/start', bot.start, say('/start'))
+        await press('user_type', 'ut:trainee')
+        for command, text in (('height', '175'), ('weight', '70'), ('age', '25')):
+            await self.step(command, bot.handle_message, say(text))
+        await press('gender', 'gen:male')
+        await press('activity_level', 'act:medium')
+        await press('goal', 'goal:maintenance')
+
+        await self.step('/add_meal', bot.add_meal_command, say('/add_meal'))
+        await press('meal_type', 'meal:lunch')
+        await self.step('manual_input', bot.handle_message, say('Egg - 50\nRice - 150\nChicken - 120'))
+        await press('confirm_meal', 'yn:yes')
+
+        if random.random() < self.args.photo_share:
+            await self.step('/add_meal', bot.add_meal_command, say('/add_meal'))
+            # Typed labels still work in place of buttons
+            await self.step('meal_type', bot.handle_message, say('Breakfast'))
+            await self.step('photo', bot.handle_photo, photo_update(user, self.photo))
+            if bot.user_manager.get_user_state(user.id) == 'awaiting_reference_object':
+                await press('reference_object', 'ref:none')
+            await press('photo_confirm', 'yn:yes')
+            await press('confirm_meal', 'yn:yes')
+
+        await self.step('/add_drink', bot.add_drink_command, say('/add_drink'))
+        await self.step('drink_name', bot.handle_message, say('Cola'))
+        await press('drink_volume', 'vol:330')
+        await self.step('/today', bot.today_command, say('/today'))
+        self.trainees.append(user.id)
+
+    async def trainer_session(self):
+        bot = self.bot
+        self.next_user_id += 1
+        user = make_user(self.next_user_id)
+        say = lambda text: text_update(user, text)
+
+        await self.step('/start', bot.start, say('/start'))
+        await self.step('user_type', bot.handle_menu_callback, callback_update(user, 'ut:trainer'))
+        for trainee_id in self.trainees[-self.args.trainees_per_trainer:]:
+            await self.step('/add_trainee', bot.add_trainee_command, say('/add_trainee'))
+            await self.step('trainee_id', bot.handle_message, say(str(trainee_id)))
+        for _ in range(3):
+            await self.step('/stats', bot.stats_command, say('/stats'))
+
+    async def run(self):
+        tasks = []
+        interval = 1 / self.args.rate
+        start = time.perf_counter()
+        for i in range(self.args.sessions):
+            is_trainer = self.args.trainer_every and i % self.args.trainer_every == self.args.trainer_every - 1
+            session = self.trainer_session() if is_trainer else self.trainee_session()
+            tasks.append(asyncio.create_task(session))
+            # Open loop: schedule by wall clock, not by session completion
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        failures = [r for r in results if isinstance(r, Exception)]
+        return elapsed, failures
+
+    def report(self, elapsed, failures):
+        steps = sum(len(v) for v in self.latencies.values())
+        print(f"Sessions: {self.args.sessions} ({len(failures)} failed), steps: {steps}, wall: {elapsed:.2f}s")
+        print(f"Throughput: {steps / elapsed:.1f} updates/s, {self.args.sessions / elapsed:.1f} sessions/s")
+        print()
+        print(f"{'command':<18} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'db q/cmd':>9} {'errors':>7}")
+        for command, values in sorted(self.latencies.items(), key=lambda kv: -sum(kv[1])):
+            values = sorted(values)
+            pct = lambda p: values[min(len(values) - 1, int(p * len(values)))] * 1000
+            queries = self.counter.counts[command] / len(values)
+            print(f"{command:<18} {len(values):>6} {pct(0.5):>8.2f} {pct(0.95):>8.2f} {pct(0.99):>8.2f} "
+                  f"{values[-1] * 1000:>8.2f} {queries:>9.1f} {self.errors[command]:>7}")
+        for failure in failures[:5]:
+            print(f"Session failed: {failure!r}")
+
+        from query_profiler import profiler
+        if profiler.enabled:
+            print()
+            print(profiler.report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=200, help='sessions to start')
+    parser.add_argument('--rate', type=float, default=20.0, help='sessions started per second')
+    parser.add_argument('--think', type=float, default=0.0, help='mean think time between steps (s)')
+    parser.add_argument('--photo-share', type=float, default=0.3, help='share of sessions also logging a photo meal')
+    parser.add_argument('--trainer-every', type=int, default=10, help='every Nth session is a trainer')
+    parser.add_argument('--trainees-per-trainer', type=int, default=10)
+    parser.add_argument('--vision-latency', type=float, default=0.05, help='fake Vision latency per call (s)')
+    parser.add_argument('--dsn', help='local Postgres DSN; an in-process fake DB is used when omitted')
+    parser.add_argument('--profile-queries', action='store_true',
+                        help='print the per-update SQL profile (needs --dsn)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    counter = QueryCounter()
+    bot = build_bot(args, counter)
+    load_test = LoadTest(bot, args, counter)
+    elapsed, failures = asyncio.run(load_test.run())
+    load_test.report(elapsed, failures)
+
+
+if __name__ == '__main__':
+    main()
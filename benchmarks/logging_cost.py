@@ -0,0 +1,101 @@
+"""
+Per-update logging cost at INFO level, before and after lazy logging.
+
+Replays the log calls one /add_meal confirmation used to make (eager
+f-strings with full profile rows and per-item nutrition) against the
+current lazy, structured calls, with output going to os.devnull.
+
+Run from the repository root:
+    python -m benchmarks.logging_cost [--updates 20000]
+"""
+import argparse
+import logging
+import os
+import time
+
+from logging_utils import JsonFormatter, RedactionFilter, SamplingFilter, TEXT_FORMAT
+
+PROFILE = {
+    'id': 123456789, 'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe',
+    'user_type': 'trainee', 'height': 180.0, 'weight': 80.0, 'age': 30, 'gender': 'male',
+    'activity_level': 'medium', 'goal': 'maintenance', 'daily_calories': 2600.0, 'trainer_id': None,
+}
+ITEMS = [('egg', 50), ('carrot', 60), ('orange', 130)]
+NUTRITION = {'calories': 78, 'protein': 6.5, 'fat': 5.5, 'carbs': 0.6}
+
+
+def update_before(logger):
+    user_id = PROFILE['id']
+    text = 'Egg - 50\nCarrot - 60\nOrange - 130'
+    logger.info(f"User {user_id} in state awaiting_manual_input sent: {text}")
+    logger.info(f"Profile fetched for user {user_id}: {PROFILE}")
+    for name, weight in ITEMS:
+        logger.info(f"Nutrition for {name} ({weight}g): {NUTRITION}")
+        logger.info(f"Food: {name} ({weight}g) - Cal: {NUTRITION['calories']}, P: {NUTRITION['protein']}, "
+                    f"F: {NUTRITION['fat']}, C: {NUTRITION['carbs']}")
+    logger.info(f"Meal totals: {NUTRITION}")
+    logger.info(f"Meal saved with ID 42 for user {user_id}")
+    logger.info(f"Meal saved for user {user_id}: meal_id=42")
+    logger.info(f"Profile fetched for user {user_id}: {PROFILE}")
+    logger.info(f"Daily intake for user {user_id} on 2026-10-19: 4 items")
+    logger.info(f"Daily totals for user {user_id} on 2026-10-19: 1200 cal, 60g protein, 40g fat, 150g carbs from 4 items")
+
+
+def update_after(logger):
+    user_id = PROFILE['id']
+    text = 'Egg - 50\nCarrot - 60\nOrange - 130'
+    logger.debug("User %s in state %s sent %d chars", user_id, 'awaiting_manual_input', len(text))
+    logger.debug("Profile fetched for user %s (found: %s)", user_id, True)
+    for name, weight in ITEMS:
+        logger.debug("Nutrition for %s (%sg): %s", name, weight, NUTRITION)
+        logger.debug("Food: %s (%sg) - %s", name, weight, NUTRITION)
+    logger.debug("Meal totals for %d items: %s", len(ITEMS), NUTRITION)
+    logger.info("Meal saved with ID %s for user %s", 42, user_id, extra={'user_id': user_id, 'meal_id': 42})
+    logger.debug("Meal saved for user %s: meal_id=%s", user_id, 42)
+    logger.debug("Profile fetched for user %s (found: %s)", user_id, True)
+    logger.debug("Daily intake for user %s on %s: %d items", user_id, '2026-10-19', 4)
+    logger.debug("Daily totals for user %s on %s: %.0f cal from %d items", user_id, '2026-10-19', 1200, 4)
+
+
+def make_logger(name, formatter, filters=()):
+    logger = logging.getLogger(f"bench.{name}")
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(formatter)
+    for log_filter in filters:
+        handler.addFilter(log_filter)
+    logger.addHandler(handler)
+    return logger
+
+
+def measure(func, logger, updates):
+    start = time.perf_counter()
+    for _ in range(updates):
+        func(logger)
+    return (time.perf_counter() - start) / updates * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    text = logging.Formatter(TEXT_FORMAT)
+    cases = [
+        ('before: eager f-strings, text', update_before, make_logger('before', text)),
+        ('after: lazy, text', update_after, make_logger('after_text', text)),
+        ('after: lazy, json + redaction', update_after,
+         make_logger('after_json', JsonFormatter(), [RedactionFilter()])),
+        ('after: lazy, json + redaction + rate limit', update_after,
+         make_logger('after_limited', JsonFormatter(), [SamplingFilter(rate_limit=10), RedactionFilter()])),
+    ]
+
+    print(f"{'case':<46} {'us/update':>10}")
+    for label, func, logger in cases:
+        print(f"{label:<46} {measure(func, logger, args.updates):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
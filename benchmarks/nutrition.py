@@ -0,0 +1,145 @@
+"""
+Micro-benchmarks for per-meal nutrition computation.
+
+Compares the previous calculator code path (food table rebuilt on every
+call, linear partial-match scan, one DB lookup per item, uncached daily
+targets) with the shared nutrition engine, and a per-item Python loop
+with per-item rounding against the engine's gather + dot product, for
+single meals of 1-50 items and for bulk re-scoring of historical meals.
+DB lookups are counted, not executed.
+
+Run from the repository root:
+    python -m benchmarks.nutrition [--repeat 2000] [--history 100000]
+"""
+import argparse
+import logging
+import random
+import time
+
+import nutrition
+
+MEAL_NAMES = ['Egg', 'Rice', 'Chicken breast', 'Carrot', 'курица', 'картофель фри', 'Oatmeal with milk',
+              'Grilled salmon', 'apple', 'Greek yogurt', 'bread', 'Unknown dish']
+
+
+class CountingDB:
+    """Stand-in database with no custom foods, counting round trips"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def get_food_nutrition(self, food_name):
+        self.queries += 1
+        return None
+
+    def get_foods_nutrition(self, food_names):
+        self.queries += 1
+        return {}
+
+
+def legacy_table():
+    """The per-call dict the calculators used to rebuild"""
+    table = {'default': {'calories': 150, 'protein': 8, 'fat': 5, 'carbs': 15}}
+    for name, calories, protein, fat, carbs, aliases in nutrition.FOODS:
+        for alias in (name,) + aliases:
+            table[alias] = {'calories': calories, 'protein': protein, 'fat': fat, 'carbs': carbs}
+    return table
+
+
+def legacy_meal(food_items, db):
+    totals = dict.fromkeys(nutrition.NUTRIENTS, 0)
+    for item in food_items:
+        db.get_food_nutrition(item['name'])
+        table = legacy_table()
+        key = item['name'].lower().strip()
+        selected = table.get(key)
+        if selected is None:
+            selected = table['default']
+            for alias in table:
+                if alias in key or key in alias:
+                    selected = table[alias]
+                    break
+        ratio = item['weight'] / 100
+        totals['calories'] += round(selected['calories'] * ratio)
+        for nutrient in ('protein', 'fat', 'carbs'):
+            totals[nutrient] += round(selected[nutrient] * ratio, 1)
+    return totals
+
+
+def per_item_meal(food_items, table=nutrition.FOOD_TABLE):
+    """Scalar loop over cached table lookups, rounding every item"""
+    totals = dict.fromkeys(nutrition.NUTRIENTS, 0)
+    for item in food_items:
+        calories, protein, fat, carbs = table.per_100g(table.lookup(item['name']))
+        ratio = item['weight'] / 100
+        totals['calories'] += round(calories * ratio)
+        totals['protein'] += round(protein * ratio, 1)
+        totals['fat'] += round(fat * ratio, 1)
+        totals['carbs'] += round(carbs * ratio, 1)
+    return totals
+
+
+def random_meal(size):
+    return [{'name': random.choice(MEAL_NAMES), 'weight': random.uniform(20, 300)} for _ in range(size)]
+
+
+def legacy_targets(weight, height, age, gender, activity_level, goal):
+    nutrition._daily_targets.cache_clear()
+    return nutrition.daily_targets(weight, height, age, gender, activity_level, goal)
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=100000, help='historical meals to re-score')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    random.seed(1)
+    nutrition.FOOD_TABLE.lookup_many(MEAL_NAMES)  # import NumPy and fill the lookup cache up front
+    print(f"{'case':<28} {'legacy us':>10} {'engine us':>10} {'speedup':>8} {'db legacy':>10} {'db engine':>10}")
+    for size in (1, 3, 10, 30):
+        meal = [{'name': random.choice(MEAL_NAMES), 'weight': random.randint(20, 300)} for _ in range(size)]
+        legacy_db, engine_db = CountingDB(), CountingDB()
+        legacy_us = timed(lambda: legacy_meal(meal, legacy_db), args.repeat)
+        engine_us = timed(lambda: nutrition.meal_totals(meal, engine_db), args.repeat)
+        print(f"{f'meal, {size} items':<28} {legacy_us:>10.1f} {engine_us:>10.1f} {legacy_us / engine_us:>7.1f}x "
+              f"{legacy_db.queries / args.repeat:>10.0f} {engine_db.queries / args.repeat:>10.0f}")
+
+    profile = (70, 175, 25, 'male', 'medium', 'maintenance')
+    legacy_us = timed(lambda: legacy_targets(*profile), args.repeat)
+    engine_us = timed(lambda: nutrition.daily_targets(*profile), args.repeat)
+    print(f"{'daily targets':<28} {legacy_us:>10.1f} {engine_us:>10.1f} {legacy_us / engine_us:>7.1f}x")
+
+    print()
+    print(f"{'meal size':<28} {'loop us':>10} {'vector us':>10} {'speedup':>8} {'kcal drift':>10}")
+    for size in (1, 5, 10, 25, 50):
+        meal = random_meal(size)
+        loop_us = timed(lambda: per_item_meal(meal), args.repeat)
+        vector_us = timed(lambda: nutrition.meal_vector(meal), args.repeat)
+        # Error from rounding each item instead of only the final total
+        drift = abs(per_item_meal(meal)['calories'] - nutrition.meal_vector(meal)[0])
+        print(f"{f'{size} items':<28} {loop_us:>10.1f} {vector_us:>10.1f} {loop_us / vector_us:>7.1f}x {drift:>10.2f}")
+
+    history = [random_meal(random.randint(1, 8)) for _ in range(args.history)]
+    start = time.perf_counter()
+    for meal in history:
+        per_item_meal(meal)
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    nutrition.score_meals(history)
+    bulk_s = time.perf_counter() - start
+    print()
+    print(f"Re-scoring {len(history)} historical meals: loop {loop_s:.2f}s, score_meals {bulk_s:.2f}s "
+          f"({loop_s / bulk_s:.1f}x, {len(history) / bulk_s:,.0f} meals/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Outbox under a bulk send: reply latency, throughput and 429s.
+
+A fake bot with Telegram-like flood control (--flood-limit requests per
+second, then 429 RetryAfter) receives a bulk send of --messages messages
+(one in a hundred to the same few chats), handed over BULK_CHUNK at a
+time like reminders do, while interactive replies arrive every
+--reply-interval seconds. Without a rate limiter the bulk send trips the
+flood control and replies queue behind it; through the outbox bulk
+traffic stays under the limit and replies go first.
+
+Run from the repository root:
+    python -m benchmarks.outbox [--messages 1500] [--flood-limit 30]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.fakes import FakeBot
+from config import Config
+from outbox import BULK, BULK_CHUNK, Outbox
+from reminders import send_bulk
+
+
+async def run(bot, messages, reply_interval):
+    """Bulk send with replies arriving meanwhile; returns (seconds, reply waits)"""
+    waits = []
+    done = asyncio.Event()
+
+    async def replies():
+        chat_id = -1
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                await bot.send_message(chat_id, 'reply')
+                waits.append(time.perf_counter() - start - bot.latency)
+            except Exception:
+                waits.append(float('inf'))
+            chat_id = -1 if chat_id < -50 else chat_id - 1
+            await asyncio.sleep(reply_interval)
+
+    task = asyncio.create_task(replies())
+    start = time.perf_counter()
+    results = await send_bulk(bot, messages)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, waits, results
+
+
+def busiest_second(sent):
+    """Most requests sent within any one-second window"""
+    times = sorted(t for t, _, _ in sent)
+    best, j = 0, 0
+    for i, t in enumerate(times):
+        while times[j] <= t - 1:
+            j += 1
+        best = max(best, i - j + 1)
+    return best
+
+
+def closest_bulk_gap(sent):
+    """Shortest time between two bulk messages to the same chat"""
+    last, gap = {}, float('inf')
+    for t, chat_id, lane in sorted(sent, key=lambda s: s[0]):
+        if lane == BULK:
+            if chat_id in last:
+                gap = min(gap, t - last[chat_id])
+            last[chat_id] = t
+    return gap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1500)
+    parser.add_argument('--flood-limit', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=Config.TELEGRAM_MAX_RPS, help='outbox requests per second')
+    parser.add_argument('--reply-interval', type=float, default=0.2)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated Bot API round trip (s)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    random.seed(1)
+    chats = [random.choice(range(1, 6)) if n % 100 == 0 else 1000 + n for n in range(args.messages)]
+    messages = [(chat_id, 'nudge') for chat_id in chats]
+    print(f"{args.messages} bulk messages, {BULK_CHUNK} in flight, flood limit {args.flood_limit}/s")
+    print(f"{'limiter':<10} {'seconds':>8} {'sent':>6} {'failed':>7} {'429s':>5} {'busiest s':>10} "
+          f"{'chat gap s':>11} {'reply p50 ms':>13} {'reply max ms':>13}")
+    for label, limiter in (('none', None), ('outbox', Outbox(rate=args.rate))):
+        bot = FakeBot(limiter, args.latency, args.flood_limit)
+        elapsed, waits, results = asyncio.run(run(bot, messages, args.reply_interval))
+        answered = [w for w in waits if w != float('inf')]
+        counts = defaultdict(int)
+        for result in results:
+            counts[result] += 1
+        print(f"{label:<10} {elapsed:>8.1f} {counts['sent']:>6} {counts['failed']:>7} {bot.floods:>5} "
+              f"{busiest_second(bot.sent):>10} {closest_bulk_gap(bot.sent):>11.2f} "
+              f"{statistics.median(answered) * 1000 if answered else 0:>13.1f} "
+              f"{max(waits, default=0) * 1000:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Accuracy/latency benchmark for portion estimation.
+
+Compares the geometry-based PortionEstimator against the previous
+bounding-box bucket heuristic on the scenes in fixtures/portion_scenes.json.
+
+Run from the repository root:
+    python -m benchmarks.portion_estimation [--repeat 2000]
+"""
+import argparse
+import json
+import os
+import time
+
+from portion_estimator import PortionEstimator, STANDARD_PORTIONS
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'portion_scenes.json')
+
+
+def legacy_estimate(scene):
+    """Previous heuristic: one instance per food, four area buckets"""
+    boxes = {}
+    for detection in scene['detections']:
+        food = detection['food']
+        if food and food not in boxes:
+            xs = [p[0] for p in detection['polygon']]
+            ys = [p[1] for p in detection['polygon']]
+            boxes[food] = (max(xs) - min(xs)) * (max(ys) - min(ys))
+
+    weights = {}
+    for item in scene['food_items']:
+        food = item['name'].lower()
+        base = STANDARD_PORTIONS.get(food, 100)
+        area = boxes.get(food)
+        if area is None:
+            multiplier = 1
+        elif area < 0.03:
+            multiplier = 0.5
+        elif area < 0.08:
+            multiplier = 1.0
+        elif area < 0.15:
+            multiplier = 1.5
+        else:
+            multiplier = 2.0
+        weights[food] = max(20, min(500, int(base * multiplier)))
+    return weights
+
+
+def geometry_estimate(estimator, scene):
+    result = estimator.estimate(
+        scene['food_items'], scene['detections'], tuple(scene['image_size']), scene['reference']
+    )
+    return {item['name'].lower(): item['estimated_weight'] for item in result['items']}
+
+
+def percentage_errors(estimates, truth):
+    return [abs(estimates.get(food, 0) - grams) / grams * 100 for food, grams in truth.items()]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000, help='timing iterations per scene')
+    args = parser.parse_args()
+
+    with open(FIXTURES) as f:
+        scenes = json.load(f)
+
+    estimator = PortionEstimator()
+    legacy_errors, geometry_errors = [], []
+    legacy_us, geometry_us = 0.0, 0.0
+
+    print(f"{'scene':<28} {'legacy MAPE':>12} {'geometry MAPE':>14} {'legacy us':>10} {'geometry us':>12}")
+    for scene in scenes:
+        legacy = percentage_errors(legacy_estimate(scene), scene['truth'])
+        geometry = percentage_errors(geometry_estimate(estimator, scene), scene['truth'])
+        legacy_errors += legacy
+        geometry_errors += geometry
+
+        l_us = timed(lambda: legacy_estimate(scene), args.repeat)
+        g_us = timed(lambda: geometry_estimate(estimator, scene), args.repeat)
+        legacy_us += l_us
+        geometry_us += g_us
+
+        print(f"{scene['name']:<28} {sum(legacy) / len(legacy):>11.1f}% {sum(geometry) / len(geometry):>13.1f}% "
+              f"{l_us:>10.1f} {g_us:>12.1f}")
+
+    print()
+    print(f"Overall MAPE: legacy {sum(legacy_errors) / len(legacy_errors):.1f}%, "
+          f"geometry {sum(geometry_errors) / len(geometry_errors):.1f}%")
+    print(f"Mean latency per scene: legacy {legacy_us / len(scenes):.1f} us, "
+          f"geometry {geometry_us / len(scenes):.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Reminder eligibility and sending at 100k users.
+
+Needs a real PostgreSQL at DATABASE_URL. A scratch schema (dropped
+afterwards unless --keep) gets --users users: most logged something in
+the last week, some of them today, some had lunch. Each nudge's eligible
+users are selected with the scheduler's single query, and, for
+comparison, with one query per user on a sample. Paced sending is then
+run through the outbox against a fake bot with a simulated Bot API
+round trip.
+
+Run from the repository root:
+    python -m benchmarks.reminders [--users 100000] [--send 500]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date
+
+from benchmarks.fakes import FakeBot, scratch_schema
+from config import Config
+from database import get_db
+from outbox import Outbox
+from reminders import ELIGIBLE, NUDGES, eligibility_params, eligible_users, format_nudge, send_bulk
+
+SCHEMA = 'benchmark_reminders'
+
+GENERATE = '''
+    INSERT INTO users (id, first_name, user_type, daily_calories)
+    SELECT u, 'User ' || u, 'trainee', 1800 + (u %% 7) * 100
+    FROM generate_series(1, %(users)s) u;
+
+    -- 80%% active during the last week, half of them logged today
+    INSERT INTO daily_totals (user_id, date, calories, protein, fat, carbs, meals, drinks, target_calories)
+    SELECT u, %(today)s::date - d, 1500, 40 + (u %% 9) * 10, 50, 200, 3, 1, 2000
+    FROM generate_series(1, %(users)s) u, generate_series(0, 6) d
+    WHERE u %% 5 <> 0 AND (d > 0 OR u %% 2 = 0);
+
+    INSERT INTO meals (user_id, meal_type, date, total_calories)
+    SELECT u, 'lunch', %(today)s, 600
+    FROM generate_series(1, %(users)s) u
+    WHERE u %% 5 <> 0 AND u %% 4 = 0;
+'''
+
+
+def setup(users, today):
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(GENERATE, {'users': users, 'today': today})
+        cur.execute('ANALYZE')
+    db.conn.commit()
+
+
+def per_user(conn, nudge, today, user_ids):
+    """The naive alternative: the same check run for one user at a time"""
+    query = ELIGIBLE.format(condition=NUDGES[nudge][0]) + ' AND u.id = %(user_id)s'
+    params = eligibility_params(today)
+    with conn.cursor() as cur:
+        for user_id in user_ids:
+            cur.execute(query, dict(params, user_id=user_id))
+            cur.fetchall()
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--sample', type=int, default=2000, help='users checked one by one')
+    parser.add_argument('--send', type=int, default=500, help='messages sent through the fake bot')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated Bot API round trip (s)')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    today = date.today()
+    with scratch_schema(SCHEMA, args.keep) as connect:
+        start = time.perf_counter()
+        setup(args.users, today)
+        print(f"Fixture: {args.users:,} users in {time.perf_counter() - start:.1f}s")
+        conn = connect(readonly=True)
+
+        try:
+            print(f"{'nudge':<9} {'eligible':>9} {'one query ms':>13} {'per user (est.) ms':>19}")
+            rows = {}
+            for nudge in NUDGES:
+                eligible_users(nudge, today, conn)
+                start = time.perf_counter()
+                rows[nudge] = eligible_users(nudge, today, conn)
+                query = time.perf_counter() - start
+                start = time.perf_counter()
+                per_user(conn, nudge, today, range(1, args.sample + 1))
+                naive = (time.perf_counter() - start) * args.users / args.sample
+                print(f"{nudge:<9} {len(rows[nudge]):>9,} {query * 1000:>13.1f} {naive * 1000:>19.0f}")
+
+            messages = [(row[0], format_nudge('protein', row)) for row in rows['protein'][:args.send]]
+            bot = FakeBot(Outbox(), args.latency)
+            start = time.perf_counter()
+            asyncio.run(send_bulk(bot, messages))
+            elapsed = time.perf_counter() - start
+            sent = len(bot.sent)
+            print(f"Sent {sent} messages through the outbox in {elapsed:.1f}s ({sent / elapsed:.1f}/s, "
+                  f"limit {Config.TELEGRAM_MAX_RPS:.0f}/s); all {len(rows['protein']):,} protein nudges "
+                  f"would take {len(rows['protein']) * elapsed / sent / 60:.0f} min")
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+/week and /month report latency at a year of history, rollups versus raw scans.
+
+Needs a real PostgreSQL at DATABASE_URL. Everything is created in a scratch
+schema (dropped afterwards unless --keep): users with three meals and one
+drink per day for --days days, inserted in date order as the bot writes
+them. The rollups are then backfilled (timed), and reports for random
+users are read from the rollups and, for comparison, summed from the meals
+and drinks rows the same report covers.
+
+Run from the repository root:
+    python -m benchmarks.reports [--users 10000] [--days 365] [--samples 500]
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from backfill_rollups import backfill
+from benchmarks.fakes import scratch_schema
+from database import get_db
+from reports import month_report, previous_month_start, week_report, week_start
+
+SCHEMA = 'benchmark_reports'
+FIRST_USER = 1000000
+
+GENERATE = '''
+    INSERT INTO users (id, first_name, user_type, daily_calories)
+    SELECT %(first)s + u, 'User ' || u, 'trainee', 1800 + (u %% 7) * 100
+    FROM generate_series(1, %(users)s) u;
+
+    INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs)
+    SELECT %(first)s + u, (ARRAY['Breakfast', 'Lunch', 'Dinner'])[m], %(today)s::date - d,
+           300 + random() * 600, 10 + random() * 40, 5 + random() * 30, 30 + random() * 80
+    FROM generate_series(1, %(users)s) u, generate_series(0, %(days)s - 1) d, generate_series(1, 3) m
+    ORDER BY d DESC, m, u;
+
+    INSERT INTO drinks (user_id, drink_name, volume_ml, calories, protein, fat, carbs, date)
+    SELECT %(first)s + u, 'cola', 330, 139, 0, 0, 35, %(today)s::date - d
+    FROM generate_series(1, %(users)s) u, generate_series(0, %(days)s - 1) d
+    ORDER BY d DESC, u;
+'''
+
+# What a report needs without rollups: per-day sums over the covered range
+RAW_DAYS = '''
+    SELECT date, SUM(calories), SUM(protein), SUM(fat), SUM(carbs), COUNT(*)
+    FROM (
+        SELECT date, total_calories AS calories, total_protein AS protein, total_fat AS fat, total_carbs AS carbs
+        FROM meals WHERE user_id = %(user_id)s AND date BETWEEN %(start)s AND %(end)s
+        UNION ALL
+        SELECT date, calories, protein, fat, carbs
+        FROM drinks WHERE user_id = %(user_id)s AND date BETWEEN %(start)s AND %(end)s
+    ) e
+    GROUP BY date
+    ORDER BY date
+'''
+
+
+def setup(db, users, days, today):
+    with db.cursor() as cur:
+        cur.execute(GENERATE, {'first': FIRST_USER, 'users': users, 'days': days, 'today': today})
+        cur.execute('ANALYZE')
+    db.conn.commit()
+
+
+def raw_report(db, user_id, start, end):
+    with db.cursor() as cur:
+        cur.execute(RAW_DAYS, {'user_id': user_id, 'start': start, 'end': end})
+        return cur.fetchall()
+
+
+def latency(func, user_ids):
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        func(user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--samples', type=int, default=500, help='users to request each report for')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    db = get_db()
+    today = date.today()
+    with scratch_schema(SCHEMA, args.keep):
+        start = time.perf_counter()
+        setup(db, args.users, args.days, today)
+        print(f"Generated {args.users} users x {args.days} days ({args.users * args.days * 4:,} meals and drinks) "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        counts = backfill(db)
+        print(f"Backfill: {', '.join(f'{table} {rows:,}' for table, rows in counts.items())} "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        random.seed(1)
+        user_ids = [FIRST_USER + random.randint(1, args.users) for _ in range(args.samples)]
+        cases = [
+            ('week', lambda user_id: week_report(db, user_id, today),
+             lambda user_id: raw_report(db, user_id, week_start(today) - timedelta(weeks=1), today)),
+            ('month', lambda user_id: month_report(db, user_id, today),
+             lambda user_id: raw_report(db, user_id, previous_month_start(today), today)),
+        ]
+        print()
+        print(f"{'report':<8} {'raw p50 ms':>11} {'raw p95 ms':>11} {'rollup p50':>11} {'rollup p95':>11} {'speedup':>8}")
+        for name, rollup, raw in cases:
+            latency(raw, user_ids[:20])  # warm the buffer cache for both paths
+            latency(rollup, user_ids[:20])
+            raw_p50, raw_p95 = latency(raw, user_ids)
+            rollup_p50, rollup_p95 = latency(rollup, user_ids)
+            print(f"{name:<8} {raw_p50:>11.2f} {raw_p95:>11.2f} {rollup_p50:>11.2f} {rollup_p95:>11.2f} "
+                  f"{raw_p50 / rollup_p50:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
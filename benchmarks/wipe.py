@@ -0,0 +1,164 @@
+"""
+/restart history wipe: one blocking transaction versus batched background deletes.
+
+Needs a real PostgreSQL at DATABASE_URL. A scratch schema (dropped
+afterwards unless --keep) gets one user with --rows entries (three
+quarters meals with two items each, a quarter drinks) and a neighbour
+with a tenth of that. Each run rebuilds the fixture, then wipes the large
+user while a ticker task measures how late the event loop wakes up:
+
+- inline: the previous handler, DELETEs and the commit run on the loop
+- batched: wipe.wipe_history in a thread, one transaction per batch
+
+The longest transaction is how long the user's rows stay locked at once.
+
+Run from the repository root:
+    python -m benchmarks.wipe [--rows 100000] [--batch-sizes 500,1000,5000]
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from backfill_rollups import backfill
+from benchmarks.fakes import scratch_schema
+from database import get_db
+from wipe import wipe_history
+
+SCHEMA = 'benchmark_wipe'
+LARGE_USER, SMALL_USER = 1, 2
+TICK = 0.005
+
+GENERATE = '''
+    INSERT INTO users (id, first_name, user_type, daily_calories)
+    VALUES (%(user_id)s, 'User', 'trainee', 2000);
+
+    INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs)
+    SELECT %(user_id)s, 'Lunch', current_date - n / 6, 300 + n %% 500, 20, 10, 40
+    FROM generate_series(1, %(meals)s) n;
+
+    INSERT INTO meal_items (meal_id, name, weight)
+    SELECT m.id, (ARRAY['Rice', 'Chicken breast'])[k], 100
+    FROM meals m, generate_series(1, 2) k WHERE m.user_id = %(user_id)s;
+
+    INSERT INTO drinks (user_id, drink_name, volume_ml, calories, protein, fat, carbs, date)
+    SELECT %(user_id)s, 'Cola', 330, 139, 0, 0, 35, current_date - n / 2
+    FROM generate_series(1, %(drinks)s) n;
+'''
+
+# What restart_command ran on the shared connection before the wipe was batched
+INLINE_WIPE = '''
+    DELETE FROM meals WHERE user_id = %(user_id)s;
+    DELETE FROM drinks WHERE user_id = %(user_id)s;
+    DELETE FROM meal_templates WHERE user_id = %(user_id)s;
+    DELETE FROM daily_totals WHERE user_id = %(user_id)s;
+    DELETE FROM weekly_totals WHERE user_id = %(user_id)s;
+    DELETE FROM monthly_totals WHERE user_id = %(user_id)s;
+'''
+
+
+def setup(rows):
+    """Refill the scratch schema, so every run wipes the same rows"""
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute('TRUNCATE users, meals, drinks, meal_templates, daily_totals, weekly_totals, monthly_totals CASCADE')
+        for user_id, total in ((LARGE_USER, rows), (SMALL_USER, rows // 10)):
+            cur.execute(GENERATE, {'user_id': user_id, 'meals': total * 3 // 4, 'drinks': total // 4})
+    db.conn.commit()
+    backfill(db)
+    with db.cursor() as cur:
+        cur.execute('ANALYZE')
+    db.conn.commit()
+
+
+async def measure(wipe):
+    """Run wipe() while ticking the loop; returns (seconds, tick delays)"""
+    delays = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            delays.append(time.perf_counter() - start - TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 4)
+    start = time.perf_counter()
+    await wipe()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, delays
+
+
+def inline_wipe():
+    db = get_db()
+
+    async def wipe():
+        with db.cursor() as cur:
+            cur.execute(INLINE_WIPE, {'user_id': LARGE_USER})
+        db.conn.commit()
+    return wipe, None
+
+
+def batched_wipe(conn, batch_size):
+    """The background wipe, recording the time between batch commits"""
+    batches, last = [], [0.0]
+
+    def progress(counts):
+        now = time.perf_counter()
+        batches.append(now - last[0])
+        last[0] = now
+
+    async def wipe():
+        last[0] = time.perf_counter()
+        await asyncio.to_thread(wipe_history, LARGE_USER, batch_size, progress, conn)
+    return wipe, batches
+
+
+def remaining(user_id):
+    """Meals, items, drinks and daily rollups still stored for a user"""
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute('''
+            SELECT (SELECT COUNT(*) FROM meals WHERE user_id = %(user_id)s)
+                 + (SELECT COUNT(*) FROM meal_items i JOIN meals m ON m.id = i.meal_id WHERE m.user_id = %(user_id)s)
+                 + (SELECT COUNT(*) FROM drinks WHERE user_id = %(user_id)s)
+                 + (SELECT COUNT(*) FROM daily_totals WHERE user_id = %(user_id)s)
+        ''', {'user_id': user_id})
+        count = cur.fetchone()[0]
+    db.conn.commit()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="large user's meals and drinks")
+    parser.add_argument('--batch-sizes', default='500,1000,5000')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with scratch_schema(SCHEMA, args.keep) as connect:
+        conn = connect()
+
+        print(f"{'wipe':<14} {'seconds':>8} {'stall max ms':>13} {'stall p99 ms':>13} {'longest txn ms':>15} {'left':>5}")
+        try:
+            runs = [('inline', None)] + [(f'batched {size}', int(size)) for size in args.batch_sizes.split(',')]
+            for label, batch_size in runs:
+                setup(args.rows)
+                wipe, batches = inline_wipe() if batch_size is None else batched_wipe(conn, batch_size)
+                elapsed, delays = asyncio.run(measure(wipe))
+                longest = max(batches) if batches else elapsed
+                p99 = statistics.quantiles(delays, n=100, method='inclusive')[98] if len(delays) > 1 else max(delays, default=0)
+                print(f"{label:<14} {elapsed:>8.2f} {max(delays) * 1000:>13.1f} {p99 * 1000:>13.1f} "
+                      f"{longest * 1000:>15.1f} {remaining(LARGE_USER):>5}")
+            print(f"Neighbour's rows kept: {remaining(SMALL_USER):,}")
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
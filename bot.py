@@ -1,81 +1,162 @@
+import asyncio
+import html
 import logging
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import (Application, CallbackQueryHandler, CommandHandler, MessageHandler, TypeHandler,
+                          filters, ContextTypes)
 from config import Config
-from database import db
-from vision_api import VisionAPI
+from database import get_db
+from vision_api import get_vision
 from cpfc_calculator import CPFCCalculator
 from user_manager import UserManager
 from drink_manager import DrinkManager
-import re
-from datetime import datetime
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from meal_templates import MealTemplates
+from dashboard import TrainerDashboards
+from reminders import ReminderScheduler, TICK_SECONDS
+from reports import week_report, month_report, format_report
+from charts import ChartCache, data_version, render, report_chart, today_chart
+from broadcast import run_broadcast
+from exporter import export_history
+from importer import UnsupportedFile, format_stats, import_history
+from wipe import format_counts as format_wipe_counts, wipe_history
+from telegram.error import BadRequest
+from keyboards import (Menu, USER_TYPE, GENDER, ACTIVITY_LEVEL, GOAL, MEAL_TYPE, YES_NO, REFERENCE_OBJECT,
+                       DRINK_VOLUME, REMOVE_KEYBOARD)
+from logging_utils import configure_logging
+from metrics import track_handler, start_metrics_server, register_page, USER_STATES
+from query_profiler import profiler, profiled
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import RateLimiter
+from outbox import Outbox
+from state_router import StateRouter, number_between
+import tempfile
+from datetime import datetime, timedelta
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Telegram bots can download files up to 20 MB
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+# Seconds between edits of a progress message
+PROGRESS_INTERVAL = 2
+
+# Callback data prefix of the /repeat menu, built per reply from the user's recent meals
+REPEAT_PREFIX = 'rep'
+
 class FithubBot:
     def __init__(self):
         try:
-            self.db = db
-            logger.info("Database initialized")
-            
-            self.vision = VisionAPI()
-            logger.info("Vision API initialized")
-            
             self.calculator = CPFCCalculator()
             logger.info("CPFC Calculator initialized")
             
             self.user_manager = UserManager()
+            USER_STATES.set_function(lambda: len(self.user_manager.user_states))
             logger.info("User Manager initialized")
             
             self.drink_manager = DrinkManager()
             logger.info("Drink Manager initialized")
             
+            self.router = self._build_router()
+            
+            self.chart_cache = ChartCache()
+            self.meal_templates = MealTemplates()
+            self.dashboards = TrainerDashboards()
+            self.wipes = {}
+            self.broadcasts = {}
+            self.exports = {}
+            self.imports = {}
+            
         except Exception as e:
             logger.error(f"Initialization error: {e}")
             raise
     
-    def get_yes_no_keyboard(self):
-        """Simple Yes/No keyboard"""
-        return ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True, resize_keyboard=True)
-    
-    def get_user_type_keyboard(self):
-        """User type selection keyboard"""
-        return ReplyKeyboardMarkup([['Trainer', 'Trainee']], one_time_keyboard=True, resize_keyboard=True)
+    def _build_router(self):
+        """Route each conversation state to its handler, for typed text and menu presses"""
+        router = StateRouter(self.user_manager, self.handle_unknown_state)
+        timeout = Config.STATE_TIMEOUT
+        meal_expired = "Your meal entry has expired. Use /add_meal to start again."
+        drink_expired = "Your drink entry has expired. Use /add_drink to start again."
+        
+        # Profile setup
+        router.add('awaiting_user_type', self.handle_user_type_selection, menu=USER_TYPE)
+        router.add('awaiting_height', self.handle_height_input,
+                   validate=number_between(100, 250, "Please enter a valid height (100-250 cm):"))
+        router.add('awaiting_weight', self.handle_weight_input,
+                   validate=number_between(30, 300, "Please enter a valid weight (30-300 kg):"))
+        router.add('awaiting_age', self.handle_age_input,
+                   validate=number_between(10, 100, "Please enter a valid age (10-100):", cast=int))
+        router.add('awaiting_gender', self.handle_gender_selection, menu=GENDER)
+        router.add('awaiting_activity_level', self.handle_activity_level_selection, menu=ACTIVITY_LEVEL)
+        router.add('awaiting_goal', self.handle_goal_selection, menu=GOAL)
+        
+        # Meals
+        router.add('awaiting_meal_type', self.handle_meal_type_selection, menu=MEAL_TYPE,
+                   timeout=timeout, expired=meal_expired)
+        router.add('awaiting_reference_object', self.handle_reference_object_selection, menu=REFERENCE_OBJECT,
+                   timeout=timeout, expired=meal_expired)
+        router.add('awaiting_photo_confirmation', self.handle_photo_confirmation, menu=YES_NO, prompt=True,
+                   timeout=timeout, expired=meal_expired)
+        router.add(('awaiting_food_photo', 'awaiting_manual_input'), self.handle_manual_food_input,
+                   timeout=timeout, expired=meal_expired)
+        router.add('awaiting_final_confirmation', self.handle_final_confirmation, menu=YES_NO, prompt=True,
+                   timeout=timeout, expired=meal_expired)
+        
+        # Each /repeat menu indexes its own list of meals
+        router.add('awaiting_repeat_choice', self.handle_repeat_choice, prefix=REPEAT_PREFIX, prompt=True,
+                   timeout=timeout, expired=meal_expired)
+        
+        # Drinks
+        router.add('awaiting_drink_name', self.handle_drink_name_input, timeout=timeout, expired=drink_expired)
+        router.add('awaiting_drink_volume', self.handle_drink_volume_selection, menu=DRINK_VOLUME,
+                   timeout=timeout, expired=drink_expired)
+        router.add('awaiting_custom_volume', self.handle_custom_volume_input,
+                   validate=number_between(1, 5000, "Please enter a valid volume (1-5000 ml):", cast=int),
+                   timeout=timeout, expired=drink_expired)
+        
+        # Trainers
+        router.add('awaiting_trainee_id', self.handle_trainee_id_input, timeout=timeout,
+                   expired="Adding a trainee has expired. Use /add_trainee to start again.")
+        
+        router.add('awaiting_broadcast', self.handle_broadcast_text, timeout=timeout,
+                   expired="The broadcast has expired. Use /broadcast to start again.")
+        
+        # History import
+        router.add('awaiting_import_file', self.handle_import_text, timeout=timeout,
+                   expired="The import has expired. Use /import to start again.")
+        return router
     
-    def get_meal_type_keyboard(self):
-        """Meal type selection keyboard"""
-        return ReplyKeyboardMarkup(
-            [['Breakfast', 'Lunch'], ['Dinner', 'Snack']], 
-            one_time_keyboard=True, 
-            resize_keyboard=True
-        )
+    @property
+    def db(self):
+        """Shared database, connected on first use"""
+        return get_db()
     
-    def get_drink_volumes_keyboard(self):
-        """Drink volume selection keyboard"""
-        return ReplyKeyboardMarkup([
-            ['250ml (glass)', '330ml (can)'],
-            ['500ml (bottle)', '1000ml (liter)'],
-            ['Other']
-        ], one_time_keyboard=True, resize_keyboard=True)
+    @property
+    def vision(self):
+        """Shared Vision API, client created on first use"""
+        return get_vision()
     
-    def remove_keyboard(self):
-        """Remove keyboard"""
-        return ReplyKeyboardRemove()
+    def get_page_keyboard(self, kind, page):
+        """Inline Prev/Next buttons under a page of trainees; None when there is one page"""
+        buttons = []
+        if page.has_prev and page.rows:
+            buttons.append(InlineKeyboardButton("‹ Prev", callback_data=f"{kind}:<{page.rows[0]['id']}"))
+        if page.has_next and page.rows:
+            buttons.append(InlineKeyboardButton("Next ›", callback_data=f"{kind}:>{page.rows[-1]['id']}"))
+        return InlineKeyboardMarkup([buttons]) if buttons else None
     
+    @track_handler
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         try:
             user = update.effective_user
-            logger.info(f"User {user.id} started bot")
+            logger.info("User %s started bot", user.id)
             
             existing_profile = self.db.get_user_profile(user.id)
             
             if existing_profile and existing_profile.get('height'):
-                await update.message.reply_html(
+                await update.effective_message.reply_html(
                     f"Welcome back, {user.first_name}!\n\n"
                     f"Your profile is already set up.\n\n"
                     f"<b>Commands:</b>\n"
@@ -85,11 +166,11 @@ class FithubBot:
                     f"/profile - View profile\n"
                     f"/help - Help\n\n"
                     f"Want to start over? Type /restart",
-                    reply_markup=self.remove_keyboard()
+                    reply_markup=REMOVE_KEYBOARD
                 )
                 return
             
-            await update.message.reply_html(
+            await update.effective_message.reply_html(
                 f"Welcome to FITHUB!\n\n"
                 f"Hi, {user.first_name}! I'm your personal nutrition assistant.\n\n"
                 f"I will help you:\n"
@@ -98,14 +179,15 @@ class FithubBot:
                 f"- Recognize food from photos\n"
                 f"- Monitor your progress\n\n"
                 f"Who are you?",
-                reply_markup=self.get_user_type_keyboard()
+                reply_markup=USER_TYPE.markup
             )
             
             self.user_manager.set_user_state(user.id, 'awaiting_user_type')
         except Exception as e:
             logger.error(f"Error in start command: {e}", exc_info=True)
-            await update.message.reply_text("Sorry, an error occurred. Please try again.")
+            await update.effective_message.reply_text("Sorry, an error occurred. Please try again.")
 
+    @track_handler
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle all text messages based on user state"""
         try:
@@ -115,56 +197,39 @@ class FithubBot:
             if text.strip().startswith('/'):
                 return
 
-            state = self.user_manager.get_user_state(user_id)
-
-            logger.info(f"User {user_id} in state {state} sent: {text}")
-
-            if state == 'awaiting_user_type':
-                await self.handle_user_type_selection(update, text)
-            elif state == 'awaiting_height':
-                await self.handle_height_input(update, text)
-            elif state == 'awaiting_weight':
-                await self.handle_weight_input(update, text)
-            elif state == 'awaiting_age':
-                await self.handle_age_input(update, text)
-            elif state == 'awaiting_gender':
-                await self.handle_gender_selection(update, text)
-            elif state == 'awaiting_activity_level':
-                await self.handle_activity_level_selection(update, text)
-            elif state == 'awaiting_goal':
-                await self.handle_goal_selection(update, text)
-            elif state == 'awaiting_meal_type':
-                await self.handle_meal_type_selection(update, text)
-            elif state == 'awaiting_photo_confirmation':
-                await self.handle_photo_confirmation(update, text)
-            elif state == 'awaiting_manual_input':
-                await self.handle_manual_food_input(update, text)
-            elif state == 'awaiting_final_confirmation':
-                await self.handle_final_confirmation(update, text)
-            elif state == 'awaiting_drink_name':
-                await self.handle_drink_name_input(update, text)
-            elif state == 'awaiting_drink_volume':
-                await self.handle_drink_volume_selection(update, text)
-            elif state == 'awaiting_custom_volume':
-                await self.handle_custom_volume_input(update, text)
-            elif state == 'awaiting_trainee_id':
-                await self.handle_trainee_id_input(update, text)
-            else:
-                await update.message.reply_text(
-                    "I didn't understand that. Use /help to see available commands."
-                )
+            logger.debug("User %s in state %s sent %d chars",
+                         user_id, self.user_manager.get_user_state(user_id), len(text))
+            await self.router.dispatch(update, text)
 
         except Exception as e:
             logger.error(f"Error in handle_message: {e}", exc_info=True)
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Sorry, an error occurred. Please use /start to restart."
             )
 
-    async def handle_user_type_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_menu_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle a press of a menu button ('<prefix>:<value>' callback data)"""
+        try:
+            await self.router.dispatch_callback(update)
+        except Exception as e:
+            logger.error(f"Error in handle_menu_callback: {e}", exc_info=True)
+            await update.effective_message.reply_text(
+                "Sorry, an error occurred. Please use /start to restart."
+            )
+
+    async def handle_unknown_state(self, update: Update, text: str):
+        """Reply to text that no conversation state expects"""
+        await update.effective_message.reply_text(
+            "I didn't understand that. Use /help to see available commands."
+        )
+
+    @track_handler
+    async def handle_user_type_selection(self, update: Update, user_type: str):
         """Handle user type selection"""
         user_id = update.effective_user.id
         
-        if 'Trainer' in text:
+        if user_type == 'trainer':
             self.db.save_user({
                 'id': user_id,
                 'username': update.effective_user.username,
@@ -172,18 +237,21 @@ class FithubBot:
                 'last_name': update.effective_user.last_name,
                 'user_type': 'trainer'
             })
-            await update.message.reply_text(
+            self.dashboards.update_profile(user_id, {
+                'first_name': update.effective_user.first_name, 'username': update.effective_user.username
+            })
+            await update.effective_message.reply_text(
                 "You are registered as a Trainer!\n\n"
                 "Now you can add your trainees and monitor their nutrition.\n\n"
                 "Commands:\n"
                 "/add_trainee - Add trainee\n"
                 "/my_trainees - View my trainees\n"
                 "/stats - Trainee statistics",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
             self.user_manager.set_user_state(user_id, 'main_menu')
             
-        elif 'Trainee' in text:
+        else:
             self.db.save_user({
                 'id': user_id,
                 'username': update.effective_user.username,
@@ -191,204 +259,179 @@ class FithubBot:
                 'last_name': update.effective_user.last_name,
                 'user_type': 'trainee'
             })
-            await update.message.reply_text(
+            # A former trainer's dashboard would skip the trainer check in /stats
+            self.dashboards.forget(user_id)
+            self.dashboards.update_profile(user_id, {
+                'first_name': update.effective_user.first_name, 'username': update.effective_user.username
+            })
+            await update.effective_message.reply_text(
                 "You are registered as a Trainee!\n\n"
                 "Let's set up your profile to calculate your personalized nutrition plan.\n\n"
                 "Please enter your height in cm (e.g., 175):",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
             self.user_manager.set_user_state(user_id, 'awaiting_height')
     
+    @track_handler
     async def handle_height_input(self, update: Update, text: str):
         """Handle height input"""
         user_id = update.effective_user.id
-        try:
-            height = float(text)
-            if height < 100 or height > 250:
-                await update.message.reply_text("Please enter a valid height (100-250 cm):")
-                return
-            
-            self.user_manager.set_user_state(user_id, 'awaiting_weight', {'height': height})
-            await update.message.reply_text(f"Height: {height} cm\n\nNow enter your weight in kg (e.g., 70):")
-        except ValueError:
-            await update.message.reply_text("Please enter a valid number:")
+        height = float(text)
+        self.user_manager.set_user_state(user_id, 'awaiting_weight', {'height': height})
+        await update.effective_message.reply_text(f"Height: {height} cm\n\nNow enter your weight in kg (e.g., 70):")
     
+    @track_handler
     async def handle_weight_input(self, update: Update, text: str):
         """Handle weight input"""
         user_id = update.effective_user.id
-        try:
-            weight = float(text)
-            if weight < 30 or weight > 300:
-                await update.message.reply_text("Please enter a valid weight (30-300 kg):")
-                return
-            
-            data = self.user_manager.get_user_data(user_id)
-            data['weight'] = weight
-            self.user_manager.set_user_state(user_id, 'awaiting_age', data)
-            await update.message.reply_text(f"Weight: {weight} kg\n\nNow enter your age (e.g., 25):")
-        except ValueError:
-            await update.message.reply_text("Please enter a valid number:")
+        data = self.user_manager.get_user_data(user_id)
+        data['weight'] = float(text)
+        self.user_manager.set_user_state(user_id, 'awaiting_age', data)
+        await update.effective_message.reply_text(f"Weight: {data['weight']} kg\n\nNow enter your age (e.g., 25):")
     
+    @track_handler
     async def handle_age_input(self, update: Update, text: str):
         """Handle age input"""
         user_id = update.effective_user.id
-        try:
-            age = int(text)
-            if age < 10 or age > 100:
-                await update.message.reply_text("Please enter a valid age (10-100):")
-                return
-            
-            data = self.user_manager.get_user_data(user_id)
-            data['age'] = age
-            self.user_manager.set_user_state(user_id, 'awaiting_gender', data)
-            await update.message.reply_text(
-                f"Age: {age}\n\nSelect your gender:",
-                reply_markup=ReplyKeyboardMarkup(
-                    [['Male', 'Female']], 
-                    one_time_keyboard=True, 
-                    resize_keyboard=True
-                )
-            )
-        except ValueError:
-            await update.message.reply_text("Please enter a valid number:")
+        data = self.user_manager.get_user_data(user_id)
+        data['age'] = int(text)
+        self.user_manager.set_user_state(user_id, 'awaiting_gender', data)
+        await update.effective_message.reply_text(
+            f"Age: {data['age']}\n\nSelect your gender:",
+            reply_markup=GENDER.markup
+        )
     
-    async def handle_gender_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_gender_selection(self, update: Update, gender: str):
         """Handle gender selection"""
         user_id = update.effective_user.id
-        if text in ['Male', 'Female']:
-            data = self.user_manager.get_user_data(user_id)
-            data['gender'] = text.lower()
-            self.user_manager.set_user_state(user_id, 'awaiting_activity_level', data)
-            await update.message.reply_text(
-                f"Gender: {text}\n\nSelect your activity level:",
-                reply_markup=ReplyKeyboardMarkup([
-                    ['Sedentary (minimal activity)'],
-                    ['Light (exercise 1-3 days/week)'],
-                    ['Moderate (exercise 3-5 days/week)'],
-                    ['Active (exercise 6-7 days/week)'],
-                    ['Very Active (intense exercise + physical job)']
-                ], one_time_keyboard=True, resize_keyboard=True)
-            )
-        else:
-            await update.message.reply_text("Please select Male or Female:")
+        data = self.user_manager.get_user_data(user_id)
+        data['gender'] = gender
+        self.user_manager.set_user_state(user_id, 'awaiting_activity_level', data)
+        await update.effective_message.reply_text(
+            f"Gender: {GENDER.labels[gender]}\n\nSelect your activity level:",
+            reply_markup=ACTIVITY_LEVEL.markup
+        )
     
-    async def handle_activity_level_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_activity_level_selection(self, update: Update, activity_level: str):
         """Handle activity level selection"""
         user_id = update.effective_user.id
-        activity_map = {
-            'Sedentary': 'sedentary',
-            'Light': 'light',
-            'Moderate': 'medium',
-            'Active': 'active',
-            'Very Active': 'very_active'
-        }
-        
-        activity_level = None
-        for key, value in activity_map.items():
-            if key in text:
-                activity_level = value
-                break
-        
-        if activity_level:
-            data = self.user_manager.get_user_data(user_id)
-            data['activity_level'] = activity_level
-            self.user_manager.set_user_state(user_id, 'awaiting_goal', data)
-            await update.message.reply_text(
-                f"Activity level set\n\nSelect your goal:",
-                reply_markup=ReplyKeyboardMarkup([
-                    ['Weight Loss'],
-                    ['Maintenance'],
-                    ['Weight Gain']
-                ], one_time_keyboard=True, resize_keyboard=True)
-            )
-        else:
-            await update.message.reply_text("Please select an activity level from the menu:")
+        data = self.user_manager.get_user_data(user_id)
+        data['activity_level'] = activity_level
+        self.user_manager.set_user_state(user_id, 'awaiting_goal', data)
+        await update.effective_message.reply_text(
+            f"Activity level set\n\nSelect your goal:",
+            reply_markup=GOAL.markup
+        )
     
-    async def handle_goal_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_goal_selection(self, update: Update, goal: str):
         """Handle goal selection and complete profile setup"""
         user_id = update.effective_user.id
-        goal_map = {
-            'Weight Loss': 'weight_loss',
-            'Maintenance': 'maintenance',
-            'Weight Gain': 'weight_gain'
+        data = self.user_manager.get_user_data(user_id)
+        data['goal'] = goal
+        
+        cpfc = self.calculator.calculate_daily_cpfc(
+            weight=data['weight'],
+            height=data['height'],
+            age=data['age'],
+            gender=data['gender'],
+            activity_level=data['activity_level'],
+            goal=goal
+        )
+        
+        profile_data = {
+            'height': data['height'],
+            'weight': data['weight'],
+            'age': data['age'],
+            'gender': data['gender'],
+            'activity_level': data['activity_level'],
+            'goal': goal,
+            'daily_calories': cpfc['calories']
         }
         
-        goal = goal_map.get(text)
+        success = self.db.update_user_profile(user_id, profile_data)
+        logger.info("Profile update for user %s: %s", user_id, success)
+        if success:
+            self.dashboards.update_profile(user_id, profile_data)
         
-        if goal:
-            data = self.user_manager.get_user_data(user_id)
-            data['goal'] = goal
-            
-            cpfc = self.calculator.calculate_daily_cpfc(
-                weight=data['weight'],
-                height=data['height'],
-                age=data['age'],
-                gender=data['gender'],
-                activity_level=data['activity_level'],
-                goal=goal
-            )
-            
-            profile_data = {
-                'height': data['height'],
-                'weight': data['weight'],
-                'age': data['age'],
-                'gender': data['gender'],
-                'activity_level': data['activity_level'],
-                'goal': goal,
-                'daily_calories': cpfc['calories']
-            }
-            
-            success = self.db.update_user_profile(user_id, profile_data)
-            logger.info(f"Profile update for user {user_id}: {success}")
-            
-            await update.message.reply_html(
-                f"<b>Profile completed!</b>\n\n"
-                f"<b>Your personalized nutrition plan:</b>\n\n"
-                f"Calories: <b>{cpfc['calories']:.0f} kcal/day</b>\n"
-                f"Protein: <b>{cpfc['protein']:.0f} g/day</b>\n"
-                f"Fat: <b>{cpfc['fat']:.0f} g/day</b>\n"
-                f"Carbs: <b>{cpfc['carbs']:.0f} g/day</b>\n\n"
-                f"Now you can track your meals!\n\n"
-                f"<b>Commands:</b>\n"
-                f"/add_meal - Add meal\n"
-                f"/add_drink - Add drink\n"
-                f"/today - Today's summary\n"
-                f"/profile - View profile",
-                reply_markup=self.remove_keyboard()
-            )
-            self.user_manager.set_user_state(user_id, 'main_menu')
-        else:
-            await update.message.reply_text("Please select a goal from the menu:")
+        await update.effective_message.reply_html(
+            f"<b>Profile completed!</b>\n\n"
+            f"<b>Your personalized nutrition plan:</b>\n\n"
+            f"Calories: <b>{cpfc['calories']:.0f} kcal/day</b>\n"
+            f"Protein: <b>{cpfc['protein']:.0f} g/day</b>\n"
+            f"Fat: <b>{cpfc['fat']:.0f} g/day</b>\n"
+            f"Carbs: <b>{cpfc['carbs']:.0f} g/day</b>\n\n"
+            f"Now you can track your meals!\n\n"
+            f"<b>Commands:</b>\n"
+            f"/add_meal - Add meal\n"
+            f"/add_drink - Add drink\n"
+            f"/today - Today's summary\n"
+            f"/profile - View profile",
+            reply_markup=REMOVE_KEYBOARD
+        )
+        self.user_manager.set_user_state(user_id, 'main_menu')
     
-    async def handle_meal_type_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_meal_type_selection(self, update: Update, meal_type: str):
         """Handle meal type selection"""
         user_id = update.effective_user.id
-        if text in ['Breakfast', 'Lunch', 'Snack', 'Dinner']:
-            data = self.user_manager.get_user_data(user_id)
-            data['meal_type'] = text.lower()
-            self.user_manager.set_user_state(user_id, 'awaiting_food_photo', data)
-            await update.message.reply_text(
-                f"Please send a photo of your {text.lower()}, or enter food items manually.\n\n"
-                f"<b>Manual entry format:</b>\n"
-                f"food name - weight in grams\n\n"
-                f"<b>Example:</b>\n"
-                f"Egg - 50\n"
-                f"Carrot - 60\n"
-                f"Orange - 130",
-                reply_markup=self.remove_keyboard(),
-                parse_mode='HTML'
-            )
-        else:
-            await update.message.reply_text(
-                "Please select a meal type:",
-                reply_markup=self.get_meal_type_keyboard()
+        data = self.user_manager.get_user_data(user_id)
+        data['meal_type'] = meal_type
+        self.user_manager.set_user_state(user_id, 'awaiting_food_photo', data)
+        await update.effective_message.reply_text(
+            f"Please send a photo of your {meal_type}, or enter food items manually.\n\n"
+            f"<b>Manual entry format:</b>\n"
+            f"food name - weight in grams\n\n"
+            f"<b>Example:</b>\n"
+            f"Egg - 50\n"
+            f"Carrot - 60\n"
+            f"Orange - 130",
+            reply_markup=REMOVE_KEYBOARD,
+            parse_mode='HTML'
+        )
+    
+    def format_recognized_items(self, items):
+        """Format recognized items as 'name - weight' lines"""
+        lines = []
+        for item in items:
+            count = item.get('count', 1)
+            name = f"{item['name']} x{count}" if count > 1 else item['name']
+            lines.append(f"{name} - {item.get('estimated_weight', 100)}g")
+        return "\n".join(lines)
+    
+    @track_handler
+    async def handle_reference_object_selection(self, update: Update, reference: str):
+        """Re-estimate portions with the reference object selected by the user"""
+        user_id = update.effective_user.id
+        data = self.user_manager.get_user_data(user_id)
+        if reference != 'none':
+            # Re-run only the estimator on the stored detections, no new Vision call
+            food_items = [
+                {'name': item['name'], 'confidence': item['confidence'], 'source': item['source']}
+                for item in data.get('recognized_items', [])
+            ]
+            estimate = self.vision.estimate_portions(
+                food_items, data.get('detections', []), data.get('image_size'), reference
             )
+            data['recognized_items'] = estimate['items']
+        
+        self.user_manager.set_user_state(user_id, 'awaiting_photo_confirmation', data)
+        message = await update.effective_message.reply_html(
+            f"<b>Recognized with estimated weights:</b>\n\n"
+            f"{self.format_recognized_items(data.get('recognized_items', []))}\n\n"
+            f"<b>Are these items and weights correct?</b>",
+            reply_markup=YES_NO.markup
+        )
+        self.user_manager.set_prompt(user_id, message.message_id)
     
-    async def handle_photo_confirmation(self, update: Update, text: str):
+    @track_handler
+    async def handle_photo_confirmation(self, update: Update, answer: str):
         """Handle confirmation after photo recognition"""
         user_id = update.effective_user.id
         
-        if text == 'Yes':
+        if answer == 'yes':
             # User accepts recognized items, proceed to save
             data = self.user_manager.get_user_data(user_id)
             recognized_items = data.get('recognized_items', [])
@@ -404,25 +447,21 @@ class FithubBot:
             # Show nutrition summary and ask for final confirmation
             await self.show_meal_summary_and_confirm(update, user_id, food_items)
             
-        elif text == 'No':
+        else:
             # User wants to manually adjust
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Please enter the food items and weights manually.\n\n"
                 "<b>Format:</b> food name - weight in grams\n\n"
                 "<b>Example:</b>\n"
                 "Egg - 50\n"
                 "Carrot - 60\n"
                 "Orange - 130",
-                reply_markup=self.remove_keyboard(),
+                reply_markup=REMOVE_KEYBOARD,
                 parse_mode='HTML'
             )
             self.user_manager.set_user_state(user_id, 'awaiting_manual_input')
-        else:
-            await update.message.reply_text(
-                "Please select Yes or No:",
-                reply_markup=self.get_yes_no_keyboard()
-            )
     
+    @track_handler
     async def handle_manual_food_input(self, update: Update, text: str):
         """Handle manual food input"""
         user_id = update.effective_user.id
@@ -441,7 +480,7 @@ class FithubBot:
                 continue
         
         if not food_items:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Could not parse input. Please use the format:\n\n"
                 "food name - weight\n\n"
                 "Example:\n"
@@ -471,7 +510,7 @@ class FithubBot:
         
         self.user_manager.set_user_state(user_id, 'awaiting_final_confirmation', data)
         
-        await update.message.reply_html(
+        message = await update.effective_message.reply_html(
             f"<b>Your meal:</b>\n\n"
             f"{items_text}\n\n"
             f"<b>Nutrition:</b>\n"
@@ -480,14 +519,16 @@ class FithubBot:
             f"Fat: <b>{meal_cpfc['fat']:.0f} g</b>\n"
             f"Carbs: <b>{meal_cpfc['carbs']:.0f} g</b>\n\n"
             f"<b>Save this meal?</b>",
-            reply_markup=self.get_yes_no_keyboard()
+            reply_markup=YES_NO.markup
         )
+        self.user_manager.set_prompt(user_id, message.message_id)
     
-    async def handle_final_confirmation(self, update: Update, text: str):
+    @track_handler
+    async def handle_final_confirmation(self, update: Update, answer: str):
         """Handle final meal save confirmation"""
         user_id = update.effective_user.id
         
-        if text == 'Yes':
+        if answer == 'yes':
             data = self.user_manager.get_user_data(user_id)
             
             meal_data = {
@@ -497,54 +538,53 @@ class FithubBot:
                 'calories': data.get('total_calories', 0),
                 'protein': data.get('total_protein', 0),
                 'fat': data.get('total_fat', 0),
-                'carbs': data.get('total_carbs', 0)
+                'carbs': data.get('total_carbs', 0),
+                'items': data.get('food_items', [])
             }
             
             meal_id = self.db.save_meal(meal_data)
-            logger.info(f"Meal saved for user {user_id}: meal_id={meal_id}")
+            logger.debug("Meal saved for user %s: meal_id=%s", user_id, meal_id)
             
             if meal_id:
+                self.dashboards.add_intake(user_id, meal_data['date'], meal_data)
                 remaining = self.calculator.get_remaining_cpfc(
                     user_id,
                     datetime.now().strftime('%Y-%m-%d')
                 )
                 
                 if remaining:
-                    await update.message.reply_html(
+                    await update.effective_message.reply_html(
                         f"<b>Meal saved successfully!</b>\n\n"
                         f"<b>Remaining for today:</b>\n\n"
                         f"Calories: <b>{remaining['remaining_calories']:.0f} kcal</b>\n"
                         f"Protein: <b>{remaining['remaining_protein']:.0f} g</b>\n"
                         f"Fat: <b>{remaining['remaining_fat']:.0f} g</b>\n"
                         f"Carbs: <b>{remaining['remaining_carbs']:.0f} g</b>\n\n"
-                        f"Use /add_meal to add another meal or /today for full summary.",
-                        reply_markup=self.remove_keyboard()
+                        f"Use /add_meal to add another meal or /today for full summary.\n"
+                        f"Use /save_meal NAME to keep this meal for /repeat.",
+                        reply_markup=REMOVE_KEYBOARD
                     )
                 else:
-                    await update.message.reply_text(
+                    await update.effective_message.reply_text(
                         "Meal saved successfully!\n\nUse /add_meal to add another meal.",
-                        reply_markup=self.remove_keyboard()
+                        reply_markup=REMOVE_KEYBOARD
                     )
                 
                 self.user_manager.set_user_state(user_id, 'main_menu')
             else:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "Error saving meal. Please try again with /add_meal",
-                    reply_markup=self.remove_keyboard()
+                    reply_markup=REMOVE_KEYBOARD
                 )
         
-        elif text == 'No':
-            await update.message.reply_text(
+        else:
+            await update.effective_message.reply_text(
                 "Meal cancelled. Use /add_meal to start over.",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
             self.user_manager.set_user_state(user_id, 'main_menu')
-        else:
-            await update.message.reply_text(
-                "Please select Yes or No:",
-                reply_markup=self.get_yes_no_keyboard()
-            )
     
+    @track_handler
     async def handle_drink_name_input(self, update: Update, text: str):
         """Handle drink name input"""
         user_id = update.effective_user.id
@@ -555,64 +595,45 @@ class FithubBot:
         if drink_info:
             data = {'drink_name': drink_name, 'drink_info': drink_info}
             self.user_manager.set_user_state(user_id, 'awaiting_drink_volume', data)
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 f"Found: {drink_name}\n\nSelect volume:",
-                reply_markup=self.get_drink_volumes_keyboard()
+                reply_markup=DRINK_VOLUME.markup
             )
         else:
             similar = self.drink_manager.search_drinks(drink_name)
             
             if similar:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     f"Drink '{drink_name}' not found.\n\n"
                     f"Did you mean:\n" + "\n".join(f"- {d}" for d in similar[:5]) + "\n\n"
                     f"Please enter the drink name again:",
-                    reply_markup=self.remove_keyboard()
+                    reply_markup=REMOVE_KEYBOARD
                 )
             else:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     f"Drink '{drink_name}' not found in database.\n\n"
                     f"Please try another name or use /add_meal to log it as food.",
-                    reply_markup=self.remove_keyboard()
+                    reply_markup=REMOVE_KEYBOARD
                 )
     
-    async def handle_drink_volume_selection(self, update: Update, text: str):
+    @track_handler
+    async def handle_drink_volume_selection(self, update: Update, volume: str):
         """Handle drink volume selection"""
         user_id = update.effective_user.id
-        volume_ml = None
-        
-        if 'ml' in text or 'glass' in text or 'can' in text or 'bottle' in text or 'liter' in text:
-            numbers = re.findall(r'\d+', text)
-            if numbers:
-                volume_ml = int(numbers[0])
-        elif 'Other' in text:
-            await update.message.reply_text(
+        if volume == 'other':
+            await update.effective_message.reply_text(
                 "Enter volume in ml (e.g., 350):",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
             self.user_manager.set_user_state(user_id, 'awaiting_custom_volume')
             return
         
-        if volume_ml:
-            await self.save_drink(update, user_id, volume_ml)
-        else:
-            await update.message.reply_text(
-                "Please select volume from the menu:",
-                reply_markup=self.get_drink_volumes_keyboard()
-            )
+        await self.save_drink(update, user_id, int(volume))
     
+    @track_handler
     async def handle_custom_volume_input(self, update: Update, text: str):
         """Handle custom volume input"""
-        user_id = update.effective_user.id
-        try:
-            volume_ml = int(text)
-            if volume_ml < 1 or volume_ml > 5000:
-                await update.message.reply_text("Please enter a valid volume (1-5000 ml):")
-                return
-            
-            await self.save_drink(update, user_id, volume_ml)
-        except ValueError:
-            await update.message.reply_text("Please enter a valid number:")
+        await self.save_drink(update, update.effective_user.id, int(text))
 
     async def save_drink(self, update, user_id, volume_ml):
         """Save drink to database"""
@@ -637,10 +658,11 @@ class FithubBot:
             'date': datetime.now().strftime('%Y-%m-%d')
         }
 
-        logger.info(f"Saving drink for user {user_id}: {drink_data}")
+        logger.debug("Saving drink for user %s: %s", user_id, drink_data)
 
         if self.db.save_drink(drink_data):
-            await update.message.reply_html(
+            self.dashboards.add_intake(user_id, drink_data['date'], drink_data)
+            await update.effective_message.reply_html(
                 f"<b>Drink saved!</b>\n\n"
                 f"{drink_name} ({volume_ml}ml)\n\n"
                 f"<b>Nutrition:</b>\n"
@@ -648,92 +670,214 @@ class FithubBot:
                 f"Protein: <b>{drink_info['protein']:.1f} g</b>\n"
                 f"Fat: <b>{drink_info['fat']:.1f} g</b>\n"
                 f"Carbs: <b>{drink_info['carbs']:.1f} g</b>",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
             self.user_manager.set_user_state(user_id, 'main_menu')
         else:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Error saving drink. Please try again.",
-                reply_markup=self.remove_keyboard()
+                reply_markup=REMOVE_KEYBOARD
             )
 
+    @track_handler
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle photo messages"""
         user_id = update.effective_user.id
         state = self.user_manager.get_user_state(user_id)
         
-        if state == 'awaiting_food_photo':
-            await update.message.reply_text("Analyzing photo...")
+        if state == 'awaiting_broadcast':
+            # Re-sent by file_id, so the photo is uploaded only once
+            trainee_ids = self.user_manager.get_user_data(user_id)['trainee_ids']
+            await self.start_broadcast(update, user_id, trainee_ids, text=update.message.caption,
+                                       file_id=update.message.photo[-1].file_id)
+        elif state == 'awaiting_food_photo':
+            await update.effective_message.reply_text("Analyzing photo...")
             
             try:
                 photo = update.message.photo[-1]
                 photo_file = await photo.get_file()
                 photo_bytes = await photo_file.download_as_bytearray()
                 
-                result = self.vision.detect_food_items(bytes(photo_bytes))
+                # Vision calls block; run them off the event loop so other users' updates proceed
+                result = await asyncio.to_thread(self.vision.detect_food_items, bytes(photo_bytes))
                 
                 if result['success'] and result['items']:
-                    items_list = []
-                    for item in result['items'][:10]:
-                        name = item['name']
-                        weight = item.get('estimated_weight', 100)
-                        items_list.append(f"{name} - {weight}g")
-                    
-                    items_text = "\n".join(items_list)
-                    
                     data = self.user_manager.get_user_data(user_id)
                     data['recognized_items'] = result['items'][:10]
+                    data['detections'] = result.get('detections', [])
+                    data['image_size'] = result.get('image_size')
+                    
+                    has_geometry = any(d.get('food') for d in data['detections'])
+                    if has_geometry and not result.get('reference'):
+                        # No reference object detected: ask the user to scale portions
+                        self.user_manager.set_user_state(user_id, 'awaiting_reference_object', data)
+                        await update.effective_message.reply_html(
+                            f"<b>Recognized with estimated weights:</b>\n\n"
+                            f"{self.format_recognized_items(data['recognized_items'])}\n\n"
+                            f"Is there a reference object in the photo? "
+                            f"It helps to estimate portion sizes more accurately.",
+                            reply_markup=REFERENCE_OBJECT.markup
+                        )
+                        return
+                    
                     self.user_manager.set_user_state(user_id, 'awaiting_photo_confirmation', data)
                     
-                    await update.message.reply_html(
+                    message = await update.effective_message.reply_html(
                         f"<b>Recognized with estimated weights:</b>\n\n"
-                        f"{items_text}\n\n"
+                        f"{self.format_recognized_items(data['recognized_items'])}\n\n"
                         f"<b>Are these items and weights correct?</b>",
-                        reply_markup=self.get_yes_no_keyboard()
+                        reply_markup=YES_NO.markup
                     )
+                    self.user_manager.set_prompt(user_id, message.message_id)
                     
                 else:
-                    await update.message.reply_text(
+                    await update.effective_message.reply_text(
                         "Could not recognize food in the photo.\n\n"
                         "Please enter food items manually.\n\n"
                         "Format: food name - weight in grams\n"
                         "Example:\n"
                         "Egg - 50\n"
                         "Carrot - 60",
-                        reply_markup=self.remove_keyboard()
+                        reply_markup=REMOVE_KEYBOARD
                     )
                     self.user_manager.set_user_state(user_id, 'awaiting_manual_input')
                     
             except Exception as e:
                 logger.error(f"Error processing photo: {e}", exc_info=True)
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "Error processing photo. Please enter food manually.",
-                    reply_markup=self.remove_keyboard()
+                    reply_markup=REMOVE_KEYBOARD
                 )
                 self.user_manager.set_user_state(user_id, 'awaiting_manual_input')
         else:
-            await update.message.reply_text("Please use /add_meal to start adding a meal.")
+            await update.effective_message.reply_text("Please use /add_meal to start adding a meal.")
     
+    @track_handler
     async def add_meal_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /add_meal command"""
         user_id = update.effective_user.id
         
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "Select meal type:",
-            reply_markup=self.get_meal_type_keyboard()
+            reply_markup=MEAL_TYPE.markup
         )
         self.user_manager.set_user_state(user_id, 'awaiting_meal_type')
     
+    @track_handler
     async def add_drink_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /add_drink command"""
         user_id = update.effective_user.id
         
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "Enter drink name (e.g., Cola, Coffee, Orange Juice):",
-            reply_markup=self.remove_keyboard()
+            reply_markup=REMOVE_KEYBOARD
         )
         self.user_manager.set_user_state(user_id, 'awaiting_drink_name')
     
+    @track_handler
+    async def repeat_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /repeat command - log a saved or recent meal again"""
+        user_id = update.effective_user.id
+        name = ' '.join(context.args or ())
+        if name:
+            template = self.meal_templates.find(user_id, name)
+            if template is None:
+                await update.effective_message.reply_text(f"No saved meal called '{name}'. Use /repeat to see your meals.")
+                return
+            await self.relog(update, user_id, 'template', template)
+            return
+        
+        # Template names first, then recent meals by date
+        choices = {}
+        for template in self.meal_templates.top(user_id):
+            choices[f"{template['name']} ({template['calories']:.0f} kcal)"] = ('template', template)
+        for meal in self.db.get_recent_meals(user_id, Config.RECENT_MEALS):
+            label = f"{meal['meal_type']} {meal['date']:%d %b} ({meal['calories']:.0f} kcal)"
+            choices.setdefault(label, ('meal', {'id': meal['id'], 'name': meal['meal_type']}))
+        if not choices:
+            await update.effective_message.reply_text("No meals to repeat yet. Start tracking with /add_meal")
+            return
+        
+        # Buttons send the choice's index; labels can exceed the 64 bytes of callback data
+        menu = Menu(REPEAT_PREFIX, [[(label, str(i))] for i, label in enumerate(choices)] + [[('Cancel', 'cancel')]],
+                    "Please pick a meal from the menu:")
+        message = await update.effective_message.reply_text(
+            "Which meal do you want to log again?",
+            reply_markup=menu.markup
+        )
+        self.user_manager.set_user_state(user_id, 'awaiting_repeat_choice', {
+            'choices': list(choices.values()), 'menu': menu
+        })
+        self.user_manager.set_prompt(user_id, message.message_id)
+    
+    @track_handler
+    async def handle_repeat_choice(self, update: Update, text: str):
+        """Handle the meal picked after /repeat, by button or typed label"""
+        user_id = update.effective_user.id
+        data = self.user_manager.get_user_data(user_id)
+        value = data['menu'].parse(text) if 'menu' in data else None
+        if value is None or value == 'cancel':
+            self.user_manager.set_user_state(user_id, 'main_menu')
+            await update.effective_message.reply_text("Cancelled. Use /repeat to pick a meal.", reply_markup=REMOVE_KEYBOARD)
+            return
+        
+        await self.relog(update, user_id, *data['choices'][int(value)])
+    
+    async def relog(self, update, user_id, source, entry):
+        """Log a template or recent meal again from its stored totals and reply with what remains today"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if source == 'template':
+            meal = self.meal_templates.relog(user_id, entry, today)
+        else:
+            meal = self.db.relog_meal(user_id, 'meal', entry['id'], today)
+        self.user_manager.set_user_state(user_id, 'main_menu')
+        if meal is None:
+            await update.effective_message.reply_text("Error logging the meal. Please try again.", reply_markup=REMOVE_KEYBOARD)
+            return
+        self.dashboards.add_intake(user_id, today, meal)
+        
+        text = f"<b>{html.escape(entry['name'])} logged: {meal['calories']:.0f} kcal</b>"
+        remaining = self.calculator.get_remaining_cpfc(user_id, today)
+        if remaining:
+            text += (
+                f"\n\n<b>Remaining for today:</b>\n\n"
+                f"Calories: <b>{remaining['remaining_calories']:.0f} kcal</b>\n"
+                f"Protein: <b>{remaining['remaining_protein']:.0f} g</b>\n"
+                f"Fat: <b>{remaining['remaining_fat']:.0f} g</b>\n"
+                f"Carbs: <b>{remaining['remaining_carbs']:.0f} g</b>"
+            )
+        await update.effective_message.reply_html(text, reply_markup=REMOVE_KEYBOARD)
+    
+    @track_handler
+    async def save_meal_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /save_meal command - keep the last logged meal as a template"""
+        user_id = update.effective_user.id
+        name = ' '.join(context.args or ())[:64]
+        if not name:
+            await update.effective_message.reply_html("Give the meal a name: <code>/save_meal Oatmeal breakfast</code>")
+            return
+        
+        template = self.meal_templates.save(user_id, name)
+        if template is None:
+            await update.effective_message.reply_text("No meal to save yet. Log one with /add_meal first.")
+            return
+        await update.effective_message.reply_html(
+            f"Saved <b>{html.escape(template['name'])}</b> ({template['calories']:.0f} kcal).\n"
+            f"Log it again with /repeat or <code>/repeat {html.escape(template['name'])}</code>"
+        )
+    
+    @track_handler
+    async def forget_meal_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /forget_meal command - delete a saved meal"""
+        user_id = update.effective_user.id
+        name = ' '.join(context.args or ())
+        if name and self.meal_templates.delete(user_id, name):
+            await update.effective_message.reply_text(f"Deleted '{name}'.")
+        else:
+            names = ', '.join(t['name'] for t in self.meal_templates.top(user_id)) or 'none'
+            await update.effective_message.reply_text(f"Usage: /forget_meal NAME\n\nSaved meals: {names}")
+    
+    @track_handler
     async def today_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /today command"""
         user_id = update.effective_user.id
@@ -741,15 +885,13 @@ class FithubBot:
         try:
             profile = self.db.get_user_profile(user_id)
             if not profile or not profile.get('daily_calories'):
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "Please complete your profile first using /start"
                 )
                 return
             
-            remaining = self.calculator.get_remaining_cpfc(
-                user_id,
-                datetime.now().strftime('%Y-%m-%d')
-            )
+            today = datetime.now().date()
+            remaining = self.calculator.get_remaining_cpfc(user_id, today.strftime('%Y-%m-%d'))
             
             if remaining:
                 progress_calories = (remaining['consumed_calories'] / remaining['target_calories']) * 100 if remaining['target_calories'] > 0 else 0
@@ -757,7 +899,7 @@ class FithubBot:
                 progress_fat = (remaining['consumed_fat'] / remaining['target_fat']) * 100 if remaining['target_fat'] > 0 else 0
                 progress_carbs = (remaining['consumed_carbs'] / remaining['target_carbs']) * 100 if remaining['target_carbs'] > 0 else 0
                 
-                await update.message.reply_html(
+                await update.effective_message.reply_html(
                     f"<b>Today's Summary</b>\n\n"
                     f"<b>Consumed / Target:</b>\n\n"
                     f"Calories: <b>{remaining['consumed_calories']:.0f}</b> / {remaining['target_calories']:.0f} kcal ({progress_calories:.0f}%)\n"
@@ -770,21 +912,252 @@ class FithubBot:
                     f"Fat: <b>{remaining['remaining_fat']:.0f} g</b>\n"
                     f"Carbs: <b>{remaining['remaining_carbs']:.0f} g</b>"
                 )
+                if self.wants_chart(context):
+                    days = self.db.get_totals('day', user_id, today - timedelta(days=6), today)
+                    await self.send_chart(update, user_id, ('today', today), today_chart(remaining, days, today))
             else:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "No data for today yet. Start tracking with /add_meal or /add_drink"
                 )
         except Exception as e:
             logger.error(f"Error in today_command: {e}", exc_info=True)
-            await update.message.reply_text("Error getting today's summary. Please try again.")
+            await update.effective_message.reply_text("Error getting today's summary. Please try again.")
+    
+    @track_handler
+    async def week_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /week command"""
+        await self.send_report(update, context, week_report, 'week')
+    
+    @track_handler
+    async def month_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /month command"""
+        await self.send_report(update, context, month_report, 'month')
+    
+    async def resolve_subject(self, update, context, command):
+        """
+        (user_id, name) whose data a command is about: the user themself, or for
+        trainers the trainee whose ID was passed. None after replying otherwise.
+        """
+        user_id = update.effective_user.id
+        profile = self.db.get_user_profile(user_id)
+        if not profile:
+            await update.effective_message.reply_text("Please complete your profile first using /start")
+            return None
+        if profile.get('user_type') != 'trainer':
+            return user_id, None
+        
+        trainee_id = next((int(arg) for arg in context.args or () if arg.isdigit()), None)
+        trainee = self.db.get_trainee(user_id, trainee_id) if trainee_id is not None else None
+        if trainee is not None:
+            return trainee['id'], trainee.get('first_name') or 'Unknown'
+        
+        # Only the first page of trainees, however many the trainer has
+        trainees = self.db.get_trainee_page(user_id, datetime.now().strftime('%Y-%m-%d'),
+                                            limit=Config.TRAINEES_PAGE_SIZE)
+        if trainees is None:
+            await update.effective_message.reply_text("Error getting trainees. Please try again.")
+            return None
+        if not trainees:
+            await update.effective_message.reply_text(
+                "You don't have any trainees yet.\n\n"
+                "Use /add_trainee to add trainees first."
+            )
+            return None
+        
+        total = trainees[0]['total']
+        trainee_list = "\n".join(
+            f"{html.escape(t.get('first_name') or 'Unknown')}: <code>/{command} {t['id']}</code>"
+            for t in trainees
+        )
+        if total > len(trainees):
+            trainee_list += f"\n\n...and {total - len(trainees)} more, see /my_trainees"
+        await update.effective_message.reply_html(f"Choose a trainee:\n\n{trainee_list}")
+        return None
+    
+    async def send_report(self, update, context, build_report, command):
+        """Send a report for the user, or for the trainee whose ID a trainer passes"""
+        try:
+            subject = await self.resolve_subject(update, context, command)
+            if subject is None:
+                return
+            subject_id, name = subject
+            
+            report = build_report(self.db, subject_id)
+            await update.effective_message.reply_html(format_report(report, name))
+            if report['summary'] is not None and self.wants_chart(context):
+                await self.send_chart(update, subject_id, (command, report['start']), report_chart(report))
+        except Exception as e:
+            logger.error(f"Error in {command} report: {e}", exc_info=True)
+            await update.effective_message.reply_text("Error building the report. Please try again.")
+    
+    @track_handler
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /export command - send the full history as a gzipped CSV or JSONL document in the background"""
+        user_id = update.effective_user.id
+        if user_id in self.exports:
+            await update.effective_message.reply_text("Your previous export is still being prepared. Please wait.")
+            return
+        try:
+            subject = await self.resolve_subject(update, context, 'export')
+        except Exception as e:
+            logger.error(f"Error in export command: {e}", exc_info=True)
+            await update.effective_message.reply_text("Error exporting history. Please try again.")
+            return
+        if subject is None:
+            return
+        subject_id, _ = subject
+        fmt = 'jsonl' if any(arg.lower() in ('json', 'jsonl') for arg in context.args or ()) else 'csv'
+        self.exports[user_id] = asyncio.create_task(self.send_export(update, user_id, subject_id, fmt))
+    
+    async def send_export(self, update, user_id, subject_id, fmt):
+        """Write and upload an export, so the user's other commands keep working meanwhile"""
+        try:
+            await update.effective_message.reply_text("Preparing your export...")
+            with tempfile.TemporaryFile() as output:
+                # Own connection and compression, so it runs off the event loop
+                rows = await asyncio.to_thread(export_history, output, subject_id, fmt)
+                if not rows:
+                    await update.effective_message.reply_text("Nothing to export yet. Start tracking with /add_meal or /add_drink")
+                    return
+                output.seek(0)
+                await update.effective_message.reply_document(
+                    output,
+                    filename=f"fithub-{subject_id}-{datetime.now():%Y-%m-%d}.{fmt}.gz",
+                    caption=f"{rows} meals, meal items and drinks"
+                )
+        except Exception as e:
+            logger.error(f"Error exporting history for user {subject_id}: {e}", exc_info=True)
+            await update.effective_message.reply_text("Error exporting history. Please try again.")
+        finally:
+            self.exports.pop(user_id, None)
     
+    @track_handler
+    async def import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /import command - wait for a CSV file exported from another tracker"""
+        if update.effective_user.id in self.imports:
+            await update.effective_message.reply_text("Your previous import is still running. Please wait.")
+            return
+        subject = await self.resolve_subject(update, context, 'import')
+        if subject is None:
+            return
+        subject_id, name = subject
+        
+        await update.effective_message.reply_html(
+            f"Send the CSV file to import{f' for {name}' if name else ''} (plain or .gz, up to 20 MB).\n\n"
+            "Expected columns: date or timestamp, name and either calories, protein, fat, carbs "
+            "or a weight/volume to estimate them. /export files work too.\n"
+            "Entries already logged are skipped.",
+            reply_markup=REMOVE_KEYBOARD
+        )
+        self.user_manager.set_user_state(update.effective_user.id, 'awaiting_import_file', {'subject_id': subject_id})
+    
+    @track_handler
+    async def handle_import_text(self, update: Update, text: str):
+        """Text while an import file is expected"""
+        await update.effective_message.reply_text("Please send the CSV file as a document, or use /cancel to stop.")
+    
+    @track_handler
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle documents - history files after /import, imported in the background"""
+        user_id = update.effective_user.id
+        if self.user_manager.get_user_state(user_id) != 'awaiting_import_file':
+            await update.effective_message.reply_text("Use /import to import history from another tracker.")
+            return
+        
+        document = update.message.document
+        if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+            await update.effective_message.reply_text("The file is too large. Please split it into files of up to 20 MB.")
+            return
+        
+        subject_id = self.user_manager.get_user_data(user_id)['subject_id']
+        self.user_manager.set_user_state(user_id, 'main_menu')
+        if user_id in self.imports:
+            await update.effective_message.reply_text("Your previous import is still running. Please wait.")
+            return
+        self.imports[user_id] = asyncio.create_task(self.run_import(update, user_id, subject_id, document))
+    
+    async def run_import(self, update, user_id, subject_id, document):
+        """Download and import a history file off the event loop, reporting progress"""
+        status = await update.effective_message.reply_text("Importing...")
+        latest = {}
+        reporter = asyncio.create_task(self.show_progress(
+            status, latest, lambda stats: f"Importing... {stats['rows']} rows read, "
+                                          f"{stats['meals'] + stats['drinks']} entries imported"
+        ))
+        try:
+            with tempfile.TemporaryFile() as source:
+                file = await document.get_file()
+                await file.download_to_memory(source)
+                source.seek(0)
+                # Own connection, one transaction per chunk, so it runs off the event loop
+                stats = await asyncio.to_thread(
+                    import_history, source, subject_id, document.file_name or '',
+                    progress=lambda stats: latest.update(stats=stats), drinks=self.drink_manager.catalog
+                )
+            reporter.cancel()
+            await status.edit_text(f"Import finished: {format_stats(stats)}.")
+        except UnsupportedFile as e:
+            reporter.cancel()
+            await update.effective_message.reply_text(f"Could not import this file: {e}\n\nUse /import to send another file.")
+        except Exception as e:
+            reporter.cancel()
+            logger.error(f"Error importing history for user {subject_id}: {e}", exc_info=True)
+            await update.effective_message.reply_text(
+                "Error importing the file. Entries imported before the error were kept; "
+                "sending the file again skips them."
+            )
+        finally:
+            self.imports.pop(user_id, None)
+            self.dashboards.forget_trainee(subject_id)
+    
+    @staticmethod
+    def wants_chart(context):
+        """Whether the command was given the 'chart' argument"""
+        return any(arg.lower() == 'chart' for arg in context.args or ())
+    
+    async def send_chart(self, update, user_id, period, chart):
+        """Send a chart, re-using the uploaded photo while its data is unchanged"""
+        key = (user_id, period, data_version(chart))
+        file_id = self.chart_cache.get(key)
+        if file_id is not None:
+            try:
+                await update.effective_message.reply_photo(file_id)
+                return
+            except BadRequest as e:
+                logger.warning("Cached chart for user %s rejected: %s", user_id, e)
+                self.chart_cache.discard(key)
+        
+        png = await render(chart, period[0])
+        message = await update.effective_message.reply_photo(png)
+        if message is not None and message.photo:
+            self.chart_cache.put(key, message.photo[-1].file_id)
+    
+    @track_handler
+    async def reminders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /reminders command - turn daily nudges on or off"""
+        user_id = update.effective_user.id
+        choice = (context.args or [''])[0].lower()
+        if choice not in ('on', 'off'):
+            profile = self.db.get_user_profile(user_id) or {}
+            state = 'on' if profile.get('reminders', True) else 'off'
+            times = ', '.join(Config.REMINDER_TIMES.values())
+            await update.effective_message.reply_text(
+                f"Reminders are {state}. They come at {times} when something is missing from your day.\n\n"
+                f"Use /reminders on or /reminders off"
+            )
+            return
+        
+        if self.db.set_reminders([user_id], choice == 'on'):
+            await update.effective_message.reply_text(f"Reminders turned {choice}.")
+        else:
+            await update.effective_message.reply_text("Error updating reminders. Please try again.")
+    
+    @track_handler
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /profile command"""
         user_id = update.effective_user.id
         profile = self.db.get_user_profile(user_id)
         
-        logger.info(f"Profile fetched for user {user_id}: {profile}")
-        
         if profile and profile.get('height'):
             activity_names = {
                 'sedentary': 'Sedentary',
@@ -800,7 +1173,7 @@ class FithubBot:
                 'weight_gain': 'Weight Gain'
             }
             
-            await update.message.reply_html(
+            await update.effective_message.reply_html(
                 f"<b>Your Profile</b>\n\n"
                 f"Height: <b>{profile.get('height', 'Not set')} cm</b>\n"
                 f"Weight: <b>{profile.get('weight', 'Not set')} kg</b>\n"
@@ -812,297 +1185,180 @@ class FithubBot:
                 f"Calories: <b>{profile.get('daily_calories', 0):.0f} kcal</b>"
             )
         else:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Profile not found. Please complete registration using /start"
             )
 
+    @track_handler
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cancel command - leave the step in progress"""
+        user_id = update.effective_user.id
+        if self.user_manager.get_user_state(user_id) in (None, 'main_menu'):
+            await update.effective_message.reply_text("Nothing to cancel. Use /help to see available commands.")
+            return
+        
+        self.user_manager.set_user_state(user_id, 'main_menu')
+        await update.effective_message.reply_text("Cancelled.", reply_markup=REMOVE_KEYBOARD)
+    
+    @track_handler
     async def restart_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /restart command - completely reset profile and clear all data"""
+        """Handle /restart command - reset the profile now and delete all history in the background"""
         user_id = update.effective_user.id
-
-        try:
-            logger.info(f"User {user_id} requested full restart")
-
-            # Clear all data from database
-            try:
-                # Ensure connection is alive
-                if self.db.conn.closed:
-                    logger.warning("Database connection was closed, reconnecting...")
-                    self.db.connect()
-
-                with self.db.conn.cursor() as cur:
-                    # Delete all meals
-                    cur.execute('DELETE FROM meals WHERE user_id = %s', (user_id,))
-                    meals_deleted = cur.rowcount
-                    logger.info(f"Deleted {meals_deleted} meals for user {user_id}")
-
-                    # Delete all drinks
-                    cur.execute('DELETE FROM drinks WHERE user_id = %s', (user_id,))
-                    drinks_deleted = cur.rowcount
-                    logger.info(f"Deleted {drinks_deleted} drinks for user {user_id}")
-
-                    # Reset profile fields to NULL (keeps user record but clears profile)
-                    cur.execute('''
-                        UPDATE users 
-                        SET height = NULL, 
-                            weight = NULL, 
-                            age = NULL, 
-                            gender = NULL, 
-                            activity_level = NULL, 
-                            goal = NULL, 
-                            daily_calories = NULL
-                        WHERE id = %s
-                    ''', (user_id,))
-                    profile_updated = cur.rowcount
-                    logger.info(f"Reset profile for user {user_id} (rows affected: {profile_updated})")
-
-                # Commit outside the cursor context
-                self.db.conn.commit()
-                logger.info(f"All data cleared and committed for user {user_id}")
-
-            except Exception as db_error:
-                logger.error(f"Database clear error: {db_error}", exc_info=True)
-                # Rollback on error
-                try:
-                    self.db.conn.rollback()
-                except:
-                    pass
-
-                # Show generic error to user
-                await update.message.reply_text(
-                    f"Error clearing data: {str(db_error)}\n\n"
-                    f"Please try again or contact support if the problem persists.",
-                    reply_markup=self.remove_keyboard()
-                )
-                return
-
-            # Clear user state in memory
-            self.user_manager.set_user_state(user_id, 'awaiting_user_type')
-
-            # Show success message
-            user = update.effective_user
-            await update.message.reply_html(
-                f"<b>Complete restart successful!</b>\n\n"
-                f"Hi, {user.first_name}!\n\n"
-                f"Your profile, meal history, and drink history have been completely cleared.\n\n"
-                f"Let's start fresh!\n\n"
-                f"Who are you?",
-                reply_markup=self.get_user_type_keyboard()
-            )
-
-            logger.info(f"User {user_id} restarted successfully")
-
-        except Exception as e:
-            logger.error(f"Critical error in restart command: {e}", exc_info=True)
-            await update.message.reply_text(
-                f"An error occurred: {str(e)}\n\n"
-                f"Please use /start to continue.",
-                reply_markup=self.remove_keyboard()
+        logger.info("User %s requested full restart", user_id)
+        
+        if user_id in self.wipes:
+            await update.effective_message.reply_text("Your previous restart is still clearing your history. Please wait.")
+            return
+        if not self.db.reset_user_profile(user_id):
+            await update.effective_message.reply_text(
+                "Error resetting your profile. Please try again or contact support if the problem persists.",
+                reply_markup=REMOVE_KEYBOARD
             )
-
-    async def add_trainee_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /add_trainee command"""
-        user_id = update.effective_user.id
-
+            return
+        
+        # Reset in memory right away; history is deleted by a background job
+        self.user_manager.set_user_state(user_id, 'awaiting_user_type')
+        self.forget_user_caches(user_id)
+        
+        user = update.effective_user
+        await update.effective_message.reply_html(
+            f"<b>Complete restart successful!</b>\n\n"
+            f"Hi, {user.first_name}!\n\n"
+            f"Your profile has been reset; your meal and drink history is being deleted.\n\n"
+            f"Let's start fresh!\n\n"
+            f"Who are you?",
+            reply_markup=USER_TYPE.markup
+        )
+        self.wipes[user_id] = asyncio.create_task(self.wipe_history(update, user_id))
+    
+    async def wipe_history(self, update, user_id):
+        """Delete a user's history in batches off the event loop, reporting progress"""
+        status = await update.effective_message.reply_text("Deleting history...")
+        latest = {}
+        reporter = asyncio.create_task(self.show_progress(
+            status, latest, lambda counts: f"Deleting history... {sum(counts.values())} entries deleted"
+        ))
         try:
-            # Check if user is a trainer
-            profile = self.db.get_user_profile(user_id)
-            if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
-                    "This command is only available for trainers.\n\n"
-                    "Please register as a trainer using /start"
-                )
-                return
-
-            await update.message.reply_text(
-                "To add a trainee, please provide their Telegram username or user ID.\n\n"
-                "<b>Format:</b>\n"
-                "@username or user_id\n\n"
-                "<b>Example:</b>\n"
-                "@john_doe\n"
-                "or\n"
-                "123456789",
-                reply_markup=self.remove_keyboard(),
-                parse_mode='HTML'
-            )
-
-            self.user_manager.set_user_state(user_id, 'awaiting_trainee_id')
-
+            counts = await asyncio.to_thread(wipe_history, user_id, progress=lambda counts: latest.update(stats=counts))
+            reporter.cancel()
+            await status.edit_text(f"History deleted: {format_wipe_counts(counts)}.")
+            logger.info("User %s restarted successfully", user_id)
         except Exception as e:
-            logger.error(f"Error in add_trainee command: {e}", exc_info=True)
-            await update.message.reply_text("Error processing command. Please try again.")
-
-    async def my_trainees_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /my_trainees command"""
-        user_id = update.effective_user.id
-
-        try:
+            reporter.cancel()
+            logger.error(f"Error deleting history for user {user_id}: {e}", exc_info=True)
+            await update.effective_message.reply_text("Error deleting your history. Use /restart to try again.")
+        finally:
+            self.wipes.pop(user_id, None)
+            self.forget_user_caches(user_id)
+    
+    def forget_user_caches(self, user_id):
+        """Drop everything cached in memory from a user's history"""
+        self.meal_templates.forget(user_id)
+        self.chart_cache.forget_user(user_id)
+        self.dashboards.forget_trainee(user_id)
+    
+    async def show_progress(self, message, latest, describe):
+        """Edit `message` with describe(latest['stats']) whenever the stats change"""
+        shown = None
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            stats = latest.get('stats')
+            if stats and stats != shown:
+                shown = stats
+                try:
+                    await message.edit_text(describe(stats))
+                except BadRequest as e:
+                    logger.debug("Progress not shown: %s", e)
+
+    def trainee_page(self, user_id, after=None, before=None):
+        """A page of a trainer's trainees with today's totals, or None for users who are not trainers"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if not self.dashboards.is_cached(user_id, today):
             # Check if user is a trainer
             profile = self.db.get_user_profile(user_id)
             if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
-                    "This command is only available for trainers.\n\n"
-                    "Please register as a trainer using /start"
-                )
-                return
-
-            # Get trainees
-            trainees = self.db.get_trainees(user_id)
-
-            if not trainees:
-                await update.message.reply_text(
-                    "You don't have any trainees yet.\n\n"
-                    "Use /add_trainee to add your first trainee!"
-                )
-                return
-
-            # Build trainee list
-            trainee_list = []
-            for i, trainee in enumerate(trainees, 1):
-                name = trainee.get('first_name', 'Unknown')
-                username = trainee.get('username', 'N/A')
-                user_type = trainee.get('user_type', 'trainee')
-
-                trainee_list.append(
-                    f"{i}. <b>{name}</b>\n"
-                    f"   Username: @{username}\n"
-                    f"   ID: <code>{trainee['id']}</code>"
-                )
-
-            trainees_text = "\n\n".join(trainee_list)
-
-            await update.message.reply_html(
-                f"<b>Your Trainees ({len(trainees)}):</b>\n\n"
-                f"{trainees_text}\n\n"
-                f"Use /stats to view their nutrition statistics."
+                return None
+        page = self.dashboards.page(user_id, today, after, before)
+        if page is None:
+            raise RuntimeError(f"Trainees of trainer {user_id} could not be loaded")
+        return page
+    
+    def format_trainees_page(self, page):
+        """The /my_trainees text for a page of trainees"""
+        trainee_list = []
+        for trainee in page.rows:
+            name = html.escape(trainee.get('first_name') or 'Unknown')
+            username = trainee.get('username') or 'N/A'
+            
+            trainee_list.append(
+                f"<b>{name}</b>\n"
+                f"   Username: @{username}\n"
+                f"   ID: <code>{trainee['id']}</code>"
             )
-
-        except Exception as e:
-            logger.error(f"Error in my_trainees command: {e}", exc_info=True)
-            await update.message.reply_text("Error getting trainees. Please try again.")
-
-    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /stats command"""
-        user_id = update.effective_user.id
-
-        try:
-            # Check if user is a trainer
-            profile = self.db.get_user_profile(user_id)
-            if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
-                    "This command is only available for trainers.\n\n"
-                    "Please register as a trainer using /start"
-                )
-                return
-
-            # Get trainees
-            trainees = self.db.get_trainees(user_id)
-
-            if not trainees:
-                await update.message.reply_text(
-                    "You don't have any trainees yet.\n\n"
-                    "Use /add_trainee to add trainees first."
+        
+        trainees_text = "\n\n".join(trainee_list)
+        return (
+            f"<b>Your Trainees ({page.total}):</b>\n\n"
+            f"{trainees_text}\n\n"
+            f"Use /stats to view their nutrition statistics."
+        )
+    
+    def format_stats_page(self, page):
+        """The /stats text for a page of trainees"""
+        stats_list = []
+        for trainee in page.rows:
+            name = html.escape(trainee.get('first_name') or 'Unknown')
+            target_cal = trainee['target_calories']
+            
+            if target_cal:
+                consumed_cal = trainee['calories']
+                progress = (consumed_cal / target_cal * 100) if target_cal > 0 else 0
+                
+                stats_list.append(
+                    f"<b>{name}</b>\n"
+                    f"Calories: {consumed_cal:.0f} / {target_cal:.0f} ({progress:.0f}%)\n"
+                    f"Protein: {trainee['protein']:.0f}g\n"
+                    f"Fat: {trainee['fat']:.0f}g\n"
+                    f"Carbs: {trainee['carbs']:.0f}g"
                 )
-                return
-
-            # Get today's date
-            today = datetime.now().strftime('%Y-%m-%d')
-
-            # Build stats for each trainee
-            stats_list = []
-            for trainee in trainees:
-                trainee_id = trainee['id']
-                name = trainee.get('first_name', 'Unknown')
-
-                # Get today's intake
-                remaining = self.calculator.get_remaining_cpfc(trainee_id, today)
-
-                if remaining:
-                    consumed_cal = remaining['consumed_calories']
-                    target_cal = remaining['target_calories']
-                    progress = (consumed_cal / target_cal * 100) if target_cal > 0 else 0
-
-                    stats_list.append(
-                        f"<b>{name}</b>\n"
-                        f"Calories: {consumed_cal:.0f} / {target_cal:.0f} ({progress:.0f}%)\n"
-                        f"Protein: {remaining['consumed_protein']:.0f}g\n"
-                        f"Fat: {remaining['consumed_fat']:.0f}g\n"
-                        f"Carbs: {remaining['consumed_carbs']:.0f}g"
-                    )
-                else:
-                    stats_list.append(
-                        f"<b>{name}</b>\n"
-                        f"No data for today"
-                    )
-
-            stats_text = "\n\n".join(stats_list)
-
-            await update.message.reply_html(
-                f"<b>Trainee Statistics (Today):</b>\n\n"
-                f"{stats_text}"
-            )
-
-        except Exception as e:
-            logger.error(f"Error in stats command: {e}", exc_info=True)
-            await update.message.reply_text("Error getting statistics. Please try again.")
-
-    async def handle_trainee_id_input(self, update: Update, text: str):
-        """Handle trainee ID input after /add_trainee"""
-        user_id = update.effective_user.id
-
-        try:
-            # Parse trainee ID (remove @ if username provided)
-            trainee_identifier = text.strip().replace('@', '')
-
-            # Try to find trainee by username or ID
-            trainee_id = None
-
-            # Check if it's a numeric ID
-            if trainee_identifier.isdigit():
-                trainee_id = int(trainee_identifier)
             else:
-                # Search by username (you may need to add a method to search by username)
-                await update.message.reply_text(
-                    "Username lookup not yet implemented.\n\n"
-                    "Please provide the trainee's numeric user ID.\n\n"
-                    "They can find their ID by messaging @userinfobot"
-                )
-                return
-
-            # Check if trainee exists
-            trainee_profile = self.db.get_user_profile(trainee_id)
-
-            if not trainee_profile:
-                await update.message.reply_text(
-                    f"User with ID {trainee_id} not found.\n\n"
-                    "Make sure they have started the bot first using /start"
+                stats_list.append(
+                    f"<b>{name}</b>\n"
+                    f"No data for today"
                 )
+        
+        stats_text = "\n\n".join(stats_list)
+        return f"<b>Trainee Statistics (Today, {page.total} trainees):</b>\n\n{stats_text}"
+    
+    @track_handler
+    async def trainee_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle Prev/Next under /my_trainees and /stats (callback data 'stats:>ID' or 'trainees:<ID')"""
+        query = update.callback_query
+        kind, _, cursor = query.data.partition(':')
+        key = int(cursor[1:])
+        after, before = (key, None) if cursor[0] == '>' else (None, key)
+        
+        try:
+            page = self.trainee_page(query.from_user.id, after, before)
+            if page is None:
+                await query.answer("This is only available for trainers.")
                 return
-
-            # Link trainer and trainee
-            success = self.db.link_trainer_trainee(user_id, trainee_id)
-
-            if success:
-                trainee_name = trainee_profile.get('first_name', 'Unknown')
-                await update.message.reply_html(
-                    f"<b>Trainee added successfully!</b>\n\n"
-                    f"Name: {trainee_name}\n"
-                    f"ID: {trainee_id}\n\n"
-                    f"You can now view their statistics using /stats"
-                )
-                self.user_manager.set_user_state(user_id, 'main_menu')
-            else:
-                await update.message.reply_text(
-                    "Error adding trainee. Please try again."
-                )
-
+            if not page.rows:
+                # The trainees changed since the page was shown; start over
+                page = self.trainee_page(query.from_user.id)
+            text = self.format_stats_page(page) if kind == 'stats' else self.format_trainees_page(page)
+            await query.edit_message_text(text, parse_mode=ParseMode.HTML,
+                                          reply_markup=self.get_page_keyboard(kind, page))
+            await query.answer()
+        except BadRequest as e:
+            # Pressed again before the message changed
+            logger.debug("Trainee page not shown: %s", e)
+            await query.answer()
         except Exception as e:
-            logger.error(f"Error handling trainee ID: {e}", exc_info=True)
-            await update.message.reply_text(
-                "Error processing trainee ID. Please try again with /add_trainee"
-            )
-            self.user_manager.set_user_state(user_id, 'main_menu')
-
+            logger.error(f"Error showing trainee page: {e}", exc_info=True)
+            await query.answer("Error getting trainees. Please try again.")
+    
+    @track_handler
     async def add_trainee_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /add_trainee command"""
         user_id = update.effective_user.id
@@ -1111,13 +1367,13 @@ class FithubBot:
             # Check if user is a trainer
             profile = self.db.get_user_profile(user_id)
             if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "This command is only available for trainers.\n\n"
                     "Please register as a trainer using /start"
                 )
                 return
 
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "To add a trainee, please provide their Telegram username or user ID.\n\n"
                 "<b>Format:</b>\n"
                 "@username or user_id\n\n"
@@ -1125,7 +1381,7 @@ class FithubBot:
                 "@john_doe\n"
                 "or\n"
                 "123456789",
-                reply_markup=self.remove_keyboard(),
+                reply_markup=REMOVE_KEYBOARD,
                 parse_mode='HTML'
             )
 
@@ -1133,122 +1389,148 @@ class FithubBot:
 
         except Exception as e:
             logger.error(f"Error in add_trainee command: {e}", exc_info=True)
-            await update.message.reply_text("Error processing command. Please try again.")
+            await update.effective_message.reply_text("Error processing command. Please try again.")
 
+    @track_handler
     async def my_trainees_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /my_trainees command"""
         user_id = update.effective_user.id
 
         try:
-            # Check if user is a trainer
-            profile = self.db.get_user_profile(user_id)
-            if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
+            page = self.trainee_page(user_id)
+            if page is None:
+                await update.effective_message.reply_text(
                     "This command is only available for trainers.\n\n"
                     "Please register as a trainer using /start"
                 )
                 return
 
-            # Get trainees
-            trainees = self.db.get_trainees(user_id)
-
-            if not trainees:
-                await update.message.reply_text(
+            if not page.rows:
+                await update.effective_message.reply_text(
                     "You don't have any trainees yet.\n\n"
                     "Use /add_trainee to add your first trainee!"
                 )
                 return
 
-            # Build trainee list
-            trainee_list = []
-            for i, trainee in enumerate(trainees, 1):
-                name = trainee.get('first_name', 'Unknown')
-                username = trainee.get('username', 'N/A')
-                user_type = trainee.get('user_type', 'trainee')
-
-                trainee_list.append(
-                    f"{i}. <b>{name}</b>\n"
-                    f"   Username: @{username}\n"
-                    f"   ID: <code>{trainee['id']}</code>"
-                )
-
-            trainees_text = "\n\n".join(trainee_list)
-
-            await update.message.reply_html(
-                f"<b>Your Trainees ({len(trainees)}):</b>\n\n"
-                f"{trainees_text}\n\n"
-                f"Use /stats to view their nutrition statistics."
+            await update.effective_message.reply_html(
+                self.format_trainees_page(page), reply_markup=self.get_page_keyboard('trainees', page)
             )
 
         except Exception as e:
             logger.error(f"Error in my_trainees command: {e}", exc_info=True)
-            await update.message.reply_text("Error getting trainees. Please try again.")
+            await update.effective_message.reply_text("Error getting trainees. Please try again.")
 
+    @track_handler
+    async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast command - send a message or photo to every trainee"""
+        user_id = update.effective_user.id
+        
+        profile = self.db.get_user_profile(user_id)
+        if not profile or profile.get('user_type') != 'trainer':
+            await update.effective_message.reply_text(
+                "This command is only available for trainers.\n\n"
+                "Please register as a trainer using /start"
+            )
+            return
+        if user_id in self.broadcasts:
+            await update.effective_message.reply_text("Your previous broadcast is still being sent. Please wait.")
+            return
+        
+        trainee_ids = [trainee['id'] for trainee in self.db.get_trainees(user_id)]
+        if not trainee_ids:
+            await update.effective_message.reply_text(
+                "You don't have any trainees yet.\n\n"
+                "Use /add_trainee to add your first trainee!"
+            )
+            return
+        
+        # Text after the command keeps its line breaks
+        text = update.message.text.partition(' ')[2].strip()
+        if text:
+            await self.start_broadcast(update, user_id, trainee_ids, text=text)
+            return
+        await update.effective_message.reply_text(
+            f"Send the message or photo (with a caption) for your {len(trainee_ids)} trainees, "
+            f"or use /cancel to stop.",
+            reply_markup=REMOVE_KEYBOARD
+        )
+        self.user_manager.set_user_state(user_id, 'awaiting_broadcast', {'trainee_ids': trainee_ids})
+    
+    @track_handler
+    async def handle_broadcast_text(self, update: Update, text: str):
+        """Handle the message to broadcast after /broadcast"""
+        user_id = update.effective_user.id
+        trainee_ids = self.user_manager.get_user_data(user_id)['trainee_ids']
+        await self.start_broadcast(update, user_id, trainee_ids, text=text)
+    
+    async def start_broadcast(self, update, trainer_id, trainee_ids, text=None, file_id=None):
+        """Send a broadcast in the background, so the trainer's other commands keep working"""
+        self.user_manager.set_user_state(trainer_id, 'main_menu')
+        if trainer_id in self.broadcasts:
+            await update.effective_message.reply_text("Your previous broadcast is still being sent. Please wait.")
+            return
+        self.broadcasts[trainer_id] = asyncio.create_task(
+            self.send_broadcast(update, trainer_id, trainee_ids, text, file_id)
+        )
+    
+    async def send_broadcast(self, update, trainer_id, trainee_ids, text, file_id):
+        """Deliver a broadcast and report the outcome to the trainer"""
+        total = len(trainee_ids)
+        status = await update.effective_message.reply_text(f"Sending to {total} trainees...")
+        latest = {}
+        reporter = asyncio.create_task(self.show_progress(
+            status, latest, lambda counts: f"Sending to {total} trainees... {sum(counts.values())} done"
+        ))
+        try:
+            counts = await run_broadcast(
+                update.get_bot(), trainer_id, update.effective_user.first_name, trainee_ids, text, file_id,
+                progress=lambda counts: latest.update(stats=counts)
+            )
+            reporter.cancel()
+            report = f"Broadcast delivered to {counts['sent']} of {total} trainees."
+            if counts['blocked']:
+                report += f"\n{counts['blocked']} have blocked the bot."
+            if counts['failed']:
+                report += f"\n{counts['failed']} could not be reached."
+            await status.edit_text(report)
+        except Exception as e:
+            reporter.cancel()
+            logger.error(f"Error broadcasting for trainer {trainer_id}: {e}", exc_info=True)
+            await update.effective_message.reply_text("Error sending the broadcast. Some trainees may not have received it.")
+        finally:
+            self.broadcasts.pop(trainer_id, None)
+    
+    @track_handler
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /stats command"""
         user_id = update.effective_user.id
 
         try:
-            # Check if user is a trainer
-            profile = self.db.get_user_profile(user_id)
-            if not profile or profile.get('user_type') != 'trainer':
-                await update.message.reply_text(
+            # Today's totals, a page at a time; read from memory once cached
+            page = self.trainee_page(user_id)
+            if page is None:
+                await update.effective_message.reply_text(
                     "This command is only available for trainers.\n\n"
                     "Please register as a trainer using /start"
                 )
                 return
 
-            # Get trainees
-            trainees = self.db.get_trainees(user_id)
-
-            if not trainees:
-                await update.message.reply_text(
+            if not page.rows:
+                await update.effective_message.reply_text(
                     "You don't have any trainees yet.\n\n"
                     "Use /add_trainee to add trainees first."
                 )
                 return
 
-            # Get today's date
-            today = datetime.now().strftime('%Y-%m-%d')
-
-            # Build stats for each trainee
-            stats_list = []
-            for trainee in trainees:
-                trainee_id = trainee['id']
-                name = trainee.get('first_name', 'Unknown')
-
-                # Get today's intake
-                remaining = self.calculator.get_remaining_cpfc(trainee_id, today)
-
-                if remaining:
-                    consumed_cal = remaining['consumed_calories']
-                    target_cal = remaining['target_calories']
-                    progress = (consumed_cal / target_cal * 100) if target_cal > 0 else 0
-
-                    stats_list.append(
-                        f"<b>{name}</b>\n"
-                        f"Calories: {consumed_cal:.0f} / {target_cal:.0f} ({progress:.0f}%)\n"
-                        f"Protein: {remaining['consumed_protein']:.0f}g\n"
-                        f"Fat: {remaining['consumed_fat']:.0f}g\n"
-                        f"Carbs: {remaining['consumed_carbs']:.0f}g"
-                    )
-                else:
-                    stats_list.append(
-                        f"<b>{name}</b>\n"
-                        f"No data for today"
-                    )
-
-            stats_text = "\n\n".join(stats_list)
-
-            await update.message.reply_html(
-                f"<b>Trainee Statistics (Today):</b>\n\n"
-                f"{stats_text}"
+            await update.effective_message.reply_html(
+                self.format_stats_page(page), reply_markup=self.get_page_keyboard('stats', page)
             )
 
         except Exception as e:
             logger.error(f"Error in stats command: {e}", exc_info=True)
-            await update.message.reply_text("Error getting statistics. Please try again.")
+            await update.effective_message.reply_text("Error getting statistics. Please try again.")
 
+    @track_handler
     async def handle_trainee_id_input(self, update: Update, text: str):
         """Handle trainee ID input after /add_trainee"""
         user_id = update.effective_user.id
@@ -1265,7 +1547,7 @@ class FithubBot:
                 trainee_id = int(trainee_identifier)
             else:
                 # Search by username (you may need to add a method to search by username)
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "Username lookup not yet implemented.\n\n"
                     "Please provide the trainee's numeric user ID.\n\n"
                     "They can find their ID by messaging @userinfobot"
@@ -1276,7 +1558,7 @@ class FithubBot:
             trainee_profile = self.db.get_user_profile(trainee_id)
 
             if not trainee_profile:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     f"User with ID {trainee_id} not found.\n\n"
                     "Make sure they have started the bot first using /start"
                 )
@@ -1286,8 +1568,9 @@ class FithubBot:
             success = self.db.link_trainer_trainee(user_id, trainee_id)
 
             if success:
+                self.dashboards.forget(user_id)
                 trainee_name = trainee_profile.get('first_name', 'Unknown')
-                await update.message.reply_html(
+                await update.effective_message.reply_html(
                     f"<b>Trainee added successfully!</b>\n\n"
                     f"Name: {trainee_name}\n"
                     f"ID: {trainee_id}\n\n"
@@ -1295,17 +1578,18 @@ class FithubBot:
                 )
                 self.user_manager.set_user_state(user_id, 'main_menu')
             else:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     "Error adding trainee. Please try again."
                 )
 
         except Exception as e:
             logger.error(f"Error handling trainee ID: {e}", exc_info=True)
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Error processing trainee ID. Please try again with /add_trainee"
             )
             self.user_manager.set_user_state(user_id, 'main_menu')
 
+    @track_handler
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
         user_id = update.effective_user.id
@@ -1316,9 +1600,19 @@ class FithubBot:
             "<b>Available Commands:</b>\n\n"
             "/start - Start/Register bot\n"
             "/restart - Reset your profile\n"
+            "/cancel - Cancel the current step\n"
             "/add_meal - Add meal\n"
             "/add_drink - Add drink\n"
+            "/repeat - Log a saved or recent meal again\n"
+            "/save_meal NAME - Save your last meal for /repeat\n"
+            "/forget_meal NAME - Delete a saved meal\n"
             "/today - Today's summary\n"
+            "/week - This week's report\n"
+            "/month - This month's report\n"
+            "(add 'chart' to any of these for a chart)\n"
+            "/export - Download your history (add 'json' for JSON lines)\n"
+            "/import - Import history from another tracker's CSV\n"
+            "/reminders - Turn daily reminders on or off\n"
             "/profile - View profile\n"
             "/help - This help message\n"
         )
@@ -1329,7 +1623,11 @@ class FithubBot:
                 "\n<b>Trainer Commands:</b>\n\n"
                 "/add_trainee - Add a trainee\n"
                 "/my_trainees - View your trainees\n"
+                "/broadcast - Message all your trainees\n"
                 "/stats - View trainee statistics\n"
+                "/week ID, /month ID - Trainee reports\n"
+                "/export ID - Download a trainee's history\n"
+                "/import ID - Import a trainee's history\n"
             )
 
         help_text += (
@@ -1340,7 +1638,7 @@ class FithubBot:
             "4. Achieve your goals!"
         )
 
-        await update.message.reply_html(help_text)
+        await update.effective_message.reply_html(help_text)
 
 
 def main():
@@ -1356,24 +1654,79 @@ def main():
         if not Config.DATABASE_URL:
             raise ValueError("DATABASE_URL is not set")
         
-        application = Application.builder().token(Config.BOT_TOKEN).build()
+        if Config.METRICS_PORT:
+            if profiler.enabled:
+                register_page('/queries', profiler.report)
+            start_metrics_server(Config.METRICS_PORT, Config.METRICS_HOST)
+        
+        application = (
+            Application.builder()
+            .token(Config.BOT_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(Config.MAX_CONCURRENT_UPDATES))
+            .rate_limiter(Outbox())
+            .build()
+        )
         logger.info("Application builder configured")
         
+        # Throttle before any regular handler runs
+        if Config.RATE_LIMITING:
+            rate_limiter = RateLimiter(user_state=bot.user_manager.get_user_state)
+            application.add_handler(TypeHandler(Update, rate_limiter.check), group=-1)
+        
         # Register command handlers BEFORE message handlers
-        application.add_handler(CommandHandler("start", bot.start))
-        application.add_handler(CommandHandler("restart", bot.restart_command))
-        application.add_handler(CommandHandler("add_meal", bot.add_meal_command))
-        application.add_handler(CommandHandler("add_drink", bot.add_drink_command))
-        application.add_handler(CommandHandler("today", bot.today_command))
-        application.add_handler(CommandHandler("profile", bot.profile_command))
-        application.add_handler(CommandHandler("help", bot.help_command))
-        application.add_handler(CommandHandler("add_trainee", bot.add_trainee_command))
-        application.add_handler(CommandHandler("my_trainees", bot.my_trainees_command))
-        application.add_handler(CommandHandler("stats", bot.stats_command))
+        application.add_handler(CommandHandler("start", profiled(bot.start)))
+        application.add_handler(CommandHandler("restart", profiled(bot.restart_command)))
+        application.add_handler(CommandHandler("cancel", profiled(bot.cancel_command)))
+        application.add_handler(CommandHandler("add_meal", profiled(bot.add_meal_command)))
+        application.add_handler(CommandHandler("add_drink", profiled(bot.add_drink_command)))
+        application.add_handler(CommandHandler("repeat", profiled(bot.repeat_command)))
+        application.add_handler(CommandHandler("save_meal", profiled(bot.save_meal_command)))
+        application.add_handler(CommandHandler("forget_meal", profiled(bot.forget_meal_command)))
+        application.add_handler(CommandHandler("today", profiled(bot.today_command)))
+        application.add_handler(CommandHandler("week", profiled(bot.week_command)))
+        application.add_handler(CommandHandler("month", profiled(bot.month_command)))
+        application.add_handler(CommandHandler("export", profiled(bot.export_command)))
+        application.add_handler(CommandHandler("import", profiled(bot.import_command)))
+        application.add_handler(CommandHandler("reminders", profiled(bot.reminders_command)))
+        application.add_handler(CommandHandler("profile", profiled(bot.profile_command)))
+        application.add_handler(CommandHandler("help", profiled(bot.help_command)))
+        application.add_handler(CommandHandler("add_trainee", profiled(bot.add_trainee_command)))
+        application.add_handler(CommandHandler("my_trainees", profiled(bot.my_trainees_command)))
+        application.add_handler(CommandHandler("broadcast", profiled(bot.broadcast_command)))
+        application.add_handler(CommandHandler("stats", profiled(bot.stats_command)))
 
         # Message handlers
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
-        application.add_handler(MessageHandler(filters.PHOTO, bot.handle_photo))
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, profiled(bot.handle_message)))
+        application.add_handler(MessageHandler(filters.PHOTO, profiled(bot.handle_photo)))
+        application.add_handler(MessageHandler(filters.Document.ALL, profiled(bot.handle_document)))
+        application.add_handler(CallbackQueryHandler(
+            profiled(bot.trainee_page_callback), pattern=r'^(stats|trainees):[<>]\d+$'
+        ))
+        application.add_handler(CallbackQueryHandler(
+            profiled(bot.handle_menu_callback), pattern=rf"^({'|'.join(sorted(bot.router.prefixes))}):"
+        ))
+        
+        if application.job_queue is not None:
+            application.job_queue.run_repeating(
+                bot.drink_manager.refresh_job,
+                interval=Config.CUSTOM_DRINKS_REFRESH_MINUTES * 60,
+                first=0,
+                name='refresh_custom_drinks'
+            )
+            application.job_queue.run_repeating(
+                bot.dashboards.check,
+                interval=Config.DASHBOARD_CHECK_MINUTES * 60,
+                first=Config.DASHBOARD_CHECK_MINUTES * 60,
+                name='dashboard_checks'
+            )
+            if Config.REMINDERS:
+                # One job for every user's reminders
+                application.job_queue.run_repeating(
+                    ReminderScheduler().tick, interval=TICK_SECONDS, first=TICK_SECONDS, name='reminders'
+                )
+        else:
+            logger.warning("JobQueue unavailable (install python-telegram-bot[job-queue]); "
+                           "custom drinks not loaded, no reminders or dashboard checks")
         
         logger.info("All handlers registered")
         logger.info("Bot starting polling...")
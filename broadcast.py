@@ -0,0 +1,135 @@
+"""
+Trainer broadcasts: one message or photo fanned out to every trainee.
+
+Messages go through the outbox's bulk lane, so replies to everyone keep
+priority and Telegram's limits hold however many trainees there are. A
+photo is sent by the file_id Telegram gave the trainer's upload, so it
+is never uploaded again. Each trainee's outcome is recorded in
+broadcast_deliveries with batched inserts on a dedicated connection,
+off the event loop.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from time import perf_counter
+
+from psycopg2.extras import execute_values
+from telegram.error import Forbidden, TelegramError
+
+from config import Config
+from database import dedicated_connection
+from metrics import Counter, Histogram, registry
+from outbox import BULK, BULK_CHUNK
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_DELIVERIES = registry.register(Counter(
+    'fithub_broadcast_deliveries_total', 'Broadcast messages by result', ['result']))
+BROADCAST_LATENCY = registry.register(Histogram(
+    'fithub_broadcast_seconds', 'Time to deliver a broadcast to every trainee'))
+
+RESULTS = ('sent', 'blocked', 'failed')
+
+# Telegram's limits for message text and photo captions
+TEXT_LIMIT, CAPTION_LIMIT = 4096, 1024
+
+
+def create_broadcast(conn, trainer_id, recipients, text, file_id):
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO broadcasts (trainer_id, text, file_id, recipients)
+            VALUES (%s, %s, %s, %s) RETURNING id
+        ''', (trainer_id, text, file_id, recipients))
+        broadcast_id = cur.fetchone()[0]
+    conn.commit()
+    return broadcast_id
+
+
+def write_deliveries(conn, broadcast_id, deliveries):
+    """Record (trainee_id, status, error, delivered_at) rows in one statement"""
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, '''
+                INSERT INTO broadcast_deliveries (broadcast_id, trainee_id, status, error, delivered_at)
+                VALUES %s
+                ON CONFLICT (broadcast_id, trainee_id) DO UPDATE SET
+                    status = EXCLUDED.status, error = EXCLUDED.error, delivered_at = EXCLUDED.delivered_at
+            ''', [(broadcast_id,) + delivery for delivery in deliveries], page_size=len(deliveries))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Error recording deliveries of broadcast {broadcast_id}: {e}")
+        conn.rollback()
+        raise
+
+
+def finish_broadcast(conn, broadcast_id, counts):
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE broadcasts SET sent = %(sent)s, blocked = %(blocked)s, failed = %(failed)s,
+                                  finished_at = CURRENT_TIMESTAMP
+            WHERE id = %(id)s
+        ''', dict(counts, id=broadcast_id))
+    conn.commit()
+
+
+def compose(sender, text, photo):
+    """The text or caption trainees receive, cut to Telegram's limit"""
+    heading = f"Message from your trainer {sender}"
+    body = f"{heading}:\n\n{text}" if text else heading
+    return body[:CAPTION_LIMIT if photo else TEXT_LIMIT]
+
+
+async def deliver(bot, chat_id, text, file_id=None):
+    """Send one broadcast message; returns (status, error)"""
+    try:
+        if file_id:
+            await bot.send_photo(chat_id, file_id, caption=text, rate_limit_args=BULK)
+        else:
+            await bot.send_message(chat_id, text, rate_limit_args=BULK)
+        return 'sent', None
+    except Forbidden as e:
+        return 'blocked', str(e)
+    except TelegramError as e:
+        logger.warning("Broadcast to %s failed: %s", chat_id, e)
+        return 'failed', str(e)
+
+
+async def run_broadcast(bot, trainer_id, sender, trainee_ids, text=None, file_id=None, progress=None, conn=None):
+    """
+    Deliver a text or photo (by file_id, with `text` as caption) to every
+    trainee; returns counts by result. `progress(counts)` is called after
+    every chunk.
+    """
+    own_conn = conn is None
+    conn = conn or await asyncio.to_thread(dedicated_connection)
+    start = perf_counter()
+    counts = dict.fromkeys(RESULTS, 0)
+    try:
+        broadcast_id = await asyncio.to_thread(create_broadcast, conn, trainer_id, len(trainee_ids), text, file_id)
+        message = compose(sender, text, file_id)
+        pending = []
+        for i in range(0, len(trainee_ids), BULK_CHUNK):
+            chunk = trainee_ids[i:i + BULK_CHUNK]
+            results = await asyncio.gather(*(deliver(bot, chat_id, message, file_id) for chat_id in chunk))
+            now = datetime.now()
+            for chat_id, (status, error) in zip(chunk, results):
+                counts[status] += 1
+                pending.append((chat_id, status, error, now))
+            if len(pending) >= Config.BROADCAST_WRITE_BATCH:
+                await asyncio.to_thread(write_deliveries, conn, broadcast_id, pending)
+                pending = []
+            if progress is not None:
+                progress(dict(counts))
+        if pending:
+            await asyncio.to_thread(write_deliveries, conn, broadcast_id, pending)
+        await asyncio.to_thread(finish_broadcast, conn, broadcast_id, counts)
+    finally:
+        if own_conn:
+            conn.close()
+
+    for result, count in counts.items():
+        BROADCAST_DELIVERIES.inc((result,), count)
+    elapsed = perf_counter() - start
+    BROADCAST_LATENCY.observe(elapsed)
+    logger.info("Broadcast %s from trainer %s delivered in %.1fs: %s", broadcast_id, trainer_id, elapsed, counts)
+    return counts
@@ -0,0 +1,205 @@
+"""
+PNG progress charts: macro bars against targets and a calorie trend line.
+
+Charts are drawn with Pillow and NumPy in a process pool, off the event
+loop. A chart is described by a plain dict (title, macro bars, trend
+points); its data version is a digest of that dict, so once a chart has
+been uploaded, asking again for unchanged data re-sends the Telegram
+file_id instead of rendering and uploading it again.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from time import perf_counter
+
+import nutrition
+from config import Config
+from metrics import Histogram, record_cache, registry
+from reports import average_calories
+
+logger = logging.getLogger(__name__)
+
+CHART_RENDER = registry.register(Histogram(
+    'fithub_chart_render_seconds', 'Chart rendering time in the worker pool', ['chart']))
+
+WIDTH, HEIGHT = 800, 560
+BACKGROUND = (255, 255, 255)
+TEXT = (40, 40, 40)
+GRID = (225, 225, 225)
+TARGET = (200, 60, 60)
+COLORS = {
+    'Calories': (90, 110, 230),
+    'Protein': (70, 170, 110),
+    'Fat': (240, 170, 50),
+    'Carbs': (150, 110, 200),
+}
+
+
+def macro_bars(calories, protein, fat, carbs, target_calories):
+    """(label, value, target) bars for consumed values against the calorie target's macros"""
+    targets = (target_calories,) + nutrition.macro_grams(target_calories) if target_calories else (None,) * 4
+    return [
+        (label, value, target)
+        for label, value, target in zip(('Calories', 'Protein', 'Fat', 'Carbs'), (calories, protein, fat, carbs), targets)
+    ]
+
+
+def today_chart(remaining, days, today):
+    """Chart for /today: today's macros and the last week's calories"""
+    by_date = {row['start']: row['calories'] for row in days}
+    trend = []
+    for n in range(6, -1, -1):
+        day = today - timedelta(days=n)
+        trend.append((f"{day:%a}", remaining['consumed_calories'] if n == 0 else by_date.get(day)))
+    return {
+        'title': f"Today, {today:%d %b}",
+        'bars': macro_bars(remaining['consumed_calories'], remaining['consumed_protein'],
+                           remaining['consumed_fat'], remaining['consumed_carbs'], remaining['target_calories']),
+        'trend': trend,
+        'target': remaining['target_calories'],
+    }
+
+
+def report_chart(report):
+    """Chart for a week or month report: average macros per logged day and the calorie series"""
+    summary = report['summary']
+    days = summary['days_logged']
+    trend = [
+        (label.replace('Week of ', ''), None if row is None else average_calories(row))
+        for label, row in report['series']
+    ]
+    return {
+        'title': report['title'],
+        'bars': macro_bars(summary['calories'] / days, summary['protein'] / days,
+                           summary['fat'] / days, summary['carbs'] / days, summary['target_calories']),
+        'trend': trend,
+        'target': summary['target_calories'],
+    }
+
+
+def data_version(chart):
+    """Digest of everything drawn on the chart"""
+    return hashlib.blake2b(repr(chart).encode(), digest_size=8).hexdigest()
+
+
+def render_png(chart):
+    """Draw a chart dict as PNG bytes"""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new('RGB', (WIDTH, HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    draw.text((20, 15), chart['title'], fill=TEXT, font=font)
+
+    # Macro bars, full width = target, capped at 150%
+    left, right, top = 110, WIDTH - 40, 45
+    scale = (right - left) / 1.5
+    for i, (label, value, target) in enumerate(chart['bars']):
+        y = top + i * 34
+        draw.text((20, y + 6), label, fill=TEXT, font=font)
+        draw.rectangle((left, y, right, y + 22), fill=GRID)
+        if target:
+            share = min(value / target, 1.5)
+            draw.rectangle((left, y, left + share * scale, y + 22), fill=COLORS[label])
+            draw.line((left + scale, y - 3, left + scale, y + 25), fill=TARGET, width=2)
+            caption = f"{value:.0f} / {target:.0f} ({value / target * 100:.0f}%)"
+        else:
+            caption = f"{value:.0f}"
+        draw.text((left + 8, y + 6), caption, fill=TEXT, font=font)
+
+    # Calorie trend with the target as a horizontal line
+    left, right, top, bottom = 70, WIDTH - 40, 200, HEIGHT - 50
+    labels = [label for label, _ in chart['trend']]
+    values = np.array([np.nan if value is None else value for _, value in chart['trend']], dtype=np.float64)
+    known = values[~np.isnan(values)]
+    high = max(known.max() if len(known) else 0, chart['target'] or 0) * 1.15 or 1
+    xs = np.linspace(left, right, len(values)) if len(values) > 1 else np.array([(left + right) / 2])
+    ys = bottom - values / high * (bottom - top)
+
+    for fraction in (0, 0.25, 0.5, 0.75, 1):
+        y = bottom - fraction * (bottom - top)
+        draw.line((left, y, right, y), fill=GRID)
+        draw.text((15, y - 6), f"{high * fraction:.0f}", fill=TEXT, font=font)
+    if chart['target']:
+        y = bottom - chart['target'] / high * (bottom - top)
+        for x in range(left, right, 16):
+            draw.line((x, y, min(x + 8, right), y), fill=TARGET, width=2)
+
+    color = COLORS['Calories']
+    for i in range(len(values) - 1):
+        if not np.isnan(ys[i]) and not np.isnan(ys[i + 1]):
+            draw.line((xs[i], ys[i], xs[i + 1], ys[i + 1]), fill=color, width=3)
+    step = max(1, len(labels) // 12)
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        if not np.isnan(y):
+            draw.ellipse((x - 4, y - 4, x + 4, y + 4), fill=color)
+        if i % step == 0:
+            draw.text((x - 12, bottom + 10), labels[i], fill=TEXT, font=font)
+
+    out = io.BytesIO()
+    image.save(out, format='PNG', optimize=False)
+    return out.getvalue()
+
+
+def _render_timed(chart):
+    start = perf_counter()
+    png = render_png(chart)
+    return png, perf_counter() - start
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared rendering pool, started on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned workers do not inherit the bot's threads and locks
+                _pool = ProcessPoolExecutor(Config.CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+async def render(chart, kind):
+    """Render a chart in the worker pool"""
+    png, seconds = await asyncio.get_running_loop().run_in_executor(get_pool(), _render_timed, chart)
+    CHART_RENDER.observe(seconds, (kind,))
+    logger.debug("Rendered %s chart in %.3fs (%d bytes)", kind, seconds, len(png))
+    return png
+
+
+class ChartCache:
+    """LRU map of (user, range, data version) -> Telegram file_id of the uploaded chart"""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or Config.CHART_CACHE_SIZE
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        file_id = self.entries.get(key)
+        record_cache('chart', file_id is not None)
+        if file_id is not None:
+            self.entries.move_to_end(key)
+        return file_id
+
+    def put(self, key, file_id):
+        self.entries[key] = file_id
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def forget_user(self, user_id):
+        for key in [key for key in self.entries if key[0] == user_id]:
+            del self.entries[key]
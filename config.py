@@ -6,8 +6,95 @@ load_dotenv()
 class Config:
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     DATABASE_URL = os.getenv('DATABASE_URL')
+    DATABASE_SSLMODE = os.getenv('DATABASE_SSLMODE', 'require')
     GOOGLE_VISION_API_KEY = os.getenv('GOOGLE_VISION_API_KEY')
     
+    # Local Prometheus-style /metrics endpoint (disabled when port is not set)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0')) or None
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    
+    # Logging: 'text' or 'json' records, per call-site sampling and rate limit
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', '0'))  # records per call site per minute, 0 = unlimited
+    LOG_REDACT = os.getenv('LOG_REDACT', '1') != '0'
+    
+    # Per-update SQL profiling (report served on /queries next to /metrics)
+    QUERY_PROFILING = os.getenv('QUERY_PROFILING', '0') == '1'
+    QUERY_PROFILING_N_PLUS_ONE = int(os.getenv('QUERY_PROFILING_N_PLUS_ONE', '3'))
+    
+    # Updates processed concurrently; one user's updates always run in order
+    MAX_CONCURRENT_UPDATES = max(1, int(os.getenv('MAX_CONCURRENT_UPDATES', '16')))
+    
+    # Token buckets per user: operation -> (tokens per minute, burst)
+    RATE_LIMITING = os.getenv('RATE_LIMITING', '1') != '0'
+    RATE_LIMITS = {
+        'update': (60, 20),   # any message
+        'photo': (6, 3),      # photo analysis
+        'stats': (10, 3),
+        'restart': (2, 1),
+        'export': (2, 2),
+        'import': (2, 2),
+        'broadcast': (2, 1)
+    }
+    VISION_MAX_QPS = float(os.getenv('VISION_MAX_QPS', '5'))  # all users together, 0 = unlimited
+    
+    # Meal, drink and trainee dialogs are abandoned after this long in one step
+    STATE_TIMEOUT = int(os.getenv('STATE_TIMEOUT_MINUTES', '30')) * 60
+    
+    # Reload of the custom_drinks table
+    CUSTOM_DRINKS_REFRESH_MINUTES = int(os.getenv('CUSTOM_DRINKS_REFRESH_MINUTES', '10'))
+    
+    # A day counts towards adherence when calories are within this share of target
+    ADHERENCE_TOLERANCE = float(os.getenv('ADHERENCE_TOLERANCE', '0.1'))
+    
+    # Chart rendering processes and uploaded charts remembered by file_id
+    CHART_WORKERS = max(1, int(os.getenv('CHART_WORKERS', '2')))
+    CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', '10000'))
+    
+    # History export: rows per server-side cursor round trip, gzip level
+    EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '2000'))
+    EXPORT_COMPRESSLEVEL = int(os.getenv('EXPORT_COMPRESSLEVEL', '6'))
+    
+    # History import: rows per COPY and transaction
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '5000'))
+    
+    # /restart deletes history this many rows per transaction
+    WIPE_BATCH_SIZE = int(os.getenv('WIPE_BATCH_SIZE', '1000'))
+    
+    # Outgoing Bot API requests: per second overall (Telegram allows about 30),
+    # seconds between bulk messages to one chat, retries after a 429
+    TELEGRAM_MAX_RPS = float(os.getenv('TELEGRAM_MAX_RPS', '29'))
+    TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1'))
+    TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+    
+    # Daily nudges: time of each, minimum protein share by its nudge, users
+    # counted as active (logged within these days)
+    REMINDERS = os.getenv('REMINDERS', '1') != '0'
+    REMINDER_TIMES = {
+        'lunch': os.getenv('REMINDER_LUNCH_TIME', '14:00'),
+        'protein': os.getenv('REMINDER_PROTEIN_TIME', '18:00'),
+        'evening': os.getenv('REMINDER_EVENING_TIME', '21:00'),
+    }
+    REMINDER_PROTEIN_SHARE = float(os.getenv('REMINDER_PROTEIN_SHARE', '0.4'))
+    REMINDER_ACTIVE_DAYS = int(os.getenv('REMINDER_ACTIVE_DAYS', '7'))
+    
+    # Trainer broadcasts: delivery rows written per INSERT
+    BROADCAST_WRITE_BATCH = int(os.getenv('BROADCAST_WRITE_BATCH', '500'))
+    
+    # Trainer dashboards: trainers cached, trainees per cached trainer, trainees per /stats page,
+    # minutes between checks against the database
+    DASHBOARD_CACHE_TRAINERS = int(os.getenv('DASHBOARD_CACHE_TRAINERS', '1000'))
+    DASHBOARD_MAX_TRAINEES = int(os.getenv('DASHBOARD_MAX_TRAINEES', '1000'))
+    TRAINEES_PAGE_SIZE = int(os.getenv('TRAINEES_PAGE_SIZE', '10'))
+    DASHBOARD_CHECK_MINUTES = int(os.getenv('DASHBOARD_CHECK_MINUTES', '15'))
+    
+    # Meal templates: shown and cached per user, users cached, recent meals offered by /repeat
+    MEAL_TEMPLATES_TOP_N = int(os.getenv('MEAL_TEMPLATES_TOP_N', '6'))
+    MEAL_TEMPLATE_CACHE_USERS = int(os.getenv('MEAL_TEMPLATE_CACHE_USERS', '10000'))
+    RECENT_MEALS = int(os.getenv('RECENT_MEALS', '4'))
+    
     # CPFC recommendations (calories per kg of body weight)
     CALORIES_PER_KG = {
         'weight_loss': 30,
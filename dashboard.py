@@ -0,0 +1,276 @@
+"""
+Trainer dashboards: today's progress of every trainee, held in memory.
+
+A trainer's snapshot is built with one query over trainer_trainee, users
+and daily_totals, then patched in place as trainees log meals and drinks
+or change their profile, so /stats and /my_trainees page through it
+without a query. Trainers with more than DASHBOARD_MAX_TRAINEES trainees
+are not cached; each of their pages is one keyset query instead. A
+repeating job re-reads the cached snapshots and replaces any that
+drifted from the database; writes from other processes (such as
+recompute_targets) only reach the cache that way.
+"""
+import asyncio
+import logging
+import math
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict, namedtuple
+from time import perf_counter
+
+from psycopg2.extras import RealDictCursor
+
+from config import Config
+from database import TRAINER_DASHBOARD, dedicated_connection, get_db
+from metrics import Counter, Gauge, Histogram, record_cache, registry
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_TRAINERS = registry.register(Gauge(
+    'fithub_dashboard_cache_trainers', 'Trainers whose dashboard is held in memory'))
+DASHBOARD_DRIFT = registry.register(Counter(
+    'fithub_dashboard_drift_total', 'Cached dashboards found to differ from the database'))
+DASHBOARD_CHECK = registry.register(Histogram(
+    'fithub_dashboard_check_seconds', 'Time to check every cached dashboard against the database'))
+
+INTAKE = ('calories', 'protein', 'fat', 'carbs')
+
+# users column -> dashboard field
+PROFILE_FIELDS = {'first_name': 'first_name', 'username': 'username', 'daily_calories': 'target_calories'}
+
+
+# rows: trainees on the page; total: all of the trainer's trainees
+Page = namedtuple('Page', ['rows', 'total', 'has_prev', 'has_next'])
+
+
+class Dashboard:
+    """One trainer's trainees (ordered by id) on one day; version counts the patches applied"""
+
+    def __init__(self, date, rows):
+        self.date = date
+        self.trainees = {row['id']: row for row in rows}
+        self.ids = list(self.trainees)
+        self.version = 0
+
+    def page(self, after, before, size):
+        """A keyset page, copied so callers cannot change the cache"""
+        start, end = page_bounds(self.ids, after, before, size)
+        rows = [dict(self.trainees[trainee_id]) for trainee_id in self.ids[start:end]]
+        return Page(rows, len(self.ids), start > 0, end < len(self.ids))
+
+
+def dashboard_rows(rows):
+    """TRAINER_DASHBOARD rows grouped by trainer"""
+    grouped = defaultdict(list)
+    for row in rows:
+        row = dict(row)
+        grouped[row.pop('trainer_id')].append(row)
+    return grouped
+
+
+def load_dashboards(trainer_ids, date, conn=None):
+    """TRAINER_DASHBOARD rows by trainer, on a dedicated connection unless one is given"""
+    own_conn = conn is None
+    conn = conn or dedicated_connection(readonly=True)
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(TRAINER_DASHBOARD, {'trainer_ids': list(trainer_ids), 'date': date})
+            rows = cur.fetchall()
+        conn.commit()
+        return dashboard_rows(rows)
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def page_bounds(ids, after, before, size):
+    """(start, end) of the keyset page in sorted `ids` following `after` or preceding `before`"""
+    if before is not None:
+        end = bisect_left(ids, before)
+        return max(end - size, 0), end
+    start = bisect_right(ids, after) if after is not None else 0
+    return start, start + size
+
+
+def same_row(cached, fresh):
+    return all(
+        math.isclose(cached[key] or 0, fresh[key] or 0, abs_tol=0.01)
+        if key in INTAKE or key == 'target_calories' else cached[key] == fresh[key]
+        for key in fresh
+    )
+
+
+class TrainerDashboards:
+    """
+    Per-trainer dashboard snapshots, least recently used trainers evicted
+    first. Saved meals and drinks and profile changes are added to every
+    cached dashboard showing the trainee; changes too broad to patch
+    (imports, wipes, new trainees) drop those dashboards instead.
+    """
+
+    def __init__(self, max_trainers=None, max_trainees=None, page_size=None):
+        self.max_trainers = max_trainers or Config.DASHBOARD_CACHE_TRAINERS
+        self.max_trainees = max_trainees or Config.DASHBOARD_MAX_TRAINEES
+        self.page_size = page_size or Config.TRAINEES_PAGE_SIZE
+        self.entries = OrderedDict()
+        self.trainers_of = defaultdict(set)    # trainee_id -> trainers with a cached dashboard
+        self.uncached = set()                  # trainers with too many trainees to cache
+        self.lock = threading.Lock()
+
+    @property
+    def db(self):
+        return get_db()
+
+    def is_cached(self, trainer_id, date):
+        with self.lock:
+            dashboard = self.entries.get(trainer_id)
+            return dashboard is not None and dashboard.date == date
+
+    def page(self, trainer_id, date, after=None, before=None):
+        """
+        The keyset page of trainees after or before a trainee id (the first
+        page without either), from the cached dashboard when there is one.
+        None on database errors.
+        """
+        with self.lock:
+            dashboard = self.entries.get(trainer_id)
+            hit = dashboard is not None and dashboard.date == date
+            if hit:
+                self.entries.move_to_end(trainer_id)
+                page = dashboard.page(after, before, self.page_size)
+        record_cache('dashboard', hit)
+        if hit:
+            return page
+
+        if trainer_id not in self.uncached:
+            rows = self.db.get_trainee_page(trainer_id, date, limit=self.max_trainees + 1)
+            if rows is None:
+                return None
+            rows = [dict(row) for row in rows]
+            for row in rows:
+                del row['total']
+            if len(rows) <= self.max_trainees:
+                dashboard = Dashboard(date, rows)
+                self._store(trainer_id, dashboard)
+                with self.lock:
+                    return dashboard.page(after, before, self.page_size)
+            self.uncached.add(trainer_id)
+
+        rows = self.db.get_trainee_page(trainer_id, date, after, before, self.page_size + 1)
+        if rows is None:
+            return None
+        rows = [dict(row) for row in rows]
+        total = rows[0].pop('total') if rows else 0
+        for row in rows[1:]:
+            del row['total']
+        more = len(rows) > self.page_size
+        if before is not None:
+            rows = rows[1:] if more else rows
+            return Page(rows, total, more, True)
+        return Page(rows[:self.page_size], total, after is not None, more)
+
+    def add_intake(self, user_id, date, entry):
+        """Add a saved meal or drink (calories, protein, fat, carbs) to the dashboards showing the user"""
+        with self.lock:
+            for dashboard in self._showing(user_id):
+                if dashboard.date == date:
+                    row = dashboard.trainees[user_id]
+                    for key in INTAKE:
+                        row[key] += entry[key] or 0
+                    dashboard.version += 1
+
+    def update_profile(self, user_id, fields):
+        """Apply changed users columns to the dashboards showing the user"""
+        changes = {PROFILE_FIELDS[key]: value for key, value in fields.items() if key in PROFILE_FIELDS}
+        if not changes:
+            return
+        with self.lock:
+            for dashboard in self._showing(user_id):
+                dashboard.trainees[user_id].update(changes)
+                dashboard.version += 1
+
+    def forget_trainee(self, user_id):
+        """Drop every dashboard showing the user"""
+        with self.lock:
+            for trainer_id in list(self.trainers_of.get(user_id, ())):
+                self._drop(trainer_id)
+            DASHBOARD_TRAINERS.set(len(self.entries))
+
+    def forget(self, trainer_id):
+        with self.lock:
+            self._drop(trainer_id)
+            self.uncached.discard(trainer_id)
+            DASHBOARD_TRAINERS.set(len(self.entries))
+
+    async def check(self, context=None):
+        """
+        JobQueue callback: re-read every cached dashboard in one query off the
+        event loop and replace those that differ. Versions are taken and
+        compared on the event loop, where saves and their patches happen
+        together, so a dashboard patched during the read is left for the next
+        check instead of being reported.
+        """
+        with self.lock:
+            versions = {trainer_id: (d.date, d.version) for trainer_id, d in self.entries.items()}
+        if not versions:
+            return 0
+        start = perf_counter()
+        drifted = 0
+        try:
+            for date in {date for date, _ in versions.values()}:
+                trainer_ids = [t for t, (day, _) in versions.items() if day == date]
+                fresh = await asyncio.to_thread(load_dashboards, trainer_ids, date)
+                for trainer_id in trainer_ids:
+                    if self._replace_if_drifted(trainer_id, versions[trainer_id], fresh.get(trainer_id, [])):
+                        drifted += 1
+        except Exception as e:
+            logger.error(f"Error checking trainer dashboards: {e}", exc_info=True)
+            return None
+        DASHBOARD_CHECK.observe(perf_counter() - start)
+        logger.info("Checked %d trainer dashboards, %d drifted", len(versions), drifted)
+        return drifted
+
+    def _replace_if_drifted(self, trainer_id, version, rows):
+        with self.lock:
+            dashboard = self.entries.get(trainer_id)
+            if dashboard is None or (dashboard.date, dashboard.version) != version:
+                return False
+            fresh = {row['id']: row for row in rows}
+            stale = sorted(
+                trainee_id for trainee_id in dashboard.trainees.keys() | fresh.keys()
+                if trainee_id not in dashboard.trainees or trainee_id not in fresh
+                or not same_row(dashboard.trainees[trainee_id], fresh[trainee_id])
+            )
+            if not stale:
+                return False
+            DASHBOARD_DRIFT.inc()
+            logger.warning("Dashboard of trainer %s drifted for trainees %s; reloaded", trainer_id, stale)
+            self._drop(trainer_id)
+            self._store_locked(trainer_id, Dashboard(dashboard.date, rows))
+            return True
+
+    def _showing(self, user_id):
+        return [self.entries[trainer_id] for trainer_id in self.trainers_of.get(user_id, ())]
+
+    def _store(self, trainer_id, dashboard):
+        with self.lock:
+            self._drop(trainer_id)
+            self._store_locked(trainer_id, dashboard)
+
+    def _store_locked(self, trainer_id, dashboard):
+        self.entries[trainer_id] = dashboard
+        for trainee_id in dashboard.trainees:
+            self.trainers_of[trainee_id].add(trainer_id)
+        while len(self.entries) > self.max_trainers:
+            self._drop(next(iter(self.entries)))
+        DASHBOARD_TRAINERS.set(len(self.entries))
+
+    def _drop(self, trainer_id):
+        dashboard = self.entries.pop(trainer_id, None)
+        if dashboard is None:
+            return
+        for trainee_id in dashboard.trainees:
+            trainers = self.trainers_of[trainee_id]
+            trainers.discard(trainer_id)
+            if not trainers:
+                del self.trainers_of[trainee_id]
@@ -1,12 +1,162 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
 from config import Config
 import logging
+import threading
 import time
+from metrics import track_db
+from query_profiler import profiler, ProfilingCursor
 
 logger = logging.getLogger(__name__)
 
+# Rollup tables by period: (table, period start column)
+ROLLUPS = {
+    'day': ('daily_totals', 'date'),
+    'week': ('weekly_totals', 'week_start'),
+    'month': ('monthly_totals', 'month_start'),
+}
+
+# Adds one meal or drink to the day's totals, snapshotting the current target
+ROLLUP_DAY = '''
+    INSERT INTO daily_totals (user_id, date, calories, protein, fat, carbs, meals, drinks, target_calories)
+    SELECT %(user_id)s, %(date)s, %(calories)s, %(protein)s, %(fat)s, %(carbs)s, %(meals)s, %(drinks)s,
+           (SELECT daily_calories FROM users WHERE id = %(user_id)s)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        calories = daily_totals.calories + EXCLUDED.calories,
+        protein = daily_totals.protein + EXCLUDED.protein,
+        fat = daily_totals.fat + EXCLUDED.fat,
+        carbs = daily_totals.carbs + EXCLUDED.carbs,
+        meals = daily_totals.meals + EXCLUDED.meals,
+        drinks = daily_totals.drinks + EXCLUDED.drinks,
+        target_calories = EXCLUDED.target_calories
+'''
+
+# Weeks and months are re-derived from their (at most 31) daily rows
+ROLLUP_PERIOD = '''
+    INSERT INTO {table} (user_id, {column}, calories, protein, fat, carbs, days_logged, days_on_target, target_calories)
+    SELECT user_id, date_trunc('{unit}', date)::date,
+           SUM(calories), SUM(protein), SUM(fat), SUM(carbs), COUNT(*),
+           COUNT(*) FILTER (WHERE target_calories > 0 AND calories BETWEEN
+                            target_calories * (1 - %(tolerance)s) AND target_calories * (1 + %(tolerance)s)),
+           AVG(target_calories)
+    FROM daily_totals
+    WHERE {where}
+    GROUP BY 1, 2
+    ON CONFLICT (user_id, {column}) DO UPDATE SET
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        fat = EXCLUDED.fat,
+        carbs = EXCLUDED.carbs,
+        days_logged = EXCLUDED.days_logged,
+        days_on_target = EXCLUDED.days_on_target,
+        target_calories = EXCLUDED.target_calories
+'''
+
+ROLLUP_PERIOD_FOR_DATE = '''
+    user_id = %(user_id)s
+    AND date >= date_trunc('{unit}', %(date)s::date)
+    AND date < date_trunc('{unit}', %(date)s::date) + interval '1 {unit}'
+'''
+
+
+def rollup_period_query(period, where):
+    """ROLLUP_PERIOD for 'week' or 'month' over the daily rows matching `where`"""
+    table, column = ROLLUPS[period]
+    return ROLLUP_PERIOD.format(table=table, column=column, unit=period, where=where.format(unit=period))
+
+TEMPLATE_COLUMNS = ('id, name, meal_type, total_calories AS calories, total_protein AS protein, '
+                    'total_fat AS fat, total_carbs AS carbs, use_count, last_used')
+
+# Copies a meal's totals and items into a template, replacing one with the same name
+SAVE_TEMPLATE = f'''
+    INSERT INTO meal_templates (user_id, name, meal_type, items, total_calories, total_protein, total_fat, total_carbs)
+    SELECT m.user_id, %(name)s, m.meal_type,
+           COALESCE((SELECT jsonb_agg(jsonb_build_object('name', i.name, 'weight', i.weight) ORDER BY i.id)
+                     FROM meal_items i WHERE i.meal_id = m.id), '[]'),
+           m.total_calories, m.total_protein, m.total_fat, m.total_carbs
+    FROM meals m
+    WHERE m.user_id = %(user_id)s AND (%(meal_id)s::int IS NULL OR m.id = %(meal_id)s)
+    ORDER BY m.date DESC, m.id DESC
+    LIMIT 1
+    ON CONFLICT (user_id, name) DO UPDATE SET
+        meal_type = EXCLUDED.meal_type,
+        items = EXCLUDED.items,
+        total_calories = EXCLUDED.total_calories,
+        total_protein = EXCLUDED.total_protein,
+        total_fat = EXCLUDED.total_fat,
+        total_carbs = EXCLUDED.total_carbs
+    RETURNING {TEMPLATE_COLUMNS}
+'''
+
+DASHBOARD_COLUMNS = '''
+    u.id, u.first_name, u.username, u.daily_calories AS target_calories,
+    COALESCE(t.calories, 0) AS calories, COALESCE(t.protein, 0) AS protein,
+    COALESCE(t.fat, 0) AS fat, COALESCE(t.carbs, 0) AS carbs
+'''
+
+# Today's progress of every trainee of the given trainers, from the day's rollup row
+TRAINER_DASHBOARD = f'''
+    SELECT tt.trainer_id, {DASHBOARD_COLUMNS}
+    FROM trainer_trainee tt
+    JOIN users u ON u.id = tt.trainee_id
+    LEFT JOIN daily_totals t ON t.user_id = u.id AND t.date = %(date)s
+    WHERE tt.trainer_id = ANY(%(trainer_ids)s)
+    ORDER BY tt.trainer_id, u.id
+'''
+
+# A keyset page of one trainer's trainees after or before a trainee id, walking the primary key
+TRAINEE_PAGE = f'''
+    SELECT {DASHBOARD_COLUMNS},
+           (SELECT COUNT(*) FROM trainer_trainee WHERE trainer_id = %(trainer_id)s) AS total
+    FROM trainer_trainee tt
+    JOIN users u ON u.id = tt.trainee_id
+    LEFT JOIN daily_totals t ON t.user_id = u.id AND t.date = %(date)s
+    WHERE tt.trainer_id = %(trainer_id)s
+      AND (%(after)s::bigint IS NULL OR tt.trainee_id > %(after)s)
+      AND (%(before)s::bigint IS NULL OR tt.trainee_id < %(before)s)
+    ORDER BY tt.trainee_id {{order}}
+    LIMIT %(limit)s
+'''
+
+# One statement inserting the meal and its items from stored totals
+RELOG_MEAL = {
+    'template': '''
+        WITH source AS (
+            UPDATE meal_templates SET use_count = use_count + 1, last_used = CURRENT_TIMESTAMP
+            WHERE id = %(source_id)s AND user_id = %(user_id)s
+            RETURNING meal_type, items, total_calories, total_protein, total_fat, total_carbs
+        ), meal AS (
+            INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs)
+            SELECT %(user_id)s, meal_type, %(date)s, total_calories, total_protein, total_fat, total_carbs
+            FROM source
+            RETURNING id, meal_type, total_calories AS calories, total_protein AS protein,
+                      total_fat AS fat, total_carbs AS carbs
+        ), items AS (
+            INSERT INTO meal_items (meal_id, name, weight)
+            SELECT meal.id, item->>'name', (item->>'weight')::float
+            FROM meal, source, jsonb_array_elements(source.items) item
+        )
+        SELECT * FROM meal
+    ''',
+    'meal': '''
+        WITH meal AS (
+            INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs)
+            SELECT user_id, meal_type, %(date)s, total_calories, total_protein, total_fat, total_carbs
+            FROM meals WHERE id = %(source_id)s AND user_id = %(user_id)s
+            RETURNING id, meal_type, total_calories AS calories, total_protein AS protein,
+                      total_fat AS fat, total_carbs AS carbs
+        ), items AS (
+            INSERT INTO meal_items (meal_id, name, weight)
+            SELECT meal.id, i.name, i.weight
+            FROM meal, meal_items i WHERE i.meal_id = %(source_id)s
+            ORDER BY i.id
+        )
+        SELECT * FROM meal
+    ''',
+}
+
+
 class Database:
     def __init__(self):
         self.conn = None
@@ -22,7 +172,7 @@ class Database:
             try:
                 self.conn = psycopg2.connect(
                     Config.DATABASE_URL, 
-                    sslmode='require',
+                    sslmode=Config.DATABASE_SSLMODE,
                     connect_timeout=10
                 )
                 logger.info("Database connection established")
@@ -35,20 +185,17 @@ class Database:
                     raise
                 time.sleep(2)
 
+    def cursor(self, cursor_factory=None):
+        """Open a cursor, timed by the query profiler when it is enabled"""
+        cur = self.conn.cursor(cursor_factory=cursor_factory)
+        if profiler.enabled:
+            return ProfilingCursor(cur, profiler)
+        return cur
+
     def init_tables(self):
         """Initialize database tables"""
         try:
-            with self.conn.cursor() as cur:
-                # First, try to add missing columns to existing users table
-                try:
-                    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS age INTEGER")
-                    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS gender VARCHAR(10)")
-                    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS activity_level VARCHAR(50)")
-                    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS goal VARCHAR(50)")
-                    logger.info("Added missing columns to users table")
-                except Exception as e:
-                    logger.warning(f"Column addition: {e}")
-
+            with self.cursor() as cur:
                 # Users table - now with all columns
                 cur.execute('''
                     CREATE TABLE IF NOT EXISTS users (
@@ -69,7 +216,169 @@ class Database:
                     )
                 ''')
 
-                # ... rest of your init_tables code ...
+                # Add columns missing from older users tables
+                cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS age INTEGER")
+                cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS gender VARCHAR(10)")
+                cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS activity_level VARCHAR(50)")
+                cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS goal VARCHAR(50)")
+                cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS reminders BOOLEAN DEFAULT TRUE")
+
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS meals (
+                        id SERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        meal_type VARCHAR(50),
+                        date DATE NOT NULL,
+                        total_calories FLOAT DEFAULT 0,
+                        total_protein FLOAT DEFAULT 0,
+                        total_fat FLOAT DEFAULT 0,
+                        total_carbs FLOAT DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals (user_id, date)')
+
+                # Items of each meal, kept so historical meals can be re-scored
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS meal_items (
+                        id SERIAL PRIMARY KEY,
+                        meal_id INTEGER NOT NULL REFERENCES meals (id) ON DELETE CASCADE,
+                        name VARCHAR(255) NOT NULL,
+                        weight FLOAT NOT NULL
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_meal_items_meal ON meal_items (meal_id)')
+
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS drinks (
+                        id SERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        drink_name VARCHAR(255),
+                        volume_ml INTEGER,
+                        calories FLOAT DEFAULT 0,
+                        protein FLOAT DEFAULT 0,
+                        fat FLOAT DEFAULT 0,
+                        carbs FLOAT DEFAULT 0,
+                        date DATE NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_drinks_user_date ON drinks (user_id, date)')
+
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS trainer_trainee (
+                        trainer_id BIGINT NOT NULL,
+                        trainee_id BIGINT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (trainer_id, trainee_id)
+                    )
+                ''')
+
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS food_items (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        calories FLOAT NOT NULL,
+                        protein FLOAT NOT NULL,
+                        fat FLOAT NOT NULL,
+                        carbs FLOAT NOT NULL,
+                        per_grams FLOAT DEFAULT 100
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_food_items_name ON food_items (LOWER(name))')
+
+                # Pre-aggregated history for /week and /month
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS daily_totals (
+                        user_id BIGINT NOT NULL,
+                        date DATE NOT NULL,
+                        calories FLOAT DEFAULT 0,
+                        protein FLOAT DEFAULT 0,
+                        fat FLOAT DEFAULT 0,
+                        carbs FLOAT DEFAULT 0,
+                        meals INTEGER DEFAULT 0,
+                        drinks INTEGER DEFAULT 0,
+                        target_calories FLOAT,
+                        PRIMARY KEY (user_id, date)
+                    )
+                ''')
+                for period in ('week', 'month'):
+                    table, column = ROLLUPS[period]
+                    cur.execute(f'''
+                        CREATE TABLE IF NOT EXISTS {table} (
+                            user_id BIGINT NOT NULL,
+                            {column} DATE NOT NULL,
+                            calories FLOAT DEFAULT 0,
+                            protein FLOAT DEFAULT 0,
+                            fat FLOAT DEFAULT 0,
+                            carbs FLOAT DEFAULT 0,
+                            days_logged INTEGER DEFAULT 0,
+                            days_on_target INTEGER DEFAULT 0,
+                            target_calories FLOAT,
+                            PRIMARY KEY (user_id, {column})
+                        )
+                    ''')
+
+                # Drinks added by admins on top of the built-in catalog (per 100ml)
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS custom_drinks (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL UNIQUE,
+                        calories FLOAT NOT NULL,
+                        protein FLOAT DEFAULT 0,
+                        fat FLOAT DEFAULT 0,
+                        carbs FLOAT DEFAULT 0,
+                        aliases TEXT[] DEFAULT '{}'
+                    )
+                ''')
+
+                # Saved meals re-logged without resolving nutrition again
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS meal_templates (
+                        id SERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        name VARCHAR(64) NOT NULL,
+                        meal_type VARCHAR(50),
+                        items JSONB NOT NULL DEFAULT '[]',
+                        total_calories FLOAT DEFAULT 0,
+                        total_protein FLOAT DEFAULT 0,
+                        total_fat FLOAT DEFAULT 0,
+                        total_carbs FLOAT DEFAULT 0,
+                        use_count INTEGER DEFAULT 0,
+                        last_used TIMESTAMP,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (user_id, name)
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_meal_templates_top '
+                            'ON meal_templates (user_id, use_count DESC, last_used DESC NULLS LAST)')
+
+                # Trainer broadcasts and the outcome for each trainee
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS broadcasts (
+                        id SERIAL PRIMARY KEY,
+                        trainer_id BIGINT NOT NULL,
+                        text TEXT,
+                        file_id VARCHAR(255),
+                        recipients INTEGER NOT NULL,
+                        sent INTEGER DEFAULT 0,
+                        blocked INTEGER DEFAULT 0,
+                        failed INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP
+                    )
+                ''')
+                cur.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_trainer ON broadcasts (trainer_id)')
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                        broadcast_id INTEGER NOT NULL REFERENCES broadcasts (id) ON DELETE CASCADE,
+                        trainee_id BIGINT NOT NULL,
+                        status VARCHAR(10) NOT NULL,
+                        error TEXT,
+                        delivered_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (broadcast_id, trainee_id)
+                    )
+                ''')
 
                 self.conn.commit()
                 logger.info("Database tables initialized")
@@ -77,10 +386,11 @@ class Database:
             logger.error(f"Table initialization error: {e}")
             self.conn.rollback()
 
+    @track_db
     def save_user(self, user_data):
         """Save or update user"""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute('''
                     INSERT INTO users (id, username, first_name, last_name, user_type)
                     VALUES (%(id)s, %(username)s, %(first_name)s, %(last_name)s, %(user_type)s)
@@ -91,64 +401,136 @@ class Database:
                         user_type = %(user_type)s
                 ''', user_data)
                 self.conn.commit()
-                logger.info(f"User saved: {user_data['id']}")
+                logger.info("User saved: %s", user_data['id'])
                 return True
         except Exception as e:
             logger.error(f"Error saving user: {e}")
             self.conn.rollback()
             return False
     
+    @track_db
     def update_user_profile(self, user_id, profile_data):
         """Update user profile"""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 fields = ', '.join([f"{key} = %({key})s" for key in profile_data.keys()])
                 query = f"UPDATE users SET {fields} WHERE id = %(user_id)s"
                 profile_data['user_id'] = user_id
                 cur.execute(query, profile_data)
                 self.conn.commit()
-                logger.info(f"Profile updated for user {user_id}: {profile_data}")
+                logger.info("Profile updated for user %s: %s", user_id, sorted(profile_data))
                 return True
         except Exception as e:
             logger.error(f"Error updating profile: {e}")
             self.conn.rollback()
             return False
     
+    @track_db
+    def reset_user_profile(self, user_id):
+        """Clear a user's profile fields, keeping the user record"""
+        try:
+            with self.cursor() as cur:
+                cur.execute('''
+                    UPDATE users
+                    SET height = NULL, weight = NULL, age = NULL, gender = NULL,
+                        activity_level = NULL, goal = NULL, daily_calories = NULL
+                    WHERE id = %s
+                ''', (user_id,))
+            self.conn.commit()
+            logger.info("Profile reset for user %s", user_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error resetting profile: {e}")
+            self.conn.rollback()
+            return False
+    
+    @track_db
+    def set_reminders(self, user_ids, enabled):
+        """Turn reminders on or off for the given users"""
+        try:
+            with self.cursor() as cur:
+                cur.execute('UPDATE users SET reminders = %s WHERE id = ANY(%s)', (enabled, list(user_ids)))
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating reminders: {e}")
+            self.conn.rollback()
+            return False
+    
+    @track_db
     def get_user_profile(self, user_id):
         """Get user profile"""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.cursor(RealDictCursor) as cur:
                 cur.execute('SELECT * FROM users WHERE id = %s', (user_id,))
                 result = cur.fetchone()
-                logger.info(f"Profile fetched for user {user_id}: {result}")
+                logger.debug("Profile fetched for user %s (found: %s)", user_id, result is not None)
                 return result
         except Exception as e:
             logger.error(f"Error getting profile: {e}")
             return None
     
+    @track_db
     def save_meal(self, meal_data):
-        """Save meal summary"""
+        """Save meal summary and, when given, its items"""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute('''
                     INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs)
                     VALUES (%(user_id)s, %(meal_type)s, %(date)s, %(calories)s, %(protein)s, %(fat)s, %(carbs)s)
                     RETURNING id
                 ''', meal_data)
                 meal_id = cur.fetchone()[0]
+                items = meal_data.get('items')
+                if items:
+                    execute_values(
+                        cur, 'INSERT INTO meal_items (meal_id, name, weight) VALUES %s',
+                        [(meal_id, item['name'], item['weight']) for item in items]
+                    )
+                self._update_rollups(cur, {
+                    'user_id': meal_data['user_id'], 'date': meal_data['date'],
+                    'calories': meal_data['calories'], 'protein': meal_data['protein'],
+                    'fat': meal_data['fat'], 'carbs': meal_data['carbs'], 'meals': 1, 'drinks': 0
+                })
                 self.conn.commit()
-                logger.info(f"Meal saved with ID {meal_id} for user {meal_data['user_id']}")
+                logger.info("Meal saved with ID %s for user %s", meal_id, meal_data['user_id'],
+                            extra={'user_id': meal_data['user_id'], 'meal_id': meal_id})
                 return meal_id
         except Exception as e:
-            logger.error(f"Error saving meal: {e}")
-            logger.error(f"Meal data was: {meal_data}")
+            logger.error("Error saving meal for user %s: %s (fields: %s)",
+                         meal_data.get('user_id'), e, sorted(meal_data))
             self.conn.rollback()
             return None
     
+    def _update_rollups(self, cur, entry):
+        """Add an entry to its day and refresh that week and month, in the caller's transaction"""
+        cur.execute(ROLLUP_DAY, entry)
+        params = {'user_id': entry['user_id'], 'date': entry['date'], 'tolerance': Config.ADHERENCE_TOLERANCE}
+        for period in ('week', 'month'):
+            cur.execute(rollup_period_query(period, ROLLUP_PERIOD_FOR_DATE), params)
+
+    @track_db
+    def get_totals(self, period, user_id, start, end):
+        """Rollup rows ('day', 'week' or 'month') whose period starts between start and end"""
+        table, column = ROLLUPS[period]
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute(f'''
+                    SELECT *, {column} AS start FROM {table}
+                    WHERE user_id = %s AND {column} BETWEEN %s AND %s
+                    ORDER BY {column}
+                ''', (user_id, start, end))
+                return cur.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting {period} totals: {e}")
+            self.conn.rollback()
+            return []
+
+    @track_db
     def get_daily_intake(self, user_id, date):
         """Get all meals for a specific day"""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.cursor(RealDictCursor) as cur:
                 cur.execute('''
                     SELECT * FROM meals 
                     WHERE user_id = %s AND date = %s
@@ -167,45 +549,174 @@ class Database:
                 # Combine meals and drinks
                 all_intake = list(meals) + list(drinks)
                 
-                logger.info(f"Daily intake for user {user_id} on {date}: {len(all_intake)} items")
+                logger.debug("Daily intake for user %s on %s: %d items", user_id, date, len(all_intake))
                 return all_intake
         except Exception as e:
             logger.error(f"Error getting daily intake: {e}")
             return []
     
+    @track_db
     def get_food_nutrition(self, food_name):
         """Get nutrition data for a food item"""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.cursor(RealDictCursor) as cur:
                 cur.execute('SELECT * FROM food_items WHERE LOWER(name) = LOWER(%s)', (food_name,))
                 return cur.fetchone()
         except Exception as e:
             logger.error(f"Error getting food nutrition: {e}")
             return None
-    
+
+    @track_db
+    def get_foods_nutrition(self, food_names):
+        """Get nutrition data for several food items in one query, keyed by lowercase name"""
+        names = sorted({name.lower().strip() for name in food_names})
+        if not names:
+            return {}
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute('SELECT * FROM food_items WHERE LOWER(name) = ANY(%s)', (names,))
+                return {row['name'].lower(): row for row in cur.fetchall()}
+        except Exception as e:
+            logger.error(f"Error getting food nutrition: {e}")
+            self.conn.rollback()
+            return {}
+
+    @track_db
+    def get_custom_drinks(self):
+        """All custom drinks, or None when the table cannot be read"""
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute('SELECT name, calories, protein, fat, carbs, aliases FROM custom_drinks ORDER BY id')
+                rows = cur.fetchall()
+            self.conn.commit()
+            return rows
+        except Exception as e:
+            logger.error(f"Error loading custom drinks: {e}")
+            self.conn.rollback()
+            return None
+
+    @track_db
     def save_drink(self, drink_data):
         """Save drink entry"""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute('''
                     INSERT INTO drinks (user_id, drink_name, volume_ml, calories, protein, fat, carbs, date)
                     VALUES (%(user_id)s, %(drink_name)s, %(volume_ml)s, %(calories)s, %(protein)s, %(fat)s, %(carbs)s, %(date)s)
                     RETURNING id
                 ''', drink_data)
                 drink_id = cur.fetchone()[0]
+                self._update_rollups(cur, {
+                    'user_id': drink_data['user_id'], 'date': drink_data['date'],
+                    'calories': drink_data['calories'], 'protein': drink_data['protein'],
+                    'fat': drink_data['fat'], 'carbs': drink_data['carbs'], 'meals': 0, 'drinks': 1
+                })
                 self.conn.commit()
-                logger.info(f"Drink saved with ID {drink_id} for user {drink_data['user_id']}")
+                logger.info("Drink saved with ID %s for user %s", drink_id, drink_data['user_id'],
+                            extra={'user_id': drink_data['user_id'], 'drink_id': drink_id})
                 return True
         except Exception as e:
-            logger.error(f"Error saving drink: {e}")
-            logger.error(f"Drink data was: {drink_data}")
+            logger.error("Error saving drink for user %s: %s (fields: %s)",
+                         drink_data.get('user_id'), e, sorted(drink_data))
             self.conn.rollback()
             return False
     
+    @track_db
+    def save_meal_template(self, user_id, name, meal_id=None):
+        """Save a logged meal (the latest when meal_id is None) as a named template; returns it or None"""
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute(SAVE_TEMPLATE, {'user_id': user_id, 'name': name, 'meal_id': meal_id})
+                template = cur.fetchone()
+            self.conn.commit()
+            return template
+        except Exception as e:
+            logger.error(f"Error saving meal template: {e}")
+            self.conn.rollback()
+            return None
+
+    @track_db
+    def get_meal_templates(self, user_id, limit, name=None):
+        """The user's most used templates, or the one with this name"""
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute(f'''
+                    SELECT {TEMPLATE_COLUMNS} FROM meal_templates
+                    WHERE user_id = %(user_id)s AND (%(name)s::text IS NULL OR LOWER(name) = LOWER(%(name)s))
+                    ORDER BY use_count DESC, last_used DESC NULLS LAST
+                    LIMIT %(limit)s
+                ''', {'user_id': user_id, 'name': name, 'limit': limit})
+                return cur.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting meal templates: {e}")
+            self.conn.rollback()
+            return []
+
+    @track_db
+    def delete_meal_template(self, user_id, name):
+        """Delete a template by name; returns whether it existed"""
+        try:
+            with self.cursor() as cur:
+                cur.execute('DELETE FROM meal_templates WHERE user_id = %s AND LOWER(name) = LOWER(%s)',
+                            (user_id, name))
+                deleted = cur.rowcount > 0
+            self.conn.commit()
+            return deleted
+        except Exception as e:
+            logger.error(f"Error deleting meal template: {e}")
+            self.conn.rollback()
+            return False
+
+    @track_db
+    def get_recent_meals(self, user_id, limit):
+        """The user's latest meals with their totals and item names"""
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute('''
+                    SELECT m.id, m.meal_type, m.date, m.total_calories AS calories,
+                           (SELECT string_agg(i.name, ', ' ORDER BY i.id) FROM meal_items i WHERE i.meal_id = m.id) AS items
+                    FROM meals m
+                    WHERE m.user_id = %s
+                    ORDER BY m.date DESC, m.id DESC
+                    LIMIT %s
+                ''', (user_id, limit))
+                return cur.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting recent meals: {e}")
+            self.conn.rollback()
+            return []
+
+    @track_db
+    def relog_meal(self, user_id, source, source_id, date):
+        """
+        Log a template (source 'template') or an earlier meal ('meal') again on
+        `date`, copying its totals and items; returns the new meal or None.
+        """
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute(RELOG_MEAL[source], {'user_id': user_id, 'source_id': source_id, 'date': date})
+                meal = cur.fetchone()
+                if meal is None:
+                    self.conn.rollback()
+                    return None
+                self._update_rollups(cur, {
+                    'user_id': user_id, 'date': date, 'calories': meal['calories'], 'protein': meal['protein'],
+                    'fat': meal['fat'], 'carbs': meal['carbs'], 'meals': 1, 'drinks': 0
+                })
+            self.conn.commit()
+            logger.info("Meal %s re-logged from %s %s for user %s", meal['id'], source, source_id, user_id,
+                        extra={'user_id': user_id, 'meal_id': meal['id']})
+            return meal
+        except Exception as e:
+            logger.error(f"Error re-logging {source} {source_id} for user {user_id}: {e}")
+            self.conn.rollback()
+            return None
+
+    @track_db
     def link_trainer_trainee(self, trainer_id, trainee_id):
         """Link trainer with trainee"""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute('''
                     INSERT INTO trainer_trainee (trainer_id, trainee_id)
                     VALUES (%s, %s)
@@ -223,19 +734,89 @@ class Database:
             self.conn.rollback()
             return False
     
+    @track_db
     def get_trainees(self, trainer_id):
-        """Get all trainees for a trainer"""
+        """Get all trainees for a trainer (id and names only); see get_trainee_page for listings"""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.cursor(RealDictCursor) as cur:
                 cur.execute('''
-                    SELECT u.* FROM users u
+                    SELECT u.id, u.first_name, u.username FROM users u
                     JOIN trainer_trainee tt ON u.id = tt.trainee_id
                     WHERE tt.trainer_id = %s
+                    ORDER BY u.id
                 ''', (trainer_id,))
                 return cur.fetchall()
         except Exception as e:
             logger.error(f"Error getting trainees: {e}")
             return []
 
-# Global database instance
-db = Database()
+    @track_db
+    def get_trainee(self, trainer_id, trainee_id):
+        """The trainer's trainee with this id (id and names only), or None"""
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute('''
+                    SELECT u.id, u.first_name, u.username FROM trainer_trainee tt
+                    JOIN users u ON u.id = tt.trainee_id
+                    WHERE tt.trainer_id = %s AND tt.trainee_id = %s
+                ''', (trainer_id, trainee_id))
+                return cur.fetchone()
+        except Exception as e:
+            logger.error(f"Error getting trainee {trainee_id} of trainer {trainer_id}: {e}")
+            self.conn.rollback()
+            return None
+
+    @track_db
+    def get_trainee_page(self, trainer_id, date, after=None, before=None, limit=10):
+        """
+        Up to `limit` trainees with today's totals, ordered by id, following
+        `after` or preceding `before`; each row carries the trainer's total
+        number of trainees. None on error.
+        """
+        order = 'DESC' if before is not None else 'ASC'
+        try:
+            with self.cursor(RealDictCursor) as cur:
+                cur.execute(TRAINEE_PAGE.format(order=order), {
+                    'trainer_id': trainer_id, 'date': date, 'after': after, 'before': before, 'limit': limit
+                })
+                rows = cur.fetchall()
+            return rows[::-1] if before is not None else rows
+        except Exception as e:
+            logger.error(f"Error getting trainees of trainer {trainer_id}: {e}")
+            self.conn.rollback()
+            return None
+
+def dedicated_connection(readonly=False):
+    """A separate connection for long reads and bulk jobs, leaving the shared one free"""
+    conn = psycopg2.connect(Config.DATABASE_URL, sslmode=Config.DATABASE_SSLMODE, connect_timeout=10)
+    if readonly:
+        conn.set_session(readonly=True)
+    return conn
+
+
+# Shared database instance, connected on first use
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_db():
+    """Return the shared Database, connecting (and creating tables) on first use"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = Database()
+    return _db
+
+
+def set_db(instance):
+    """Replace the shared Database, e.g. with an in-memory fake"""
+    global _db
+    _db = instance
+
+
+def __getattr__(name):
+    # Keep `database.db` working without connecting at import time
+    if name == 'db':
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,109 +1,234 @@
 import logging
+from bisect import bisect_left
+from collections import namedtuple
+from types import MappingProxyType
+
+from database import get_db
 
 logger = logging.getLogger(__name__)
 
-class DrinkManager:
-    def __init__(self):
-        # Comprehensive drink database (per 100ml)
-        self.drinks_db = {
-            'water': {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0},
-            'cola': {'calories': 42, 'protein': 0, 'fat': 0, 'carbs': 10.6},
-            'coke': {'calories': 42, 'protein': 0, 'fat': 0, 'carbs': 10.6},
-            'pepsi': {'calories': 41, 'protein': 0, 'fat': 0, 'carbs': 11},
-            'sprite': {'calories': 39, 'protein': 0, 'fat': 0, 'carbs': 10},
-            '7up': {'calories': 38, 'protein': 0, 'fat': 0, 'carbs': 10},
-            'fanta': {'calories': 45, 'protein': 0, 'fat': 0, 'carbs': 12},
-            
-            # Coffee & Tea
-            'coffee': {'calories': 2, 'protein': 0.3, 'fat': 0, 'carbs': 0},
-            'black coffee': {'calories': 2, 'protein': 0.3, 'fat': 0, 'carbs': 0},
-            'latte': {'calories': 54, 'protein': 3.4, 'fat': 2, 'carbs': 5.5},
-            'cappuccino': {'calories': 38, 'protein': 2.5, 'fat': 1.5, 'carbs': 4},
-            'espresso': {'calories': 9, 'protein': 0.5, 'fat': 0.2, 'carbs': 1.6},
-            'tea': {'calories': 1, 'protein': 0, 'fat': 0, 'carbs': 0.3},
-            'green tea': {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0},
-            'black tea': {'calories': 1, 'protein': 0, 'fat': 0, 'carbs': 0.3},
-            
-            # Juice
-            'orange juice': {'calories': 45, 'protein': 0.7, 'fat': 0.2, 'carbs': 10.4},
-            'apple juice': {'calories': 46, 'protein': 0.1, 'fat': 0.1, 'carbs': 11.3},
-            'grape juice': {'calories': 60, 'protein': 0.4, 'fat': 0.1, 'carbs': 14.8},
-            'pineapple juice': {'calories': 53, 'protein': 0.4, 'fat': 0.1, 'carbs': 12.9},
-            'tomato juice': {'calories': 17, 'protein': 0.8, 'fat': 0.1, 'carbs': 3.9},
-            'cranberry juice': {'calories': 46, 'protein': 0, 'fat': 0.1, 'carbs': 12.2},
-            
-            # Milk & Dairy
-            'milk': {'calories': 42, 'protein': 3.4, 'fat': 1, 'carbs': 4.7},
-            'whole milk': {'calories': 61, 'protein': 3.2, 'fat': 3.3, 'carbs': 4.8},
-            'skim milk': {'calories': 34, 'protein': 3.4, 'fat': 0.1, 'carbs': 5},
-            'almond milk': {'calories': 13, 'protein': 0.4, 'fat': 1.1, 'carbs': 0.6},
-            'soy milk': {'calories': 33, 'protein': 2.9, 'fat': 1.6, 'carbs': 1.5},
-            'oat milk': {'calories': 47, 'protein': 1, 'fat': 1.5, 'carbs': 7.6},
-            
-            # Energy & Sports Drinks
-            'red bull': {'calories': 45, 'protein': 0, 'fat': 0, 'carbs': 11},
-            'monster': {'calories': 47, 'protein': 0, 'fat': 0, 'carbs': 12},
-            'gatorade': {'calories': 25, 'protein': 0, 'fat': 0, 'carbs': 6},
-            'powerade': {'calories': 27, 'protein': 0, 'fat': 0, 'carbs': 7},
-            
-            # Alcohol
-            'beer': {'calories': 43, 'protein': 0.5, 'fat': 0, 'carbs': 3.6},
-            'wine': {'calories': 83, 'protein': 0.1, 'fat': 0, 'carbs': 2.6},
-            'vodka': {'calories': 231, 'protein': 0, 'fat': 0, 'carbs': 0},
-            'whiskey': {'calories': 250, 'protein': 0, 'fat': 0, 'carbs': 0},
-            
-            # Smoothies & Shakes
-            'protein shake': {'calories': 80, 'protein': 16, 'fat': 1, 'carbs': 3},
-            'smoothie': {'calories': 60, 'protein': 1, 'fat': 0.5, 'carbs': 14},
-            'milkshake': {'calories': 112, 'protein': 3.5, 'fat': 3.5, 'carbs': 17}
+Drink = namedtuple('Drink', ['name', 'calories', 'protein', 'fat', 'carbs'])
+
+# name, per 100ml (calories, protein, fat, carbs), aliases
+DRINKS = (
+    ('water', 0, 0, 0, 0, ('still water', 'sparkling water', 'mineral water', 'вода')),
+    ('cola', 42, 0, 0, 10.6, ('coke', 'coca cola', 'coca-cola', 'кола')),
+    ('pepsi', 41, 0, 0, 11, ('пепси',)),
+    ('sprite', 39, 0, 0, 10, ('спрайт',)),
+    ('7up', 38, 0, 0, 10, ('seven up',)),
+    ('fanta', 45, 0, 0, 12, ('фанта',)),
+
+    # Coffee & Tea
+    ('coffee', 2, 0.3, 0, 0, ('black coffee', 'americano', 'filter coffee', 'кофе')),
+    ('latte', 54, 3.4, 2, 5.5, ('coffee with milk', 'café latte', 'cafe latte', 'латте')),
+    ('cappuccino', 38, 2.5, 1.5, 4, ('капучино',)),
+    ('espresso', 9, 0.5, 0.2, 1.6, ('эспрессо',)),
+    ('tea', 1, 0, 0, 0.3, ('black tea', 'чай')),
+    ('green tea', 0, 0, 0, 0, ('зеленый чай',)),
+
+    # Juice
+    ('orange juice', 45, 0.7, 0.2, 10.4, ('oj', 'апельсиновый сок')),
+    ('apple juice', 46, 0.1, 0.1, 11.3, ('яблочный сок',)),
+    ('grape juice', 60, 0.4, 0.1, 14.8, ()),
+    ('pineapple juice', 53, 0.4, 0.1, 12.9, ()),
+    ('tomato juice', 17, 0.8, 0.1, 3.9, ('томатный сок',)),
+    ('cranberry juice', 46, 0, 0.1, 12.2, ()),
+
+    # Milk & Dairy
+    ('milk', 42, 3.4, 1, 4.7, ('молоко',)),
+    ('whole milk', 61, 3.2, 3.3, 4.8, ()),
+    ('skim milk', 34, 3.4, 0.1, 5, ('skimmed milk', 'nonfat milk')),
+    ('almond milk', 13, 0.4, 1.1, 0.6, ()),
+    ('soy milk', 33, 2.9, 1.6, 1.5, ('soya milk',)),
+    ('oat milk', 47, 1, 1.5, 7.6, ()),
+
+    # Energy & Sports Drinks
+    ('red bull', 45, 0, 0, 11, ('redbull', 'energy drink')),
+    ('monster', 47, 0, 0, 12, ('monster energy',)),
+    ('gatorade', 25, 0, 0, 6, ('isotonic', 'sports drink')),
+    ('powerade', 27, 0, 0, 7, ()),
+
+    # Alcohol
+    ('beer', 43, 0.5, 0, 3.6, ('lager', 'пиво')),
+    ('wine', 83, 0.1, 0, 2.6, ('red wine', 'white wine', 'вино')),
+    ('vodka', 231, 0, 0, 0, ('водка',)),
+    ('whiskey', 250, 0, 0, 0, ('whisky',)),
+
+    # Smoothies & Shakes
+    ('protein shake', 80, 16, 1, 3, ('whey shake', 'protein')),
+    ('smoothie', 60, 1, 0.5, 14, ()),
+    ('milkshake', 112, 3.5, 3.5, 17, ('milk shake',)),
+)
+
+# Minimum trigram similarity for a fuzzy match and for search results
+MATCH_THRESHOLD = 0.45
+SEARCH_THRESHOLD = 0.2
+
+
+def _normalize(text):
+    return ' '.join(text.lower().replace('-', ' ').split())
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class DrinkCatalog:
+    """
+    Immutable drink catalog with an alias, prefix and trigram index.
+
+    Matching: exact alias, then the longest alias found as whole words in
+    the query ("diet coke" -> cola), then the most similar alias by
+    trigram overlap ("capuccino" -> cappuccino).
+    """
+
+    def __init__(self, entries):
+        drinks = {}
+        aliases = {}
+        for name, calories, protein, fat, carbs, names in entries:
+            name = _normalize(name)
+            if name in drinks:
+                logger.debug("Duplicate drink '%s' ignored", name)
+                continue
+            drinks[name] = Drink(name, calories, protein, fat, carbs)
+            for alias in (name,) + tuple(names):
+                aliases.setdefault(_normalize(alias), name)
+
+        self.drinks = MappingProxyType(drinks)
+        self.aliases = MappingProxyType(aliases)
+        self._sorted = tuple(sorted(aliases))
+        self._by_length = tuple(sorted(aliases, key=len, reverse=True))
+        self._alias_trigrams = {alias: _trigrams(alias) for alias in aliases}
+        trigram_index = {}
+        for alias, grams in self._alias_trigrams.items():
+            for gram in grams:
+                trigram_index.setdefault(gram, []).append(alias)
+        self._trigram_index = {gram: tuple(found) for gram, found in trigram_index.items()}
+
+    def __len__(self):
+        return len(self.drinks)
+
+    def get(self, name):
+        return self.drinks.get(self.aliases.get(_normalize(name), ''))
+
+    def _similar(self, query):
+        """alias -> Jaccard similarity of trigram sets, for aliases sharing a trigram"""
+        grams = _trigrams(query)
+        shared = {}
+        for gram in grams:
+            for alias in self._trigram_index.get(gram, ()):
+                shared[alias] = shared.get(alias, 0) + 1
+        return {
+            alias: count / (len(grams) + len(self._alias_trigrams[alias]) - count)
+            for alias, count in shared.items()
         }
-    
+
+    def match(self, query):
+        """Best Drink for a free-text name, or None"""
+        query = _normalize(query)
+        if not query:
+            return None
+        name = self.aliases.get(query)
+        if name is None:
+            padded = f' {query} '
+            for alias in self._by_length:
+                if f' {alias} ' in padded:
+                    name = self.aliases[alias]
+                    break
+        if name is None:
+            scores = self._similar(query)
+            if scores:
+                alias, score = max(scores.items(), key=lambda item: (item[1], -len(item[0])))
+                if score >= MATCH_THRESHOLD:
+                    name = self.aliases[alias]
+        if name is not None and name != query:
+            logger.debug("Matched drink '%s' to '%s'", query, name)
+        return self.drinks.get(name) if name else None
+
+    def search(self, query, limit=10):
+        """Drink names ranked by prefix match, whole-word match and trigram similarity"""
+        query = _normalize(query)
+        if not query:
+            return []
+
+        scores = {}
+
+        def offer(alias, score):
+            name = self.aliases[alias]
+            if score > scores.get(name, 0):
+                scores[name] = score
+
+        start = bisect_left(self._sorted, query)
+        for alias in self._sorted[start:]:
+            if not alias.startswith(query):
+                break
+            offer(alias, 2 + len(query) / len(alias))
+
+        padded = f' {query} '
+        for alias in self._by_length:
+            if f' {alias} ' in padded or f' {query} ' in f' {alias} ':
+                offer(alias, 1.5)
+
+        for alias, score in self._similar(query).items():
+            if score >= SEARCH_THRESHOLD:
+                offer(alias, score)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [name for name, _ in ranked[:limit]]
+
+
+CATALOG = DrinkCatalog(DRINKS)
+
+
+class DrinkManager:
+    """Drink lookups over the built-in catalog plus custom drinks from the database"""
+
+    def __init__(self, catalog=CATALOG):
+        self.builtin = catalog
+        self.catalog = catalog
+
+    def refresh_custom_drinks(self, db=None):
+        """Reload the custom_drinks table and swap in a merged catalog"""
+        rows = (db or get_db()).get_custom_drinks()
+        if rows is None:
+            return False
+        custom = [
+            (row['name'], row['calories'], row['protein'], row['fat'], row['carbs'], tuple(row['aliases'] or ()))
+            for row in rows
+        ]
+        # Built-in drinks win on name clashes
+        self.catalog = DrinkCatalog(DRINKS + tuple(custom)) if custom else self.builtin
+        logger.info("Drink catalog refreshed: %d drinks (%d custom)", len(self.catalog), len(custom))
+        return True
+
+    async def refresh_job(self, context):
+        """JobQueue callback; runs on the event loop like every other DB call"""
+        self.refresh_custom_drinks()
+
     def get_drink_nutrition(self, drink_name, volume_ml):
         """
         Get nutrition for a drink based on volume.
         Returns TOTAL nutrition for the given volume (not per 100ml).
         """
-        drink_lower = drink_name.lower().strip()
-        
-        # Find drink in database
-        if drink_lower in self.drinks_db:
-            per_100ml = self.drinks_db[drink_lower]
-        else:
-            # Try partial match
-            found = False
-            for key in self.drinks_db:
-                if key in drink_lower or drink_lower in key:
-                    per_100ml = self.drinks_db[key]
-                    found = True
-                    logger.info(f"Partial match: '{drink_name}' matched to '{key}'")
-                    break
-            
-            if not found:
-                logger.warning(f"Drink '{drink_name}' not found in database")
-                return None
-        
-        # Calculate for actual volume
+        drink = self.catalog.match(drink_name)
+        if drink is None:
+            logger.warning("Drink '%s' not found in database", drink_name)
+            return None
+
         ratio = volume_ml / 100
-        
         result = {
-            'calories': round(per_100ml['calories'] * ratio, 1),
-            'protein': round(per_100ml['protein'] * ratio, 1),
-            'fat': round(per_100ml['fat'] * ratio, 1),
-            'carbs': round(per_100ml['carbs'] * ratio, 1),
+            'calories': drink.calories * ratio,
+            'protein': drink.protein * ratio,
+            'fat': drink.fat * ratio,
+            'carbs': drink.carbs * ratio,
             'drink_name': drink_name,
             'volume_ml': volume_ml
         }
-        
-        logger.info(f"Drink nutrition for {drink_name} ({volume_ml}ml): {result}")
+
+        logger.debug("Drink nutrition for %s (%sml): %s", drink_name, volume_ml, result)
         return result
-    
+
     def search_drinks(self, query):
         """Search for drinks by name"""
-        query_lower = query.lower().strip()
-        matches = []
-        
-        for drink_name in self.drinks_db.keys():
-            if query_lower in drink_name or drink_name in query_lower:
-                matches.append(drink_name.title())
-        
-        return matches[:10]  # Return max 10 matches
+        return [name.title() for name in self.catalog.search(query)]
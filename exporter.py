@@ -0,0 +1,139 @@
+"""
+Streaming export of intake history (meals, their items and drinks).
+
+Rows come from a server-side named cursor on a dedicated read-only
+connection, `itersize` rows per round trip, and are written as CSV or
+JSON lines through gzip straight into the output file, so memory stays
+flat however long the history is.
+
+    python exporter.py --user 123456789 --format jsonl -o history.jsonl.gz
+    python exporter.py -o everyone.csv.gz
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import sys
+import time
+
+from config import Config
+from database import dedicated_connection
+from logging_utils import configure_logging
+from metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+EXPORT_LATENCY = registry.register(Histogram(
+    'fithub_export_seconds', 'Intake history export duration', ['format']))
+
+FORMATS = ('csv', 'jsonl')
+
+COLUMNS = ('user_id', 'type', 'id', 'meal_id', 'date', 'created_at', 'name',
+           'amount', 'unit', 'calories', 'protein', 'fat', 'carbs')
+
+# Meals, each followed by its items, and drinks in the order they were logged
+EXPORT_QUERY = '''
+    SELECT user_id, type, id, meal_id, date::text, to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS'),
+           name, amount, unit, calories, protein, fat, carbs
+    FROM (
+        SELECT m.user_id, 'meal' AS type, m.id, m.id AS meal_id, m.date, m.created_at, m.meal_type AS name,
+               NULL::float AS amount, NULL AS unit,
+               m.total_calories AS calories, m.total_protein AS protein, m.total_fat AS fat, m.total_carbs AS carbs,
+               0 AS position
+        FROM meals m WHERE {where}
+        UNION ALL
+        SELECT m.user_id, 'item', i.id, i.meal_id, m.date, m.created_at, i.name, i.weight, 'g',
+               NULL, NULL, NULL, NULL, i.id
+        FROM meal_items i JOIN meals m ON m.id = i.meal_id WHERE {where}
+        UNION ALL
+        SELECT d.user_id, 'drink', d.id, NULL, d.date, d.created_at, d.drink_name, d.volume_ml, 'ml',
+               d.calories, d.protein, d.fat, d.carbs, 0
+        FROM drinks d WHERE {where_drinks}
+    ) entries
+    ORDER BY {order}
+'''
+
+# Qualified so the sort uses the native date and timestamp, not the text output
+# columns; drinks have no meal_id and sort after meals logged at the same time
+ORDER = 'entries.date, entries.created_at, entries.meal_id, entries.position'
+
+
+def export_query(user_id=None):
+    if user_id is None:
+        return EXPORT_QUERY.format(where='TRUE', where_drinks='TRUE', order='entries.user_id, ' + ORDER)
+    # A constant leading sort key would only slow the sort down
+    return EXPORT_QUERY.format(where='m.user_id = %(user_id)s', where_drinks='d.user_id = %(user_id)s', order=ORDER)
+
+
+def csv_chunk(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def jsonl_chunk(rows, header=False):
+    return ''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+# Each chunk is formatted in memory and compressed with a single write
+FORMATTERS = {'csv': csv_chunk, 'jsonl': jsonl_chunk}
+
+
+def export_history(output, user_id=None, fmt='csv', itersize=None, conn=None):
+    """
+    Stream one user's history (all users when user_id is None) into the
+    binary file `output` as gzipped CSV or JSON lines; returns rows written.
+    """
+    itersize = itersize or Config.EXPORT_ITERSIZE
+    own_conn = conn is None
+    conn = conn or dedicated_connection(readonly=True)
+    start = time.perf_counter()
+    rows = 0
+    try:
+        with conn.cursor(name='export_history') as cur:
+            cur.itersize = itersize
+            cur.execute(export_query(user_id), {'user_id': user_id})
+            with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=Config.EXPORT_COMPRESSLEVEL) as archive:
+                formatter = FORMATTERS[fmt]
+                archive.write(formatter((), header=True).encode())
+                while True:
+                    chunk = cur.fetchmany(itersize)
+                    if not chunk:
+                        break
+                    archive.write(formatter(chunk).encode())
+                    rows += len(chunk)
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    EXPORT_LATENCY.observe(time.perf_counter() - start, (fmt,))
+    logger.info("Exported %d rows for user %s as %s", rows, user_id, fmt)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--user', type=int, help='only export this user')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--itersize', type=int, help='rows fetched per round trip')
+    parser.add_argument('-o', '--output', help='gzip file to write (default: stdout)')
+    args = parser.parse_args()
+
+    configure_logging()
+    start = time.perf_counter()
+    if args.output:
+        with open(args.output, 'wb') as output:
+            rows = export_history(output, args.user, args.format, args.itersize)
+    else:
+        rows = export_history(sys.stdout.buffer, args.user, args.format, args.itersize)
+    elapsed = time.perf_counter() - start
+    print(f"{rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
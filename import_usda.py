@@ -1,11 +1,13 @@
-import pandas as pd
 import psycopg2
 from config import Config
-import requests
 import io
 
 def import_usda_data():
     """Imports USDA data into the database"""
+    # Heavy imports are deferred until the import actually runs
+    import pandas as pd
+    import requests
+
     conn = psycopg2.connect(Config.DATABASE_URL)
     # Implementation would go here
     pass
@@ -0,0 +1,333 @@
+"""
+Bulk import of meal and drink history from other trackers' CSV exports.
+
+The file is read row by row (plain or gzipped CSV, including our own
+/export files). Common column names are recognised; rows without
+calories get their nutrition from the food index and the drink catalog,
+looked up a chunk at a time. Each chunk is COPYed into a staging table
+and moved into meals and drinks in its own transaction, skipping entries
+already stored with the same (user, timestamp, totals), and the user's
+rollups are rebuilt for the chunk's days.
+
+    python importer.py --user 123456789 history.csv
+    python importer.py --user 123456789 fithub-123456789.csv.gz --dry-run
+"""
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+
+import nutrition
+from backfill_rollups import rebuild
+from config import Config
+from database import dedicated_connection
+from drink_manager import CATALOG
+from logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Canonical field -> header names used by other trackers (lowercase, units stripped)
+COLUMN_ALIASES = {
+    'timestamp': ('created_at', 'timestamp', 'datetime', 'date_time', 'logged_at'),
+    'date': ('date', 'day'),
+    'time': ('time',),
+    'type': ('type', 'kind', 'entry_type'),
+    'meal': ('meal', 'meal_type', 'meal_name'),
+    'name': ('name', 'food', 'food_name', 'item', 'description', 'product', 'drink', 'drink_name'),
+    'amount': ('amount', 'weight', 'grams', 'quantity', 'qty', 'serving_size', 'volume', 'volume_ml'),
+    'unit': ('unit', 'units'),
+    'calories': ('calories', 'kcal', 'energy', 'cal', 'energy_kcal'),
+    'protein': ('protein', 'proteins'),
+    'fat': ('fat', 'fats', 'total_fat'),
+    'carbs': ('carbs', 'carbohydrates', 'carbohydrate', 'total_carbs'),
+}
+
+DATETIME_FORMATS = ('%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p',
+                    '%d.%m.%Y', '%m/%d/%Y')
+
+# Grams or millilitres per unit
+UNITS = {'g': 1, 'gram': 1, 'grams': 1, 'kg': 1000, 'oz': 28.35, 'ml': 1, 'l': 1000, 'cl': 10, 'fl oz': 29.57}
+DRINK_UNITS = ('ml', 'l', 'cl', 'fl oz')
+
+STAGING = '''
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        kind TEXT, meal_type TEXT, name TEXT, amount FLOAT, date DATE, created_at TIMESTAMP,
+        calories FLOAT, protein FLOAT, fat FLOAT, carbs FLOAT
+    ) ON COMMIT DELETE ROWS
+'''
+STAGING_COLUMNS = ('kind', 'meal_type', 'name', 'amount', 'date', 'created_at', 'calories', 'protein', 'fat', 'carbs')
+
+# Dedup against stored rows and within the chunk on (user, timestamp, totals);
+# stored values are compared at the precision exports and imports keep
+INSERT_MEALS = '''
+    INSERT INTO meals (user_id, meal_type, date, total_calories, total_protein, total_fat, total_carbs, created_at)
+    SELECT DISTINCT ON (s.created_at, s.calories, s.protein, s.fat, s.carbs)
+           %(user_id)s, s.meal_type, s.date, s.calories, s.protein, s.fat, s.carbs, s.created_at
+    FROM import_staging s
+    WHERE s.kind = 'meal' AND NOT EXISTS (
+        SELECT 1 FROM meals m
+        WHERE m.user_id = %(user_id)s AND m.date = s.date AND date_trunc('second', m.created_at) = s.created_at
+          AND round(m.total_calories::numeric, 1) = s.calories::numeric
+          AND round(m.total_protein::numeric, 1) = s.protein::numeric
+          AND round(m.total_fat::numeric, 1) = s.fat::numeric
+          AND round(m.total_carbs::numeric, 1) = s.carbs::numeric
+    )
+'''
+INSERT_DRINKS = '''
+    INSERT INTO drinks (user_id, drink_name, volume_ml, calories, protein, fat, carbs, date, created_at)
+    SELECT DISTINCT ON (s.created_at, s.calories, s.protein, s.fat, s.carbs)
+           %(user_id)s, s.name, round(s.amount), s.calories, s.protein, s.fat, s.carbs, s.date, s.created_at
+    FROM import_staging s
+    WHERE s.kind = 'drink' AND NOT EXISTS (
+        SELECT 1 FROM drinks d
+        WHERE d.user_id = %(user_id)s AND d.date = s.date AND date_trunc('second', d.created_at) = s.created_at
+          AND round(d.calories::numeric, 1) = s.calories::numeric
+          AND round(d.protein::numeric, 1) = s.protein::numeric
+          AND round(d.fat::numeric, 1) = s.fat::numeric
+          AND round(d.carbs::numeric, 1) = s.carbs::numeric
+    )
+'''
+
+
+class UnsupportedFile(ValueError):
+    """The file cannot be imported at all (e.g. no recognisable columns)"""
+
+
+def _header_key(header):
+    header = re.sub(r'\(.*?\)|\[.*?\]', '', header or '').strip().lower()
+    return re.sub(r'[\s\-]+', '_', header)
+
+
+def map_columns(headers):
+    """Canonical field -> column index for a header row"""
+    keys = [_header_key(header) for header in headers]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in keys:
+                columns[field] = keys.index(alias)
+                break
+    if 'name' not in columns or not ({'timestamp', 'date'} & columns.keys()):
+        raise UnsupportedFile("The file needs at least a date and a food or drink name column")
+    return columns
+
+
+def parse_number(text):
+    text = (text or '').strip().replace(',', '.')
+    return float(text) if text else None
+
+
+def parse_timestamp(text, time_text=None):
+    text = (text or '').strip()
+    if time_text and time_text.strip():
+        text = f"{text} {time_text.strip()}"
+    try:
+        value = datetime.fromisoformat(text)
+    except ValueError:
+        for fmt in DATETIME_FORMATS:
+            try:
+                value = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Unrecognised date: {text!r}")
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def read_entries(stream, stats):
+    """Yield one dict per importable row of a CSV text stream"""
+    reader = csv.reader(stream)
+    headers = next(reader, [])
+    columns = map_columns(headers)
+    # A 'volume' column means millilitres, i.e. drinks
+    volume = 'amount' in columns and _header_key(headers[columns['amount']]).startswith('volume')
+
+    def field(row, name):
+        index = columns.get(name)
+        return row[index] if index is not None and index < len(row) else None
+
+    for row in reader:
+        if not any(row):
+            continue
+        stats['rows'] += 1
+        kind = (field(row, 'type') or '').strip().lower()
+        if kind == 'item':
+            # Items of meals from our own exports; the meal row carries the totals
+            stats['skipped'] += 1
+            continue
+        try:
+            stamp, day = field(row, 'timestamp'), field(row, 'date')
+            created_at = parse_timestamp(stamp or day, field(row, 'time'))
+            # The logged day may differ from the timestamp's (time zones, backdated entries)
+            date = parse_timestamp(day).date() if stamp and day else created_at.date()
+            amount = parse_number(field(row, 'amount'))
+            unit = (field(row, 'unit') or ('ml' if volume else '')).strip().lower()
+            if amount is not None and unit in UNITS:
+                amount *= UNITS[unit]
+            values = [parse_number(field(row, nutrient)) for nutrient in nutrition.NUTRIENTS]
+            name = (field(row, 'name') or '').strip()
+            if not name and values[0] is None:
+                raise ValueError("neither a name nor calories")
+        except ValueError as e:
+            stats['invalid'] += 1
+            logger.debug("Skipping row %d: %s", stats['rows'], e)
+            continue
+
+        meal_type = (field(row, 'meal') or '').strip() or (name if kind == 'meal' else 'Imported')
+        yield {
+            'kind': 'drink' if kind == 'drink' or unit in DRINK_UNITS else 'meal',
+            'meal_type': meal_type[:50],
+            'name': name[:255],
+            'amount': amount,
+            'date': date,
+            'created_at': created_at,
+            'values': values,
+        }
+
+
+def custom_foods(cur, names):
+    """food_items rows for a chunk's names in one query, keyed by lowercase name"""
+    names = sorted({name.lower().strip() for name in names})
+    if not names:
+        return {}
+    cur.execute('SELECT LOWER(name), calories, protein, fat, carbs, per_grams FROM food_items '
+                'WHERE LOWER(name) = ANY(%s)', (names,))
+    return {row[0]: dict(zip(('calories', 'protein', 'fat', 'carbs', 'per_grams'), row[1:])) for row in cur}
+
+
+def fill_nutrition(cur, entries, stats, drinks=CATALOG):
+    """Estimate calories and macros of entries that came without them, a chunk at a time"""
+    foods = [entry for entry in entries if entry['kind'] == 'meal' and entry['values'][0] is None]
+    if foods:
+        items = [{'name': entry['name'], 'weight': entry['amount'] or 100} for entry in foods]
+        rows = custom_foods(cur, [item['name'] for item in items])
+        estimated = nutrition.item_nutrition(items, rows)
+        for entry, values in zip(foods, estimated.tolist()):
+            entry['values'] = values
+            if rows.get(entry['name'].lower()) is None and \
+                    nutrition.FOOD_TABLE.lookup(entry['name']) == nutrition.FOOD_TABLE.default_id:
+                stats['unmapped'] += 1
+        stats['estimated'] += len(foods)
+
+    for entry in entries:
+        if entry['kind'] == 'drink' and entry['values'][0] is None:
+            drink = drinks.match(entry['name'])
+            ratio = (entry['amount'] or 250) / 100
+            entry['values'] = [value * ratio for value in (drink[1:] if drink else (0, 0, 0, 0))]
+            stats['estimated'] += 1
+            stats['unmapped'] += drink is None
+        entry['values'] = [round(value or 0, 1) for value in entry['values']]
+
+
+def write_chunk(cur, user_id, entries):
+    """COPY a chunk into staging and move new entries into meals and drinks; returns (meals, drinks)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for entry in entries:
+        writer.writerow((entry['kind'], entry['meal_type'], entry['name'],
+                         '' if entry['amount'] is None else entry['amount'],
+                         entry['date'].isoformat(), entry['created_at'].isoformat(timespec='seconds'),
+                         *entry['values']))
+    buffer.seek(0)
+    cur.execute(STAGING)
+    cur.copy_expert(f"COPY import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.execute(INSERT_MEALS, {'user_id': user_id})
+    meals = cur.rowcount
+    cur.execute(INSERT_DRINKS, {'user_id': user_id})
+    return meals, cur.rowcount
+
+
+def open_text(source, filename=''):
+    """Text stream over a binary file, gunzipped when needed"""
+    head = source.read(2)
+    source.seek(0)
+    if head == b'\x1f\x8b' or filename.endswith('.gz'):
+        source = gzip.GzipFile(fileobj=source)
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+
+
+def import_history(source, user_id, filename='', conn=None, chunk_size=None, progress=None,
+                   drinks=CATALOG, dry_run=False):
+    """
+    Import a binary CSV (or .csv.gz) file object for a user; returns stats.
+    `progress(stats)` is called after every chunk.
+    """
+    chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+    stats = dict.fromkeys(('rows', 'meals', 'drinks', 'duplicates', 'invalid', 'skipped',
+                           'estimated', 'unmapped', 'chunks'), 0)
+    own_conn = conn is None
+    conn = conn or dedicated_connection()
+    start = time.perf_counter()
+    try:
+        entries = read_entries(open_text(source, filename), stats)
+        while True:
+            chunk = list(itertools.islice(entries, chunk_size))
+            if not chunk:
+                break
+            try:
+                with conn.cursor() as cur:
+                    fill_nutrition(cur, chunk, stats, drinks)
+                    meals, drinks_added = write_chunk(cur, user_id, chunk)
+                    if meals or drinks_added:
+                        rebuild(cur, user_id, min(entry['date'] for entry in chunk),
+                                max(entry['date'] for entry in chunk))
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"Error importing chunk {stats['chunks'] + 1} for user {user_id}: {e}")
+                conn.rollback()
+                raise
+            stats['chunks'] += 1
+            stats['meals'] += meals
+            stats['drinks'] += drinks_added
+            stats['duplicates'] += len(chunk) - meals - drinks_added
+            stats['seconds'] = time.perf_counter() - start
+            if progress is not None:
+                progress(dict(stats))
+    finally:
+        if own_conn:
+            conn.close()
+    stats['seconds'] = time.perf_counter() - start
+    logger.info("Imported %d meals and %d drinks for user %s (%d duplicates, %d invalid rows)",
+                stats['meals'], stats['drinks'], user_id, stats['duplicates'], stats['invalid'])
+    return stats
+
+
+def format_stats(stats):
+    return (f"{stats['rows']} rows read: {stats['meals']} meals and {stats['drinks']} drinks imported, "
+            f"{stats['duplicates']} duplicates skipped, {stats['invalid']} invalid rows, "
+            f"{stats['estimated']} estimated from names ({stats['unmapped']} unknown)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', help='CSV or .csv.gz file')
+    parser.add_argument('--user', type=int, required=True, help='user to import for')
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--dry-run', action='store_true', help='parse and count without committing')
+    args = parser.parse_args()
+
+    configure_logging()
+
+    def progress(stats):
+        print(f"\r{stats['rows']} rows, {stats['meals'] + stats['drinks']} imported, "
+              f"{stats['rows'] / stats['seconds']:.0f} rows/s", end='', file=sys.stderr, flush=True)
+
+    with open(args.file, 'rb') as source:
+        stats = import_history(source, args.user, args.file, chunk_size=args.chunk_size,
+                               progress=progress, dry_run=args.dry_run)
+    print(file=sys.stderr)
+    print(("Dry run: " if args.dry_run else "") + format_stats(stats) + f" in {stats['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,89 @@
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
+"""
+Keyboards, built once at import and shared by every reply.
+
+Choice menus are inline keyboards whose buttons send '<prefix>:<value>'
+callback data, well within Telegram's 64 bytes. The bot routes presses
+by prefix to the handler of the user's conversation state, which gets
+the value instead of a label to parse. Typing a button's label (or the
+part before its parenthesis) still works for clients without buttons.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 
 __all__ = [
-    'get_user_type_keyboard',
-    'get_confirm_keyboard',
-    'get_meal_type_keyboard',
-    'get_yes_no_keyboard',
-    'get_drink_method_keyboard',
-    'get_drink_categories_keyboard',
-    'get_popular_drinks_keyboard',
-    'get_drink_volumes_keyboard',
-    'get_reference_object_keyboard',
-    'remove_keyboard'
+    'Menu',
+    'USER_TYPE',
+    'GENDER',
+    'ACTIVITY_LEVEL',
+    'GOAL',
+    'MEAL_TYPE',
+    'YES_NO',
+    'REFERENCE_OBJECT',
+    'DRINK_VOLUME',
+    'REMOVE_KEYBOARD'
 ]
 
-def get_user_type_keyboard():
-    keyboard = [
-        ['I am a Trainer', 'I am a Trainee']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_confirm_keyboard():
-    keyboard = [
-        ['✅ Yes, all correct', '❌ No, correct manually']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_meal_type_keyboard():
-    keyboard = [
-        ['Breakfast', 'Lunch'],
-        ['Snack', 'Dinner']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_yes_no_keyboard():
-    keyboard = [
-        ['✅ Yes', '❌ No']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_drink_method_keyboard():
-    keyboard = [
-        ['Enter Drink Name']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_drink_categories_keyboard():
-    keyboard = [
-        ['Water', 'Soda', 'Coffee/Tea'],
-        ['Juice', 'Dairy Drink', 'Alcohol'],
-        ['Energy Drink', 'Sports Drink', 'Other']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_popular_drinks_keyboard():
-    keyboard = [
-        ['Water', 'Cola', 'Coffee'],
-        ['Orange Juice', 'Milk', 'Beer'],
-        ['Red Bull', 'Isotonic', 'Other Drink']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_drink_volumes_keyboard():
-    keyboard = [
-        ['250ml (glass)', '330ml (can)'],
-        ['500ml (bottle)', '1000ml (liter)'],
-        ['Other Volume']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def get_reference_object_keyboard():
-    keyboard = [
-        ['Fork', 'Spoon', 'Phone'],
-        ['Card', 'Palm', 'No Reference']
-    ]
-    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-
-def remove_keyboard():
-    return ReplyKeyboardRemove()
+
+class Menu:
+    """Inline keyboard of (label, value) rows whose buttons send '<prefix>:<value>'"""
+
+    def __init__(self, prefix, rows, error):
+        self.prefix = prefix
+        self.error = error
+        self.labels = {value: label for row in rows for label, value in row}
+        self.aliases = {}
+        for value, label in self.labels.items():
+            for alias in (value, label, label.split(' (')[0]):
+                self.aliases.setdefault(alias.lower(), value)
+        self.markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(label, callback_data=f'{prefix}:{value}') for label, value in row]
+            for row in rows
+        ])
+
+    def parse(self, text):
+        """The value of a typed label or value, or None"""
+        return self.aliases.get(text.strip().lower())
+
+
+USER_TYPE = Menu('ut', [
+    [('Trainer', 'trainer'), ('Trainee', 'trainee')]
+], "Please choose Trainer or Trainee:")
+
+GENDER = Menu('gen', [
+    [('Male', 'male'), ('Female', 'female')]
+], "Please select Male or Female:")
+
+ACTIVITY_LEVEL = Menu('act', [
+    [('Sedentary (minimal activity)', 'sedentary')],
+    [('Light (exercise 1-3 days/week)', 'light')],
+    [('Moderate (exercise 3-5 days/week)', 'medium')],
+    [('Active (exercise 6-7 days/week)', 'active')],
+    [('Very Active (intense exercise + physical job)', 'very_active')]
+], "Please select an activity level from the menu:")
+
+GOAL = Menu('goal', [
+    [('Weight Loss', 'weight_loss')],
+    [('Maintenance', 'maintenance')],
+    [('Weight Gain', 'weight_gain')]
+], "Please select a goal from the menu:")
+
+MEAL_TYPE = Menu('meal', [
+    [('Breakfast', 'breakfast'), ('Lunch', 'lunch')],
+    [('Dinner', 'dinner'), ('Snack', 'snack')]
+], "Please select a meal type:")
+
+YES_NO = Menu('yn', [
+    [('Yes', 'yes'), ('No', 'no')]
+], "Please select Yes or No:")
+
+REFERENCE_OBJECT = Menu('ref', [
+    [('Fork', 'fork'), ('Spoon', 'spoon'), ('Phone', 'phone')],
+    [('Card', 'card'), ('Palm', 'palm'), ('No Reference', 'none')]
+], "Please select a reference object from the menu:")
+
+DRINK_VOLUME = Menu('vol', [
+    [('250ml (glass)', '250'), ('330ml (can)', '330')],
+    [('500ml (bottle)', '500'), ('1000ml (liter)', '1000')],
+    [('Other', 'other')]
+], "Please select volume from the menu:")
+
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
@@ -0,0 +1,117 @@
+import json
+import logging
+import random
+import re
+import time
+
+from config import Config
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Fields holding personal data, redacted in structured records and dict reprs
+PII_FIELDS = ('username', 'first_name', 'last_name', 'text')
+
+_PII_PATTERN = re.compile(r"""(['"]?(?:%s)['"]?\s*[:=]\s*)(['"]).*?\2""" % '|'.join(PII_FIELDS))
+_MENTION_PATTERN = re.compile(r'@\w{3,}')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def redact(message):
+    """Mask PII values in dict reprs and @mentions inside a log message"""
+    message = _PII_PATTERN.sub(r'\1\2***\2', message)
+    return _MENTION_PATTERN.sub('@***', message)
+
+
+class RedactionFilter(logging.Filter):
+    """Redacts PII from messages and extra fields of records that will be emitted"""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        for field in PII_FIELDS:
+            if field in record.__dict__:
+                record.__dict__[field] = '***'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Per call-site rate limiting and sampling.
+
+    Records below WARNING are sampled with `sample_rate`, and each call site
+    (file + line) may emit at most `rate_limit` records per `interval` seconds.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, sample_rate=1.0, rate_limit=0, interval=60.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.interval = interval
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if not self.rate_limit:
+            return True
+
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(site)
+        if window is None or now - window[0] >= self.interval:
+            if window and window[2]:
+                record.suppressed = window[2]
+            self._windows[site] = [now, 1, 0]
+            return True
+        if window[1] < self.rate_limit:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including fields passed through `extra`"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def configure_logging(stream=None):
+    """Configure the root logger from Config (format, level, sampling, redaction)"""
+    handler = logging.StreamHandler(stream)
+    if Config.LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    if Config.LOG_SAMPLE_RATE < 1.0 or Config.LOG_RATE_LIMIT:
+        handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATE, Config.LOG_RATE_LIMIT))
+    if Config.LOG_REDACT:
+        handler.addFilter(RedactionFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(Config.LOG_LEVEL)
+    return handler
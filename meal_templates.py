@@ -0,0 +1,97 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from config import Config
+from database import get_db
+from metrics import Gauge, record_cache, registry
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_CACHE_USERS = registry.register(Gauge(
+    'fithub_meal_template_cache_users', 'Users whose top meal templates are held in memory'))
+
+
+class MealTemplates:
+    """
+    Saved meals per user, with each user's top-N templates (most used first)
+    cached in memory, least recently used users evicted first. Re-logging a
+    template updates the cached entry in place; saving or deleting one drops
+    the user's entry so the next lookup reloads it.
+    """
+
+    def __init__(self, top_n=None, max_users=None):
+        self.top_n = top_n or Config.MEAL_TEMPLATES_TOP_N
+        self.max_users = max_users or Config.MEAL_TEMPLATE_CACHE_USERS
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def db(self):
+        return get_db()
+
+    def top(self, user_id):
+        """The user's top-N templates"""
+        with self.lock:
+            templates = self.entries.get(user_id)
+            if templates is not None:
+                self.entries.move_to_end(user_id)
+        record_cache('meal_templates', templates is not None)
+        if templates is None:
+            templates = [dict(row) for row in self.db.get_meal_templates(user_id, self.top_n)]
+            self._store(user_id, templates)
+        return templates
+
+    def find(self, user_id, name):
+        """A template by name (case-insensitive), from the cache when it is among the top-N"""
+        name = name.strip().lower()
+        template = next((t for t in self.top(user_id) if t['name'].lower() == name), None)
+        if template is None:
+            rows = self.db.get_meal_templates(user_id, 1, name)
+            template = dict(rows[0]) if rows else None
+        return template
+
+    def save(self, user_id, name, meal_id=None):
+        """Save the latest (or given) meal as a template; returns it or None"""
+        template = self.db.save_meal_template(user_id, name.strip(), meal_id)
+        self.forget(user_id)
+        return template
+
+    def delete(self, user_id, name):
+        deleted = self.db.delete_meal_template(user_id, name.strip())
+        self.forget(user_id)
+        return deleted
+
+    def relog(self, user_id, template, date):
+        """Log a template as a new meal with its stored totals; returns the meal or None"""
+        meal = self.db.relog_meal(user_id, 'template', template['id'], date)
+        if meal is None:
+            self.forget(user_id)
+            return None
+        with self.lock:
+            templates = self.entries.get(user_id)
+            if templates is not None:
+                cached = next((t for t in templates if t['id'] == template['id']), None)
+                if cached is None:
+                    # A template outside the top-N may now belong in it
+                    del self.entries[user_id]
+                else:
+                    cached['use_count'] += 1
+                    cached['last_used'] = datetime.now()
+                    templates.sort(key=lambda t: (t['use_count'], t['last_used'] or datetime.min), reverse=True)
+            TEMPLATE_CACHE_USERS.set(len(self.entries))
+        return meal
+
+    def forget(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+            TEMPLATE_CACHE_USERS.set(len(self.entries))
+
+    def _store(self, user_id, templates):
+        with self.lock:
+            self.entries[user_id] = templates
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+            TEMPLATE_CACHE_USERS.set(len(self.entries))
@@ -0,0 +1,259 @@
+import asyncio
+import functools
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast DB lookups to slow Vision calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    """Render a Prometheus label set"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Value that can go up and down, or be read from a callback at scrape time"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set_function(self, function, labels=()):
+        """Read the value from function() on every scrape"""
+        self._functions[labels] = function
+
+    def value(self, labels=()):
+        if labels in self._functions:
+            return self._functions[labels]()
+        return self._values.get(labels, 0)
+
+    def render(self):
+        for labels in list(self._values) + list(self._functions):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {self.value(labels)}"
+
+
+class _HistogramChild:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Bucketed distribution of observed values (latencies in seconds)"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+
+    def observe(self, value, labels=()):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children.setdefault(labels, _HistogramChild(len(self.buckets) + 1))
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+        child.count += 1
+
+    @contextmanager
+    def time(self, labels=()):
+        """Observe the duration of a with-block"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, labels)
+
+    def count(self, labels=()):
+        child = self._children.get(labels)
+        return child.count if child else 0
+
+    def render(self):
+        for labels, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), child.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {child.sum}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {child.count}"
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    'fithub_handler_seconds', 'Telegram handler latency', ['handler']))
+HANDLER_ERRORS = registry.register(Counter(
+    'fithub_handler_errors_total', 'Unhandled exceptions raised by handlers', ['handler']))
+DB_LATENCY = registry.register(Histogram(
+    'fithub_db_query_seconds', 'Database method latency', ['method']))
+VISION_LATENCY = registry.register(Histogram(
+    'fithub_vision_seconds', 'Google Vision call latency', ['operation']))
+CACHE_REQUESTS = registry.register(Counter(
+    'fithub_cache_requests_total', 'Cache lookups by result (hit/miss)', ['cache', 'result']))
+USER_STATES = registry.register(Gauge(
+    'fithub_user_states', 'Number of entries in the in-memory user state dict'))
+
+
+def timed(histogram, labels=(), errors=None):
+    """Decorator observing the call duration of a sync or async function"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(labels)
+                    raise
+                finally:
+                    histogram.observe(perf_counter() - start, labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(labels)
+                raise
+            finally:
+                histogram.observe(perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+def track_handler(func):
+    """Record latency and errors of a bot handler under its function name"""
+    return timed(HANDLER_LATENCY, (func.__name__,), errors=HANDLER_ERRORS)(func)
+
+
+def track_db(func):
+    """Record latency of a Database method under its function name"""
+    return timed(DB_LATENCY, (func.__name__,))(func)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_REQUESTS.inc((cache, 'hit' if hit else 'miss'))
+
+
+# Extra plain-text pages served next to /metrics: path -> render()
+_pages = {}
+
+
+def register_page(path, render):
+    """Serve render() as text/plain on the metrics server"""
+    _pages[path] = render
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            render = registry.render
+        elif path in _pages:
+            render = _pages[path]
+        else:
+            self.send_error(404)
+            return
+
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve /metrics from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,341 @@
+"""
+Shared nutrition engine behind CPFCCalculator and KBJUCalculator.
+
+Holds the Mifflin-St Jeor / TDEE target formula and one per-100g food
+table with English and Russian aliases. Daily targets are memoized on the
+profile tuple and the configured macro ratio.
+
+Meal totals are a gather from the table's NumPy array plus a dot product
+with the weights. Values stay unrounded; only the messages round them.
+NumPy is imported on first use to keep bot startup light.
+"""
+import logging
+from functools import lru_cache
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'medium': 1.55,
+    'active': 1.725,
+    'very_active': 1.9
+}
+
+GOAL_FACTORS = {
+    'weight_loss': 0.85,   # 15% deficit
+    'maintenance': 1.0,
+    'weight_gain': 1.15    # 15% surplus
+}
+
+KCAL_PER_GRAM = {'protein': 4, 'fat': 9, 'carbs': 4}
+
+NUTRIENTS = ('calories', 'protein', 'fat', 'carbs')
+
+# name, per 100g (calories, protein, fat, carbs), aliases (EN + RU)
+FOODS = (
+    # Eggs
+    ('egg', 155, 13, 11, 1.1, ('eggs', 'boiled egg', 'яйцо', 'яйца', 'вареное яйцо')),
+
+    # Vegetables
+    ('vegetable', 40, 2, 0.3, 8, ('vegetables', 'овощ', 'овощи')),
+    ('carrot', 41, 0.9, 0.2, 9.6, ('carrots', 'морковь', 'морковка')),
+    ('tomato', 18, 0.9, 0.2, 3.9, ('tomatoes', 'помидор', 'помидоры', 'томат')),
+    ('cucumber', 15, 0.7, 0.1, 3.6, ('cucumbers', 'огурец', 'огурцы')),
+    ('lettuce', 15, 1.4, 0.2, 2.9, ('salad', 'салат')),
+    ('broccoli', 34, 2.8, 0.4, 7, ('брокколи',)),
+    ('spinach', 23, 2.9, 0.4, 3.6, ('шпинат',)),
+    ('potato', 77, 2, 0.1, 17, ('potatoes', 'картофель', 'картошка')),
+    ('bell pepper', 31, 1, 0.3, 6, ('перец',)),
+    ('onion', 40, 1.1, 0.1, 9, ('onions', 'лук')),
+
+    # Fruits
+    ('fruit', 52, 0.3, 0.2, 14, ('fruits', 'фрукт', 'фрукты')),
+    ('orange', 47, 0.9, 0.1, 12, ('oranges', 'апельсин', 'апельсины')),
+    ('apple', 52, 0.3, 0.2, 14, ('apples', 'яблоко', 'яблоки')),
+    ('banana', 89, 1.1, 0.3, 23, ('bananas', 'банан', 'бананы')),
+    ('grape', 69, 0.7, 0.2, 18, ('grapes', 'виноград')),
+    ('strawberry', 32, 0.7, 0.3, 8, ('strawberries', 'клубника')),
+    ('watermelon', 30, 0.6, 0.2, 8, ('арбуз',)),
+
+    # Proteins
+    ('chicken', 165, 31, 3.6, 0, ('chicken breast', 'курица', 'куриная грудка')),
+    ('beef', 250, 26, 15, 0, ('говядина',)),
+    ('pork', 242, 27, 14, 0, ('свинина',)),
+    ('fish', 120, 20, 5, 0, ('рыба',)),
+    ('salmon', 208, 20, 13, 0, ('лосось', 'семга')),
+    ('tuna', 132, 28, 1, 0, ('тунец',)),
+    ('trout', 148, 21, 7, 0, ('форель',)),
+    ('shrimp', 99, 24, 0.3, 0.2, ('shrimps', 'креветки')),
+
+    # Grains & Carbs
+    ('rice', 130, 2.7, 0.3, 28, ('рис',)),
+    ('pasta', 131, 5, 1.1, 25, ('макароны', 'паста')),
+    ('bread', 265, 9, 3.2, 49, ('хлеб',)),
+    ('oats', 389, 17, 7, 66, ('oatmeal', 'овсянка')),
+    ('quinoa', 120, 4.4, 1.9, 21, ('киноа',)),
+
+    # Dairy
+    ('cheese', 402, 25, 33, 1.3, ('сыр',)),
+    ('milk', 42, 3.4, 1, 4.7, ('молоко',)),
+    ('yogurt', 59, 3.5, 1.5, 6, ('йогурт',)),
+
+    # Prepared Foods
+    ('burger', 295, 17, 12, 28, ('бургер',)),
+    ('pizza', 266, 11, 10, 33, ('пицца',)),
+    ('sandwich', 250, 15, 10, 25, ('сэндвич', 'бутерброд')),
+    ('fries', 312, 3.4, 15, 41, ('french fries', 'картофель фри')),
+
+    # Baked Goods
+    ('muffin', 377, 6.7, 18, 47, ('маффин', 'кекс')),
+    ('cookie', 502, 5.6, 24, 67, ('cookies', 'печенье')),
+    ('cake', 257, 3, 10, 40, ('торт',)),
+
+    # Nuts & Seeds
+    ('almonds', 579, 21, 50, 22, ('миндаль',)),
+    ('walnuts', 654, 15, 65, 14, ('грецкий орех',)),
+    ('peanuts', 567, 26, 49, 16, ('арахис',)),
+
+    # Drinks logged as food
+    ('drink', 42, 0, 0, 10.6, ('напиток',)),
+    ('coffee', 2, 0.3, 0, 0, ('кофе',)),
+    ('tea', 1, 0, 0, 0, ('чай',)),
+)
+
+# Used when nothing matches
+DEFAULT_FOOD = ('default', 150, 8, 5, 15)
+
+
+class FoodTable:
+    """
+    Per-100g nutrition table with an alias index.
+
+    `values` is a contiguous (foods, 4) float64 array of calories, protein,
+    fat and carbs indexed by food id; the columns are views into it.
+
+    Lookup order: exact alias, then the longest alias contained in the
+    name ("картофель фри 150" -> fries, not potato), then an alias that
+    contains the name ("brocc" -> broccoli). Results are cached per name.
+    """
+
+    def __init__(self, foods=FOODS, default=DEFAULT_FOOD):
+        rows = list(foods) + [default[:5] + ((),)]
+        self.names = [row[0] for row in rows]
+        self._rows = [tuple(row[1:5]) for row in rows]
+        self._values = None
+        self.default_id = len(rows) - 1
+
+        self.aliases = {}
+        for food_id, row in enumerate(rows[:-1]):
+            for alias in (row[0],) + tuple(row[5]):
+                if alias in self.aliases:
+                    raise ValueError(f"Alias {alias!r} is listed for two foods")
+                self.aliases[alias] = food_id
+        # Longest first, so the most specific contained alias wins
+        self._by_length = sorted(self.aliases, key=len, reverse=True)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, name):
+        """Food id for a free-text name; the default row when nothing matches"""
+        key = name.lower().strip()
+        food_id = self._cache.get(key)
+        if food_id is None:
+            if len(self._cache) >= 10000:
+                self._cache.clear()
+            food_id = self._cache[key] = self._match(key)
+        return food_id
+
+    def _match(self, key):
+        food_id = self.aliases.get(key)
+        if food_id is not None:
+            return food_id
+        if key:
+            for alias in self._by_length:
+                if alias in key:
+                    logger.debug("Partial match: '%s' matched to '%s'", key, alias)
+                    return self.aliases[alias]
+            for alias in self._by_length:
+                if key in alias:
+                    logger.debug("Partial match: '%s' matched to '%s'", key, alias)
+                    return self.aliases[alias]
+        logger.warning("No match found for '%s', using default values", key)
+        return self.default_id
+
+    def per_100g(self, food_id):
+        return self._rows[food_id]
+
+    @property
+    def values(self):
+        if self._values is None:
+            import numpy as np
+            values = np.array(self._rows, dtype=np.float64)
+            values.setflags(write=False)
+            self._values = values
+        return self._values
+
+    @property
+    def calories(self):
+        return self.values[:, 0]
+
+    @property
+    def protein(self):
+        return self.values[:, 1]
+
+    @property
+    def fat(self):
+        return self.values[:, 2]
+
+    @property
+    def carbs(self):
+        return self.values[:, 3]
+
+    def lookup_many(self, names):
+        """Food ids for a sequence of names as an index array"""
+        import numpy as np
+        return np.fromiter((self.lookup(name) for name in names), dtype=np.intp, count=len(names))
+
+
+FOOD_TABLE = FoodTable()
+
+
+@lru_cache(maxsize=4096)
+def _daily_targets(weight, height, age, gender, activity_level, goal, macro_ratio):
+    if gender.lower() == 'male':
+        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+    else:
+        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+
+    tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, 1.55)
+    calories = tdee * GOAL_FACTORS.get(goal, 1.0)
+    protein, fat, carbs = macro_grams(calories, dict(macro_ratio))
+    return calories, protein, fat, carbs
+
+
+def macro_grams(calories, ratio=None):
+    """Grams of protein, fat and carbs giving `calories` at the macro ratio"""
+    ratio = ratio or Config.MACRO_RATIO
+    return tuple(calories * ratio[macro] / KCAL_PER_GRAM[macro] for macro in ('protein', 'fat', 'carbs'))
+
+
+def daily_targets_raw(weight, height, age, gender, activity_level='medium', goal='maintenance'):
+    """Unrounded (calories, protein, fat, carbs) for a profile"""
+    return _daily_targets(
+        float(weight), float(height), int(age), gender, activity_level, goal,
+        tuple(sorted(Config.MACRO_RATIO.items()))
+    )
+
+
+def daily_targets(weight, height, age, gender, activity_level='medium', goal='maintenance'):
+    """Recommended daily calories and macros, rounded to whole units"""
+    values = daily_targets_raw(weight, height, age, gender, activity_level, goal)
+    return dict(zip(NUTRIENTS, (round(value) for value in values)))
+
+
+def daily_targets_batch(weight, height, age, gender, activity_level, goal):
+    """
+    Vectorized daily_targets_raw over equal-length sequences.
+
+    Returns unrounded (calories, protein, fat, carbs) NumPy arrays.
+    """
+    import numpy as np
+
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    male = np.fromiter((str(value).lower() == 'male' for value in gender), dtype=bool, count=len(weight))
+    activity = np.fromiter((ACTIVITY_MULTIPLIERS.get(value, 1.55) for value in activity_level),
+                           dtype=np.float64, count=len(weight))
+    goal_factor = np.fromiter((GOAL_FACTORS.get(value, 1.0) for value in goal), dtype=np.float64, count=len(weight))
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + np.where(male, 5.0, -161.0)
+    calories = bmr * activity * goal_factor
+    protein, fat, carbs = macro_grams(calories)
+    return calories, protein, fat, carbs
+
+
+def scale(per_100g, weight_grams, per_grams=100):
+    """Nutrition for a portion (unrounded)"""
+    ratio = weight_grams / per_grams
+    return dict(zip(NUTRIENTS, (value * ratio for value in per_100g)))
+
+
+def _db_values(row):
+    return (row['calories'], row['protein'], row['fat'], row['carbs']), row.get('per_grams') or 100
+
+
+def food_nutrition(food_name, weight_grams, db_row=None, table=FOOD_TABLE):
+    """Nutrition of one item: the DB row when given, else the built-in table"""
+    if db_row:
+        values, per_grams = _db_values(db_row)
+        return scale(values, weight_grams, per_grams)
+    return scale(table.per_100g(table.lookup(food_name)), weight_grams)
+
+
+def _weights_per_gram(food_items, db_rows=None, table=FOOD_TABLE):
+    """(weights, per-gram (items, 4) matrix) for [{'name', 'weight'}, ...]"""
+    import numpy as np
+
+    names = [item['name'] for item in food_items]
+    weights = np.fromiter((item['weight'] for item in food_items), dtype=np.float64, count=len(names))
+    per_gram = table.values[table.lookup_many(names)] / 100
+
+    # Custom foods from the database override the built-in rows
+    if db_rows:
+        for i, name in enumerate(names):
+            row = db_rows.get(name.lower().strip())
+            if row:
+                values, per_grams = _db_values(row)
+                per_gram[i] = np.asarray(values, dtype=np.float64) / per_grams
+    return weights, per_gram
+
+
+def meal_vector(food_items, db_rows=None, table=FOOD_TABLE):
+    """Unrounded [calories, protein, fat, carbs] array for [{'name', 'weight'}, ...]"""
+    weights, per_gram = _weights_per_gram(food_items, db_rows, table)
+    return weights @ per_gram
+
+
+def item_nutrition(food_items, db_rows=None, table=FOOD_TABLE):
+    """Unrounded (items, 4) array of calories, protein, fat and carbs per item"""
+    weights, per_gram = _weights_per_gram(food_items, db_rows, table)
+    return per_gram * weights[:, None]
+
+
+def meal_totals(food_items, db=None, table=FOOD_TABLE):
+    """
+    Unrounded totals for [{'name', 'weight'}, ...].
+
+    Custom foods are fetched from the database in one query for the whole
+    meal; everything else comes from the built-in table.
+    """
+    if not food_items:
+        return dict.fromkeys(NUTRIENTS, 0.0)
+    rows = db.get_foods_nutrition([item['name'] for item in food_items]) if db is not None else None
+    return dict(zip(NUTRIENTS, meal_vector(food_items, rows, table).tolist()))
+
+
+def score_meals(meals, table=FOOD_TABLE):
+    """
+    Re-score many meals at once from their items.
+
+    `meals` is a sequence of item lists; returns a (meals, 4) array of
+    unrounded totals. All items are looked up and gathered in one pass and
+    summed per meal with bincount.
+    """
+    import numpy as np
+
+    counts = np.fromiter((len(items) for items in meals), dtype=np.intp, count=len(meals))
+    names = [item['name'] for items in meals for item in items]
+    weights = np.fromiter((item['weight'] for items in meals for item in items), dtype=np.float64, count=len(names))
+    per_item = table.values[table.lookup_many(names)] * (weights / 100)[:, None]
+
+    meal_index = np.repeat(np.arange(len(meals)), counts)
+    return np.column_stack([
+        np.bincount(meal_index, weights=per_item[:, column], minlength=len(meals))
+        for column in range(per_item.shape[1])
+    ])
@@ -0,0 +1,156 @@
+"""
+Outgoing Bot API requests, paced to Telegram's flood limits.
+
+Installed as the application's rate limiter, so every request, replies
+included, passes through it. A global token bucket caps requests per
+second and hands tokens out by lane: interactive replies first, bulk
+sends (rate_limit_args=BULK: reminders, broadcasts) only while no reply
+is waiting. Bulk messages keep TELEGRAM_CHAT_INTERVAL between two
+messages to the same chat (three times that for groups). A 429
+RetryAfter pauses that chat and the bulk lane before the request is
+retried.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from time import monotonic
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import Config
+from metrics import Counter, Gauge, Histogram, registry
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WAIT = registry.register(Histogram(
+    'fithub_outbox_wait_seconds', 'Time Bot API requests waited in the outbox', ['lane']))
+OUTBOX_WAITING = registry.register(Gauge(
+    'fithub_outbox_waiting', 'Bot API requests waiting for a token', ['lane']))
+OUTBOX_RETRIES = registry.register(Counter(
+    'fithub_outbox_retries_total', 'Requests retried after a 429 RetryAfter', ['lane']))
+
+INTERACTIVE, BULK = 'interactive', 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+# Telegram allows about 20 messages a minute to one group
+GROUP_INTERVAL_FACTOR = 3
+
+# Bulk messages handed to the outbox at once by reminders and broadcasts
+BULK_CHUNK = 100
+
+# Chats remembered for pacing before expired entries are dropped
+MAX_PACED_CHATS = 10000
+
+
+class Outbox(BaseRateLimiter):
+    """Priority-laned global rate limiter with per-chat pacing for bulk sends"""
+
+    def __init__(self, rate=None, chat_interval=None, max_retries=None):
+        self.rate = rate or Config.TELEGRAM_MAX_RPS
+        self.chat_interval = chat_interval if chat_interval is not None else Config.TELEGRAM_CHAT_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else Config.TELEGRAM_MAX_RETRIES
+        self.bucket = None
+        self.waiters = []       # heap of (lane priority, arrival, future)
+        self.arrivals = itertools.count()
+        self.chat_next = {}     # chat_id -> when the next bulk message may go out
+        self.bulk_paused_until = 0.0
+        self.wakeup = None
+        self.dispatcher = None
+
+    async def initialize(self):
+        if self.dispatcher is None:
+            # No burst: at most rate + 1 requests fall in any one second
+            self.bucket = TokenBucket(self.rate, 1, monotonic())
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+        for _, _, future in self.waiters:
+            future.cancel()
+        self.waiters.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        await self.initialize()
+        lane = BULK if rate_limit_args == BULK else INTERACTIVE
+        chat_id = data.get('chat_id')
+        queued = monotonic()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, chat_id)
+            if attempt == 0:
+                OUTBOX_WAIT.observe(monotonic() - queued, (lane,))
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                OUTBOX_RETRIES.inc((lane,))
+                if attempt == self.max_retries:
+                    raise
+                until = monotonic() + e.retry_after
+                self.bulk_paused_until = max(self.bulk_paused_until, until)
+                if chat_id is not None:
+                    self.chat_next[chat_id] = max(self.chat_next.get(chat_id, 0.0), until)
+                logger.warning("Flood limit on %s to chat %s; retrying in %ss", endpoint, chat_id, e.retry_after)
+                if lane == INTERACTIVE:
+                    await asyncio.sleep(e.retry_after)
+
+    def _interval(self, chat_id):
+        group = isinstance(chat_id, str) or chat_id < 0
+        return self.chat_interval * (GROUP_INTERVAL_FACTOR if group else 1)
+
+    def _ready_at(self, chat_id):
+        """When the next bulk message may go to the chat"""
+        return max(self.bulk_paused_until, self.chat_next.get(chat_id, 0.0))
+
+    async def _acquire(self, lane, chat_id):
+        """Wait for the chat (bulk only) and a token, then mark the chat as just sent to"""
+        while True:
+            if lane == BULK:
+                wait = self._ready_at(chat_id) - monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+            await self._token(lane)
+            now = monotonic()
+            if lane == BULK and self._ready_at(chat_id) > now:
+                # Another message to this chat got its token first
+                self.bucket.refund()
+                continue
+            break
+        if chat_id is not None:
+            if len(self.chat_next) >= MAX_PACED_CHATS:
+                self.chat_next = {chat: t for chat, t in self.chat_next.items() if t > now}
+            # Replies are never delayed, but bulk sends keep their distance from them too
+            self.chat_next[chat_id] = max(self.chat_next.get(chat_id, 0.0), now + self._interval(chat_id))
+
+    async def _token(self, lane):
+        """Wait for a token; interactive requests are served before bulk ones"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (LANES.index(lane), next(self.arrivals), future))
+        OUTBOX_WAITING.inc((lane,))
+        self.wakeup.set()
+        try:
+            await future
+        finally:
+            OUTBOX_WAITING.dec((lane,))
+
+    async def _dispatch(self):
+        while True:
+            if not self.waiters:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            wait = self.bucket.consume(monotonic())
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            # Popped only now, so a reply that arrived during the wait goes first
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                self.bucket.refund()
+            else:
+                future.set_result(None)
@@ -0,0 +1,225 @@
+import logging
+import math
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Standard portion weights (in grams), used when an item has no geometry
+STANDARD_PORTIONS = {
+    'egg': 50,  # One large egg
+    'carrot': 60,  # Medium carrot stick
+    'orange': 130,  # Medium orange slice (1/4 of whole)
+    'lettuce': 30,  # Small handful
+    'muffin': 80,  # Medium muffin
+    'chicken': 150,  # Standard serving
+    'beef': 150,
+    'fish': 150,
+    'rice': 150,  # Cooked rice serving
+    'bread': 30,  # One slice
+    'pasta': 180,  # Cooked pasta serving
+    'broccoli': 85,
+    'tomato': 100,
+    'apple': 150,
+    'banana': 120,
+    'potato': 150,
+    'cheese': 30,
+    'yogurt': 150,
+}
+
+# Food geometry: (mean thickness in cm, density in g/cm^3).
+# Thickness is volume / top-down area, so round foods get ~2/3 of their height.
+FOOD_GEOMETRY = {
+    'egg': (2.6, 1.03),
+    'chicken': (1.6, 1.05),
+    'beef': (1.5, 1.05),
+    'fish': (2.0, 1.0),
+    'pork': (1.5, 1.05),
+    'carrot': (1.5, 0.6),
+    'broccoli': (4.5, 0.3),
+    'tomato': (3.5, 0.95),
+    'lettuce': (2.0, 0.1),
+    'cucumber': (1.0, 0.7),
+    'bell pepper': (3.0, 0.4),
+    'spinach': (1.5, 0.15),
+    'orange': (2.5, 0.85),
+    'apple': (4.5, 0.8),
+    'banana': (2.7, 0.8),
+    'berry': (1.5, 0.6),
+    'grape': (1.6, 0.65),
+    'watermelon': (3.0, 0.96),
+    'rice': (1.8, 0.75),
+    'bread': (1.2, 0.28),
+    'pasta': (2.5, 0.65),
+    'potato': (3.5, 0.9),
+    'muffin': (5.0, 0.38),
+    'oatmeal': (2.5, 0.9),
+    'cheese': (0.4, 1.1),
+    'yogurt': (4.0, 1.05),
+    'milk': (6.0, 1.03),
+}
+DEFAULT_GEOMETRY = (2.0, 0.8)
+
+# Reference objects: (length in cm, width in cm)
+REFERENCE_OBJECTS = {
+    'fork': (19.0, 2.5),
+    'spoon': (15.0, 3.5),
+    'phone': (14.7, 7.1),
+    'card': (8.56, 5.4),
+    'palm': (10.0, 8.5),
+}
+
+REFERENCE_KEYWORDS = {
+    'fork': ['fork'],
+    'spoon': ['spoon'],
+    'phone': ['mobile phone', 'smartphone', 'telephone', 'phone'],
+    'card': ['credit card', 'card'],
+    'palm': ['hand', 'palm'],
+}
+
+# Objects that are never used as a reference, even when the user picked one
+NON_REFERENCE_LABELS = {'food', 'dish', 'plate', 'bowl', 'tableware', 'dishware', 'table', 'cup', 'glass', 'drink'}
+
+# Share of a bounding box covered by a roughly elliptical food item
+FILL_FACTOR = math.pi / 4
+
+# Area of a typical top-down plate photo, used when there is no reference (cm^2)
+DEFAULT_FRAME_AREA_CM2 = 1000.0
+
+# Objects longer than this (length / width) are scaled by length instead of area
+ELONGATED_RATIO = 2.5
+
+MIN_INSTANCE_WEIGHT = 5
+MAX_INSTANCE_WEIGHT = 800
+MIN_ITEM_WEIGHT = 20
+MAX_ITEM_WEIGHT = 1500
+
+_FOOD_NAMES = list(FOOD_GEOMETRY)
+_FOOD_INDEX = {name: i for i, name in enumerate(_FOOD_NAMES)}
+# Last row holds the default geometry for foods without their own entry
+_THICKNESS = np.array([FOOD_GEOMETRY[n][0] for n in _FOOD_NAMES] + [DEFAULT_GEOMETRY[0]])
+_DENSITY = np.array([FOOD_GEOMETRY[n][1] for n in _FOOD_NAMES] + [DEFAULT_GEOMETRY[1]])
+
+
+def match_reference(label):
+    """Return the reference object key for a detected object label"""
+    label = label.lower()
+    for key, keywords in REFERENCE_KEYWORDS.items():
+        if any(keyword in label for keyword in keywords):
+            return key
+    return None
+
+
+def polygon_areas(polygons):
+    """Shoelace area of each polygon in an (n, k, 2) array"""
+    x = polygons[:, :, 0]
+    y = polygons[:, :, 1]
+    return 0.5 * np.abs(
+        np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+    )
+
+
+def _to_array(polygons):
+    """Pad polygons to the same vertex count by repeating the last vertex"""
+    size = max(len(p) for p in polygons)
+    padded = [list(p) + [p[-1]] * (size - len(p)) for p in polygons]
+    return np.asarray(padded, dtype=float).reshape(len(polygons), size, 2)
+
+
+class PortionEstimator:
+    """Estimates portion weights from detected object geometry"""
+
+    def estimate(self, food_items, detections, image_size=None, reference=None):
+        """
+        Estimate weights for recognized food items.
+
+        food_items: [{'name', 'confidence', 'source'}], one entry per food.
+        detections: every localized object as
+            {'label', 'food', 'score', 'polygon': [[x, y], ...]} in normalized
+            coordinates; 'food' is None for non-food objects.
+        image_size: (width, height) in pixels, if known.
+        reference: reference object selected by the user, if any.
+
+        Returns {'items', 'reference', 'scale'} where items carry
+        'estimated_weight' and 'count'.
+        """
+        width, height = image_size or (1000, 1000)
+        scale = np.array([width, height], dtype=float)
+
+        food_detections = [d for d in detections if d.get('food') and d.get('polygon')]
+        px_per_cm, used_reference = self._find_scale(detections, scale, reference)
+        scale_source = 'reference' if used_reference else 'default'
+        if px_per_cm is None:
+            px_per_cm = math.sqrt(width * height / DEFAULT_FRAME_AREA_CM2)
+
+        weights_by_food = {}
+        counts_by_food = {}
+        if food_detections:
+            polygons = _to_array([d['polygon'] for d in food_detections]) * scale
+            food_idx = np.array([_FOOD_INDEX.get(d['food'], len(_FOOD_NAMES)) for d in food_detections])
+
+            areas_cm2 = polygon_areas(polygons) / (px_per_cm ** 2)
+            weights = areas_cm2 * FILL_FACTOR * _THICKNESS[food_idx] * _DENSITY[food_idx]
+            weights = np.clip(weights, MIN_INSTANCE_WEIGHT, MAX_INSTANCE_WEIGHT)
+
+            for detection, weight in zip(food_detections, weights.tolist()):
+                food = detection['food']
+                weights_by_food[food] = weights_by_food.get(food, 0.0) + weight
+                counts_by_food[food] = counts_by_food.get(food, 0) + 1
+
+        items = []
+        for item in food_items:
+            food = item['name'].lower()
+            if food in weights_by_food:
+                weight = weights_by_food[food]
+                count = counts_by_food[food]
+            else:
+                weight = STANDARD_PORTIONS.get(food, 100)
+                count = 1
+
+            items.append({
+                **item,
+                'estimated_weight': int(max(MIN_ITEM_WEIGHT, min(MAX_ITEM_WEIGHT, round(weight)))),
+                'count': count
+            })
+
+        return {'items': items, 'reference': used_reference, 'scale': scale_source}
+
+    def _find_scale(self, detections, scale, reference):
+        """Return (pixels per cm, reference key) or (None, None) if there is no reference"""
+        candidates = []
+        for detection in detections:
+            if detection.get('food') or not detection.get('polygon'):
+                continue
+            key = match_reference(detection['label'])
+            if key and (reference is None or key == reference):
+                candidates.append((detection['score'], key, detection))
+
+        if not candidates and reference in REFERENCE_OBJECTS:
+            # The user says the reference is in the photo but Vision named it
+            # differently: take the most confident unclaimed non-food object.
+            for detection in detections:
+                if detection.get('food') or not detection.get('polygon'):
+                    continue
+                if detection['label'].lower() in NON_REFERENCE_LABELS:
+                    continue
+                candidates.append((detection['score'], reference, detection))
+
+        if not candidates:
+            return None, None
+
+        _, key, detection = max(candidates, key=lambda c: c[0])
+        points = np.asarray(detection['polygon'], dtype=float) * scale
+        box_w = points[:, 0].max() - points[:, 0].min()
+        box_h = points[:, 1].max() - points[:, 1].min()
+        if box_w <= 0 or box_h <= 0:
+            return None, None
+
+        length, width = REFERENCE_OBJECTS[key]
+        if length / width >= ELONGATED_RATIO:
+            # Thin objects: the box diagonal follows the object's length
+            px_per_cm = math.hypot(box_w, box_h) / length
+        else:
+            px_per_cm = math.sqrt(box_w * box_h / (length * width))
+
+        logger.info(f"Portion scale from {key}: {px_per_cm:.1f} px/cm")
+        return px_per_cm, key
@@ -0,0 +1,195 @@
+import contextvars
+import functools
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from time import perf_counter
+
+from config import Config
+from metrics import Counter as MetricCounter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+QUERIES_PER_UPDATE = registry.register(Histogram(
+    'fithub_db_queries_per_update', 'SQL statements executed per update', ['handler'],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100)))
+N_PLUS_ONE = registry.register(MetricCounter(
+    'fithub_db_n_plus_one_total', 'Updates repeating one query fingerprint (N+1 pattern)', ['handler']))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+_current_scope = contextvars.ContextVar('query_profiler_scope', default=None)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Normalize SQL so that queries differing only in literals share a fingerprint"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(?+)', sql)
+    return ' '.join(sql.split())
+
+
+class _Scope:
+    __slots__ = ('handler', 'queries')
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.queries = []
+
+
+class QueryProfiler:
+    """
+    Records every statement executed through Database.cursor() while enabled.
+
+    Statements are attributed to the update (handler scope) that issued them;
+    at the end of each scope repeated fingerprints are flagged as N+1. The
+    statistics are updated under a lock, since statements also run in worker
+    threads and report() runs on the metrics server's thread.
+    """
+
+    def __init__(self, enabled=False, n_plus_one_threshold=3):
+        self.enabled = enabled
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # fingerprint -> [calls, total seconds, rows, max seconds]
+            self.queries = {}
+            # handler -> [updates, statements, total seconds]
+            self.handlers = defaultdict(lambda: [0, 0, 0.0])
+            # (handler, fingerprint) -> [flagged updates, max repeats]
+            self.n_plus_one = {}
+
+    def record(self, sql, duration, rows):
+        key = fingerprint(sql)
+        with self.lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = [0, 0.0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += max(rows, 0)
+            if duration > stats[3]:
+                stats[3] = duration
+
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.queries.append((key, duration))
+
+    @contextmanager
+    def scope(self, handler):
+        """Attribute statements to one update; nested scopes join the outer one"""
+        if not self.enabled or _current_scope.get() is not None:
+            yield
+            return
+
+        scope = _Scope(handler)
+        token = _current_scope.set(scope)
+        try:
+            yield
+        finally:
+            _current_scope.reset(token)
+            self._finish(scope)
+
+    def _finish(self, scope):
+        with self.lock:
+            stats = self.handlers[scope.handler]
+            stats[0] += 1
+            stats[1] += len(scope.queries)
+            stats[2] += sum(duration for _, duration in scope.queries)
+        QUERIES_PER_UPDATE.observe(len(scope.queries), (scope.handler,))
+
+        repeats = Counter(key for key, _ in scope.queries)
+        for key, count in repeats.items():
+            if count < self.n_plus_one_threshold:
+                continue
+            with self.lock:
+                flagged = self.n_plus_one.setdefault((scope.handler, key), [0, 0])
+                flagged[0] += 1
+                flagged[1] = max(flagged[1], count)
+            N_PLUS_ONE.inc((scope.handler,))
+            logger.warning("Possible N+1 in %s: %d x %s", scope.handler, count, key[:120])
+
+    def report(self, top=20):
+        """Plain-text report: top queries by total time, handlers, N+1 findings"""
+        # Copied under the lock; statements keep being recorded while the report is formatted
+        with self.lock:
+            queries = {key: tuple(stats) for key, stats in self.queries.items()}
+            handlers = {handler: tuple(stats) for handler, stats in self.handlers.items()}
+            n_plus_one = {key: tuple(flagged) for key, flagged in self.n_plus_one.items()}
+
+        lines = [f"Top {top} queries by total time:"]
+        lines.append(f"{'calls':>7} {'total ms':>10} {'mean ms':>8} {'max ms':>8} {'rows':>8}  query")
+        ranked = sorted(queries.items(), key=lambda kv: -kv[1][1])[:top]
+        for key, (calls, total, rows, slowest) in ranked:
+            lines.append(f"{calls:>7} {total * 1000:>10.1f} {total / calls * 1000:>8.2f} "
+                         f"{slowest * 1000:>8.2f} {rows:>8}  {key[:100]}")
+
+        lines.append("")
+        lines.append("Queries per update by handler:")
+        lines.append(f"{'updates':>7} {'q/update':>9} {'ms/update':>10}  handler")
+        for handler, (updates, statements, total) in sorted(handlers.items(), key=lambda kv: -kv[1][2]):
+            lines.append(f"{updates:>7} {statements / updates:>9.1f} {total / updates * 1000:>10.2f}  {handler}")
+
+        if n_plus_one:
+            lines.append("")
+            lines.append("Possible N+1 patterns (same fingerprint repeated within one update):")
+            for (handler, key), (updates, repeats) in sorted(n_plus_one.items(), key=lambda kv: -kv[1][1]):
+                lines.append(f"  {handler}: up to {repeats}x in {updates} updates: {key[:100]}")
+        return '\n'.join(lines) + '\n'
+
+
+class ProfilingCursor:
+    """Cursor proxy timing execute() calls into the profiler"""
+
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def execute(self, query, vars=None):
+        start = perf_counter()
+        try:
+            return self._cursor.execute(query, vars)
+        finally:
+            if isinstance(query, bytes):
+                query = query.decode('utf-8', 'replace')
+            elif not isinstance(query, str):
+                query = query.as_string(self._cursor)
+            self._profiler.record(query, perf_counter() - start, self._cursor.rowcount)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+profiler = QueryProfiler(Config.QUERY_PROFILING, Config.QUERY_PROFILING_N_PLUS_ONE)
+
+
+def profiled(handler):
+    """Wrap a registered bot callback so each update gets its own profiling scope"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return await handler(*args, **kwargs)
+        with profiler.scope(handler.__name__):
+            return await handler(*args, **kwargs)
+    return wrapper
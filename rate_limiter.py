@@ -0,0 +1,178 @@
+import logging
+import time
+
+from telegram.ext import ApplicationHandlerStop
+
+from config import Config
+from metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = registry.register(Counter(
+    'fithub_rate_limited_total', 'Updates rejected by the rate limiter', ['operation']))
+RATE_LIMIT_BUCKETS = registry.register(Gauge(
+    'fithub_rate_limit_buckets', 'Per-user token buckets held in memory'))
+
+# Commands with their own bucket on top of the general per-user one
+COMMAND_OPERATIONS = {
+    '/stats': 'stats',
+    '/restart': 'restart',
+    '/export': 'export',
+    '/import': 'import',
+    '/broadcast': 'broadcast',
+}
+
+# Conversation states in which a photo is analysed with Vision
+VISION_STATES = frozenset({'awaiting_food_photo'})
+
+SLOW_DOWN_MESSAGES = {
+    'update': "You're sending messages too fast. Please slow down and try again in {wait} s.",
+    'photo': "Too many photos in a short time. Please wait {wait} s before sending another one.",
+    'stats': "Statistics were requested very recently. Please try again in {wait} s.",
+    'restart': "Restart was used very recently. Please try again in {wait} s.",
+    'export': "An export was requested very recently. Please try again in {wait} s.",
+    'import': "An import was started very recently. Please try again in {wait} s.",
+    'broadcast': "A broadcast was sent very recently. Please try again in {wait} s.",
+    'vision': "Photo analysis is busy right now. Please try again in {wait} s.",
+}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'notified')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.notified = False
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, now, cost=1):
+        """Take `cost` tokens; return 0 on success or seconds until enough are available"""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            self.notified = False
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost=1):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+    def idle(self, now):
+        """True once the bucket would be full again, i.e. it can be forgotten"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """
+    Token buckets per (user, operation) plus a global Vision bucket.
+
+    Runs as a TypeHandler in group -1 so throttled updates never reach the
+    regular handlers. Idle buckets are dropped every `cleanup_interval`
+    seconds; a user is told to slow down once per throttled streak. Given
+    `user_state` (user id -> conversation state), photos are charged only
+    in states that send them to Vision, not e.g. a trainer's broadcast.
+    """
+
+    def __init__(self, limits=None, vision_qps=None, cleanup_interval=60.0, clock=time.monotonic,
+                 user_state=None):
+        # operation -> (tokens per minute, burst)
+        self.limits = limits or Config.RATE_LIMITS
+        self.user_state = user_state
+        vision_qps = Config.VISION_MAX_QPS if vision_qps is None else vision_qps
+        self.clock = clock
+        self.cleanup_interval = cleanup_interval
+        self.buckets = {}
+        self.vision = TokenBucket(vision_qps, max(1.0, vision_qps), clock()) if vision_qps else None
+        self._last_cleanup = clock()
+        RATE_LIMIT_BUCKETS.set_function(lambda: len(self.buckets))
+
+    def operations(self, update):
+        """Operations an update is charged for, cheapest first"""
+        message = update.message
+        if message is None:
+            return ('update',)
+        if message.photo:
+            if self.user_state is not None and self.user_state(update.effective_user.id) not in VISION_STATES:
+                return ('update',)
+            return ('update', 'photo')
+        text = message.text or ''
+        if text.startswith('/'):
+            command = text.split(maxsplit=1)[0].split('@', 1)[0]
+            if command in COMMAND_OPERATIONS:
+                return ('update', COMMAND_OPERATIONS[command])
+        return ('update',)
+
+    def _bucket(self, user_id, operation, now):
+        key = (user_id, operation)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            per_minute, burst = self.limits[operation]
+            bucket = self.buckets[key] = TokenBucket(per_minute / 60.0, burst, now)
+        return bucket
+
+    def acquire(self, user_id, operations):
+        """
+        Charge one token per operation.
+
+        Returns (None, None, 0) when allowed, otherwise (operation, bucket,
+        wait) for the first exhausted bucket; tokens already taken are refunded.
+        """
+        now = self.clock()
+        if now - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup(now)
+
+        taken = []
+        for operation in operations:
+            if operation not in self.limits:
+                continue
+            bucket = self._bucket(user_id, operation, now)
+            wait = bucket.consume(now)
+            if wait:
+                for previous in taken:
+                    previous.refund()
+                return operation, bucket, wait
+            taken.append(bucket)
+
+        if self.vision is not None and 'photo' in operations:
+            wait = self.vision.consume(now)
+            if wait:
+                for previous in taken:
+                    previous.refund()
+                return 'vision', self.vision, wait
+        return None, None, 0.0
+
+    def cleanup(self, now=None):
+        now = self.clock() if now is None else now
+        idle = [key for key, bucket in self.buckets.items() if bucket.idle(now)]
+        for key in idle:
+            del self.buckets[key]
+        self._last_cleanup = now
+        if idle:
+            logger.debug("Rate limiter dropped %d idle buckets, %d left", len(idle), len(self.buckets))
+
+    async def check(self, update, context):
+        """Pre-handler: stop throttled updates and tell the user once"""
+        user = update.effective_user
+        if user is None:
+            return
+
+        operation, bucket, wait = self.acquire(user.id, self.operations(update))
+        if operation is None:
+            return
+
+        RATE_LIMITED.inc((operation,))
+        logger.info("Rate limited user %s on %s (retry in %.1fs)", user.id, operation, wait)
+        # The shared Vision bucket is not per user, so every user hitting it is told
+        if (not bucket.notified or operation == 'vision') and update.message is not None:
+            if operation != 'vision':
+                bucket.notified = True
+            await update.message.reply_text(SLOW_DOWN_MESSAGES[operation].format(wait=max(1, round(wait))))
+        raise ApplicationHandlerStop
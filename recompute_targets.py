@@ -0,0 +1,148 @@
+"""
+Recompute stored daily calorie targets for all users.
+
+Run after changing activity multipliers, goal factors or the target
+formula in nutrition.py. Profiles are read in id-ordered chunks, targets
+are computed with NumPy for the whole chunk, and changed rows are written
+back with one UPDATE ... FROM (VALUES ...) per chunk.
+
+    python recompute_targets.py --dry-run
+    python recompute_targets.py --chunk-size 5000
+"""
+import argparse
+import logging
+import time
+
+from psycopg2.extras import execute_values
+
+import nutrition
+from database import get_db
+from logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_QUERY = '''
+    SELECT id, weight, height, age, gender, activity_level, goal, daily_calories
+    FROM users
+    WHERE id > %s
+      AND weight IS NOT NULL AND height IS NOT NULL AND age IS NOT NULL AND gender IS NOT NULL
+    ORDER BY id
+    LIMIT %s
+'''
+
+UPDATE_QUERY = '''
+    UPDATE users SET daily_calories = v.daily_calories
+    FROM (VALUES %s) AS v(id, daily_calories)
+    WHERE users.id = v.id
+'''
+
+
+def load_chunk(db, after_id, size):
+    """Next chunk of complete profiles as column lists"""
+    with db.cursor() as cur:
+        cur.execute(PROFILE_QUERY, (after_id, size))
+        rows = cur.fetchall()
+    return list(zip(*rows)) if rows else None
+
+
+def compute_chunk(columns):
+    """(ids, old calories, new calories) for the chunk, new values rounded as stored by the bot"""
+    import numpy as np
+
+    ids, weight, height, age, gender, activity_level, goal, stored = columns
+    calories = np.round(nutrition.daily_targets_batch(weight, height, age, gender, activity_level, goal)[0])
+    old = np.array([np.nan if value is None else value for value in stored], dtype=np.float64)
+    return np.asarray(ids, dtype=np.int64), old, calories
+
+
+def write_chunk(db, ids, calories):
+    with db.cursor() as cur:
+        execute_values(
+            cur, UPDATE_QUERY,
+            list(zip(ids.tolist(), calories.tolist())),
+            template='(%s::bigint, %s::float)', page_size=len(ids)
+        )
+    db.conn.commit()
+
+
+def recompute(db, chunk_size=5000, dry_run=False, sample=10):
+    """Recompute all targets; returns a summary dict"""
+    import numpy as np
+
+    start = time.perf_counter()
+    after_id = 0
+    scanned = changed = filled = 0
+    deltas = []
+    examples = []
+
+    while True:
+        columns = load_chunk(db, after_id, chunk_size)
+        if columns is None:
+            break
+        ids, old, new = compute_chunk(columns)
+        after_id = int(ids[-1])
+        scanned += len(ids)
+
+        # NULL or different stored value; stored values may carry float noise
+        mask = np.isnan(old) | (np.abs(old - new) >= 0.5)
+        if mask.any():
+            changed += int(mask.sum())
+            missing = np.isnan(old)
+            filled += int(missing.sum())
+            deltas.append((new - old)[mask & ~missing])
+            for user_id, before, after in zip(ids[mask][:sample], old[mask][:sample], new[mask][:sample]):
+                if len(examples) < sample:
+                    examples.append((int(user_id), None if np.isnan(before) else before, after))
+            if not dry_run:
+                try:
+                    write_chunk(db, ids[mask], new[mask])
+                except Exception as e:
+                    logger.error(f"Error writing targets after user {after_id}: {e}")
+                    db.conn.rollback()
+                    raise
+
+        logger.info("Processed %d users (%d changed) up to id %s", scanned, changed, after_id)
+
+    elapsed = time.perf_counter() - start
+    delta = np.concatenate(deltas) if deltas else np.zeros(0)
+    return {
+        'scanned': scanned,
+        'changed': changed,
+        'filled': filled,
+        'seconds': elapsed,
+        'users_per_second': scanned / elapsed if elapsed else 0.0,
+        'mean_delta': float(delta.mean()) if len(delta) else 0.0,
+        'max_abs_delta': float(np.abs(delta).max()) if len(delta) else 0.0,
+        'examples': examples,
+        'dry_run': dry_run,
+    }
+
+
+def format_summary(summary):
+    mode = "Dry run" if summary['dry_run'] else "Updated"
+    lines = [
+        f"{mode}: {summary['changed']} of {summary['scanned']} profiles changed "
+        f"in {summary['seconds']:.2f}s ({summary['users_per_second']:.0f} users/s)",
+        f"Targets set where missing: {summary['filled']}",
+        f"Calorie change of existing targets: mean {summary['mean_delta']:+.1f} kcal, max {summary['max_abs_delta']:.0f} kcal",
+    ]
+    for user_id, before, after in summary['examples']:
+        before = 'NULL' if before is None else f"{before:.0f}"
+        lines.append(f"  user {user_id}: {before} -> {after:.0f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--dry-run', action='store_true', help='report the differences without writing')
+    parser.add_argument('--sample', type=int, default=10, help='changed profiles to list')
+    args = parser.parse_args()
+
+    configure_logging()
+    summary = recompute(get_db(), args.chunk_size, args.dry_run, args.sample)
+    print(format_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
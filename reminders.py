@@ -0,0 +1,170 @@
+"""
+Daily nudges ("you haven't logged lunch", "protein is at 40% by 6pm").
+
+All reminders run on one JobQueue job instead of a timer per user. Each
+nudge is a bucket in a heap keyed by its next due time; a tick pops the
+due buckets, finds every eligible user with one set-based query over the
+users and today's daily_totals, and sends to them in the background
+through the outbox's bulk lane, which paces them to Telegram's limits.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, time, timedelta
+from time import perf_counter
+
+from telegram.error import Forbidden, TelegramError
+
+import nutrition
+from config import Config
+from database import dedicated_connection, get_db
+from metrics import Counter, Histogram, registry
+from outbox import BULK, BULK_CHUNK
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_SENT = registry.register(Counter(
+    'fithub_reminders_total', 'Reminder messages by nudge and result', ['nudge', 'result']))
+REMINDER_RUN = registry.register(Histogram(
+    'fithub_reminder_run_seconds', 'Time to select and message every user of a nudge', ['nudge']))
+
+# Seconds between checks of the heap
+TICK_SECONDS = 60
+
+# Active users with a calorie target; t is today's rollup row (NULL if nothing is logged)
+ELIGIBLE = '''
+    SELECT u.id, COALESCE(t.protein, 0) AS protein, u.daily_calories * %(protein_per_kcal)s AS protein_target
+    FROM users u
+    LEFT JOIN daily_totals t ON t.user_id = u.id AND t.date = %(today)s
+    WHERE u.reminders AND u.daily_calories > 0
+      AND EXISTS (SELECT 1 FROM daily_totals a
+                  WHERE a.user_id = u.id AND a.date BETWEEN %(today)s::date - %(active_days)s AND %(today)s)
+      AND {condition}
+'''
+
+# Nudge -> (who gets it, message)
+NUDGES = {
+    'lunch': (
+        # The bot stores meal types lowercased, imports keep the file's spelling
+        "NOT EXISTS (SELECT 1 FROM meals m WHERE m.user_id = u.id AND m.date = %(today)s "
+        "AND LOWER(m.meal_type) = 'lunch')",
+        "You haven't logged lunch yet today. Use /add_meal, or /repeat for a meal you often eat.",
+    ),
+    'protein': (
+        "COALESCE(t.protein, 0) < %(protein_share)s * u.daily_calories * %(protein_per_kcal)s",
+        "Protein is at {share:.0%} of your target so far ({protein:.0f} of {target:.0f} g). "
+        "A protein-rich dinner will help you catch up.",
+    ),
+    'evening': (
+        "t.user_id IS NULL",
+        "Nothing logged today yet. Add today's meals with /add_meal so your reports stay complete.",
+    ),
+}
+
+
+def next_time(at, now):
+    """The first datetime after `now` at the 'HH:MM' time of day `at`"""
+    due = datetime.combine(now.date(), time.fromisoformat(at))
+    return due if due > now else due + timedelta(days=1)
+
+
+def eligibility_params(today):
+    return {
+        'today': today,
+        'active_days': Config.REMINDER_ACTIVE_DAYS,
+        'protein_share': Config.REMINDER_PROTEIN_SHARE,
+        'protein_per_kcal': Config.MACRO_RATIO['protein'] / nutrition.KCAL_PER_GRAM['protein'],
+    }
+
+
+def eligible_users(nudge, today, conn=None):
+    """Rows (id, protein, protein_target) of every user who should get a nudge today"""
+    own_conn = conn is None
+    conn = conn or dedicated_connection(readonly=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ELIGIBLE.format(condition=NUDGES[nudge][0]), eligibility_params(today))
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def format_nudge(nudge, row):
+    _, protein, target = row
+    return NUDGES[nudge][1].format(share=protein / target if target else 0, protein=protein, target=target)
+
+
+async def send(bot, chat_id, text):
+    """Send one message through the outbox's bulk lane; returns 'sent', 'blocked' or 'failed'"""
+    try:
+        await bot.send_message(chat_id, text, rate_limit_args=BULK)
+        return 'sent'
+    except Forbidden:
+        return 'blocked'
+    except TelegramError as e:
+        logger.warning("Reminder to %s failed: %s", chat_id, e)
+        return 'failed'
+
+
+async def send_bulk(bot, messages):
+    """Send (chat_id, text) pairs, BULK_CHUNK in flight at a time; the outbox paces them"""
+    results = []
+    for i in range(0, len(messages), BULK_CHUNK):
+        results += await asyncio.gather(*(send(bot, chat_id, text) for chat_id, text in messages[i:i + BULK_CHUNK]))
+    return results
+
+
+class ReminderScheduler:
+    """Heap of (due time, nudge) served by a single repeating job"""
+
+    def __init__(self, times=None, now=None):
+        now = now or datetime.now()
+        self.heap = [(next_time(at, now), nudge) for nudge, at in (times or Config.REMINDER_TIMES).items()]
+        heapq.heapify(self.heap)
+        self.running = set()
+
+    def due(self, now):
+        """Pop the (nudge, day) buckets due by `now`, re-queueing each for its next day"""
+        buckets = []
+        while self.heap and self.heap[0][0] <= now:
+            due, nudge = heapq.heappop(self.heap)
+            buckets.append((nudge, due.date()))
+            while due <= now:
+                due += timedelta(days=1)
+            heapq.heappush(self.heap, (due, nudge))
+        return buckets
+
+    async def tick(self, context):
+        """JobQueue callback; buckets are sent in the background so ticks stay short"""
+        for nudge, day in self.due(datetime.now()):
+            task = asyncio.create_task(self.run(context.bot, nudge, day))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def run(self, bot, nudge, day):
+        """Message every user eligible for a nudge; returns results by kind"""
+        start = perf_counter()
+        try:
+            rows = await asyncio.to_thread(eligible_users, nudge, day)
+            results = await send_bulk(bot, [(row[0], format_nudge(nudge, row)) for row in rows])
+        except Exception as e:
+            logger.error(f"Error sending {nudge} reminders: {e}", exc_info=True)
+            return None
+
+        counts = dict.fromkeys(('sent', 'blocked', 'failed'), 0)
+        for result in results:
+            counts[result] += 1
+        for result, count in counts.items():
+            REMINDERS_SENT.inc((nudge, result), count)
+        blocked = [row[0] for row, result in zip(rows, results) if result == 'blocked']
+        if blocked:
+            # Users who blocked the bot are not asked again
+            get_db().set_reminders(blocked, False)
+
+        elapsed = perf_counter() - start
+        REMINDER_RUN.observe(elapsed, (nudge,))
+        logger.info("Sent %s reminders for %s in %.1fs: %s", nudge, day, elapsed, counts)
+        return counts
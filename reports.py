@@ -0,0 +1,109 @@
+"""
+Weekly and monthly reports served from the rollup tables.
+
+A week report reads at most 7 daily rows and 2 weekly rows, a month report
+at most 6 weekly rows and 2 monthly rows, however much history a user has.
+"""
+import calendar
+from datetime import date, timedelta
+
+from config import Config
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def previous_month_start(day):
+    return month_start(month_start(day) - timedelta(days=1))
+
+
+def week_report(db, user_id, today=None):
+    """This week's days plus the weekly rollup"""
+    today = today or date.today()
+    start = week_start(today)
+    days = {row['start']: row for row in db.get_totals('day', user_id, start, start + timedelta(days=6))}
+    weeks = db.get_totals('week', user_id, start - timedelta(weeks=1), start)
+    totals = {row['start']: row for row in weeks}
+    series = [
+        (f"{WEEKDAYS[i]} {day.day:02d}", days.get(day))
+        for i, day in enumerate(start + timedelta(days=n) for n in range((today - start).days + 1))
+    ]
+    return {
+        'start': start,
+        'title': f"Week of {start:%d %b}",
+        'series': series,
+        'summary': totals.get(start),
+        'previous': totals.get(start - timedelta(weeks=1)),
+        'previous_label': "last week",
+    }
+
+
+def month_report(db, user_id, today=None):
+    """This month's weeks plus the monthly rollup"""
+    today = today or date.today()
+    start = month_start(today)
+    previous = previous_month_start(today)
+    weeks = db.get_totals('week', user_id, week_start(start), today)
+    months = {row['start']: row for row in db.get_totals('month', user_id, previous, start)}
+    return {
+        'start': start,
+        'title': f"{calendar.month_name[start.month]} {start.year}",
+        'series': [(f"Week of {row['start']:%d %b}", row) for row in weeks],
+        'summary': months.get(start),
+        'previous': months.get(previous),
+        'previous_label': calendar.month_name[previous.month],
+    }
+
+
+def average_calories(row):
+    """Average calories per logged day of a rollup row (a day row is its own average)"""
+    return row['calories'] / row['days_logged'] if 'days_logged' in row else row['calories']
+
+
+def format_line(label, row):
+    if row is None:
+        return f"{label}: -"
+    calories = average_calories(row)
+    target = row.get('target_calories')
+    progress = f" ({calories / target * 100:.0f}%)" if target else ""
+    if 'days_logged' in row:
+        return (f"{label}: <b>{calories:.0f}</b> kcal/day{progress}, "
+                f"{row['days_on_target']}/{row['days_logged']} days on target")
+    return f"{label}: <b>{calories:.0f}</b> kcal{progress}"
+
+
+def format_report(report, name=None):
+    """HTML message for a week or month report"""
+    heading = f"<b>{report['title']}</b>" + (f" - {name}" if name else "")
+    summary = report['summary']
+    if summary is None:
+        return f"{heading}\n\nNo meals or drinks logged yet."
+
+    days = summary['days_logged']
+    lines = [heading, ""]
+    lines += [format_line(label, row) for label, row in report['series']]
+    lines += [
+        "",
+        f"<b>Average per logged day ({days} day{'s' if days != 1 else ''}):</b>",
+        f"Calories: <b>{summary['calories'] / days:.0f} kcal</b>"
+        + (f" / {summary['target_calories']:.0f} target" if summary['target_calories'] else ""),
+        f"Protein: <b>{summary['protein'] / days:.0f} g</b>",
+        f"Fat: <b>{summary['fat'] / days:.0f} g</b>",
+        f"Carbs: <b>{summary['carbs'] / days:.0f} g</b>",
+        "",
+        f"Adherence: <b>{summary['days_on_target'] / days * 100:.0f}%</b> "
+        f"({summary['days_on_target']} of {days} days within "
+        f"{Config.ADHERENCE_TOLERANCE * 100:.0f}% of target)",
+    ]
+    previous = report['previous']
+    if previous is not None:
+        change = summary['calories'] / days - average_calories(previous)
+        lines.append(f"Vs {report['previous_label']}: {change:+.0f} kcal/day")
+    return "\n".join(lines)
@@ -0,0 +1,155 @@
+import logging
+from time import perf_counter
+
+from telegram.error import BadRequest
+
+from keyboards import REMOVE_KEYBOARD
+from metrics import Counter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+STATE_LATENCY = registry.register(Histogram(
+    'fithub_state_seconds', 'Text message handling latency by conversation state', ['state']))
+STATE_REJECTED = registry.register(Counter(
+    'fithub_state_rejected_total', 'Messages rejected by a state validator', ['state']))
+STATE_EXPIRED = registry.register(Counter(
+    'fithub_state_expired_total', 'Conversation states abandoned past their timeout', ['state']))
+STALE_PRESSES = registry.register(Counter(
+    'fithub_state_stale_presses_total', 'Menu buttons pressed after the conversation moved on', ['prefix']))
+
+EXPIRED_MESSAGE = "This step has expired. Please start again with the command you were using."
+STALE_MESSAGE = "This menu is no longer active."
+
+
+def number_between(low, high, error, cast=float):
+    """Validator accepting numbers in [low, high]"""
+    def validate(text):
+        try:
+            value = cast(text)
+        except ValueError:
+            return "Please enter a valid number:"
+        return None if low <= value <= high else error
+    return validate
+
+
+class Route:
+    __slots__ = ('state', 'handler', 'validate', 'menu', 'prefix', 'prompt', 'timeout', 'expired')
+
+    def __init__(self, state, handler, validate=None, menu=None, prefix=None, prompt=False,
+                 timeout=None, expired=None):
+        self.state = state
+        self.handler = handler
+        self.validate = validate
+        self.menu = menu
+        self.prefix = menu.prefix if menu is not None else prefix
+        self.prompt = prompt
+        self.timeout = timeout
+        self.expired = expired
+
+
+class StateRouter:
+    """
+    Dispatches text messages and menu button presses to the handler
+    registered for the user's state.
+
+    A route with a menu passes its handlers the chosen value, from a
+    pressed button ('<prefix>:<value>' callback data) or a typed label,
+    and replies with the menu's error and keyboard to anything else. A
+    route may instead validate text before its handler runs, take presses
+    of a menu built per reply (`prefix`), and expire after `timeout`
+    seconds in the state, sending the user back to the main menu.
+    Presses of a menu the user's state no longer shows are refused; with
+    `prompt`, so are presses under any message but the one recorded with
+    UserManager.set_prompt after entering the state, for menus shared by
+    states or shown again for each meal.
+    Registering a state twice raises ValueError.
+    """
+
+    def __init__(self, user_manager, fallback):
+        self.user_manager = user_manager
+        self.fallback = fallback
+        self.routes = {}
+
+    @property
+    def prefixes(self):
+        """Callback data prefixes taken by routes"""
+        return {route.prefix for route in self.routes.values() if route.prefix}
+
+    def add(self, states, handler, validate=None, menu=None, prefix=None, prompt=False, timeout=None, expired=None):
+        if isinstance(states, str):
+            states = (states,)
+        for state in states:
+            existing = self.routes.get(state)
+            if existing is not None:
+                raise ValueError(
+                    f"State {state} is already routed to {existing.handler.__name__}, "
+                    f"cannot route it to {handler.__name__}"
+                )
+            self.routes[state] = Route(state, handler, validate, menu, prefix, prompt, timeout, expired)
+
+    async def dispatch(self, update, text):
+        user_id = update.effective_user.id
+        state = self.user_manager.get_user_state(user_id)
+        route = self.routes.get(state)
+        if route is None:
+            await self.fallback(update, text)
+            return
+        await self._run(route, update, text, typed=True)
+
+    async def dispatch_callback(self, update):
+        """Run the state's handler for a pressed button; its keyboard is removed so it is pressed once"""
+        query = update.callback_query
+        prefix, _, value = query.data.partition(':')
+        user_id = update.effective_user.id
+        route = self.routes.get(self.user_manager.get_user_state(user_id))
+        if (route is None or route.prefix != prefix
+                or (route.menu is not None and value not in route.menu.labels)
+                or (route.prompt and query.message.message_id != self.user_manager.get_prompt(user_id))):
+            STALE_PRESSES.inc((prefix,))
+            await query.answer(STALE_MESSAGE)
+            await self._remove_buttons(query)
+            return
+
+        await query.answer()
+        await self._remove_buttons(query)
+        await self._run(route, update, value, typed=False)
+
+    async def _run(self, route, update, value, typed):
+        user_id = update.effective_user.id
+        state = route.state
+        start = perf_counter()
+        try:
+            if route.timeout and self.user_manager.get_state_age(user_id) > route.timeout:
+                STATE_EXPIRED.inc((state,))
+                logger.debug("State %s of user %s expired", state, user_id)
+                self.user_manager.set_user_state(user_id, 'main_menu')
+                await update.effective_message.reply_text(
+                    route.expired or EXPIRED_MESSAGE, reply_markup=REMOVE_KEYBOARD
+                )
+                return
+
+            if typed and route.menu is not None:
+                value = route.menu.parse(value)
+                if value is None:
+                    STATE_REJECTED.inc((state,))
+                    await update.effective_message.reply_text(route.menu.error, reply_markup=route.menu.markup)
+                    return
+
+            if route.validate is not None:
+                error = route.validate(value)
+                if error:
+                    STATE_REJECTED.inc((state,))
+                    await update.effective_message.reply_text(error)
+                    return
+
+            await route.handler(update, value)
+        finally:
+            STATE_LATENCY.observe(perf_counter() - start, (state,))
+
+    @staticmethod
+    async def _remove_buttons(query):
+        try:
+            await query.edit_message_reply_markup(None)
+        except BadRequest as e:
+            # Already removed, or the message is too old to edit
+            logger.debug("Buttons not removed: %s", e)
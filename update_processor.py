@@ -0,0 +1,123 @@
+import logging
+from asyncio import Lock
+from time import perf_counter
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import Gauge, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+UPDATES_QUEUED = registry.register(Gauge(
+    'fithub_updates_queued', 'Updates waiting for their user lock or a free processing slot'))
+UPDATES_ACTIVE = registry.register(Gauge(
+    'fithub_updates_active', 'Updates currently being processed'))
+USERS_PENDING = registry.register(Gauge(
+    'fithub_users_with_pending_updates', 'Users with at least one queued or running update'))
+QUEUE_WAIT = registry.register(Histogram(
+    'fithub_update_queue_wait_seconds', 'Time an update waited before its handler started'))
+
+
+class _UserQueue:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates of different users concurrently while keeping the
+    updates of one user strictly in arrival order.
+
+    Each user gets a FIFO lock that lives only while the user has pending
+    updates. The user lock is taken before the global concurrency slot, so
+    a user flooding the bot queues behind their own lock instead of holding
+    slots other users could run in. Updates without a user or chat run
+    unordered, limited only by the slot count.
+    """
+
+    __slots__ = ('_users', 'queued', 'active')
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._users = {}
+        self.queued = 0
+        self.active = 0
+        UPDATES_QUEUED.set_function(lambda: self.queued)
+        UPDATES_ACTIVE.set_function(lambda: self.active)
+        USERS_PENDING.set_function(lambda: len(self._users))
+
+    @staticmethod
+    def ordering_key(update):
+        """Updates sharing a key are processed one at a time, in order"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    def pending(self, key):
+        """Number of queued or running updates for an ordering key"""
+        entry = self._users.get(key)
+        return entry.pending if entry else 0
+
+    async def process_update(self, update, coroutine):
+        # Overrides the base implementation to take the per-user lock first
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(update, coroutine, perf_counter())
+            return
+
+        entry = self._users.get(key)
+        if entry is None:
+            entry = self._users[key] = _UserQueue()
+        entry.pending += 1
+        try:
+            start = perf_counter()
+            self.queued += 1
+            try:
+                await entry.lock.acquire()
+            except BaseException:
+                self.queued -= 1
+                coroutine.close()
+                raise
+            try:
+                self.queued -= 1
+                await self._run(update, coroutine, start)
+            finally:
+                entry.lock.release()
+        finally:
+            entry.pending -= 1
+            if not entry.pending:
+                del self._users[key]
+
+    async def _run(self, update, coroutine, start):
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self.queued -= 1
+            coroutine.close()
+            raise
+        self.queued -= 1
+        QUEUE_WAIT.observe(perf_counter() - start)
+        self.active += 1
+        try:
+            await self.do_process_update(update, coroutine)
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._users:
+            logger.info("Update processor shutting down with %d users pending", len(self._users))
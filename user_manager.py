@@ -1,22 +1,28 @@
-from database import db
+from database import get_db
 from cpfc_calculator import CPFCCalculator
 import logging
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 class UserManager:
     def __init__(self):
-        self.db = db
         self.calculator = CPFCCalculator()
         self.user_states = {}
     
+    @property
+    def db(self):
+        return get_db()
+    
     def set_user_state(self, user_id, state, data=None):
         """Sets user state"""
         if user_id not in self.user_states:
             self.user_states[user_id] = {}
         
         self.user_states[user_id]['state'] = state
+        self.user_states[user_id]['since'] = time.monotonic()
+        self.user_states[user_id].pop('prompt', None)
         if data:
             self.user_states[user_id]['data'] = data
     
@@ -24,6 +30,19 @@ class UserManager:
         """Gets user state"""
         return self.user_states.get(user_id, {}).get('state')
     
+    def set_prompt(self, user_id, message_id):
+        """Records the message whose buttons answer the current state"""
+        self.user_states.setdefault(user_id, {})['prompt'] = message_id
+    
+    def get_prompt(self, user_id):
+        """Gets the message recorded by set_prompt since the state was last set"""
+        return self.user_states.get(user_id, {}).get('prompt')
+    
+    def get_state_age(self, user_id):
+        """Seconds since the user's state was last set"""
+        since = self.user_states.get(user_id, {}).get('since')
+        return time.monotonic() - since if since is not None else 0.0
+    
     def get_user_data(self, user_id):
         """Gets user data"""
         return self.user_states.get(user_id, {}).get('data', {})
@@ -0,0 +1,115 @@
+"""
+Batched deletion of a user's history for /restart.
+
+Meals (their items cascade), drinks and meal templates are deleted
+`batch_size` rows at a time on a dedicated connection, each batch in its
+own short transaction, so row locks are held briefly and the shared
+connection stays free. Only rows that existed when the wipe started are
+deleted: anything logged meanwhile is kept, and the rollups are rebuilt
+from it at the end.
+
+    python wipe.py --user 123456789
+"""
+import argparse
+import logging
+import sys
+import time
+
+from backfill_rollups import rebuild
+from config import Config
+from database import dedicated_connection
+from logging_utils import configure_logging
+from metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+WIPE_LATENCY = registry.register(Histogram(
+    'fithub_wipe_seconds', 'Duration of /restart history wipes'))
+
+# Tables wiped batch by batch; meal_items go with their meals
+WIPE_TABLES = ('meals', 'drinks', 'meal_templates')
+
+# ctid = ANY(ARRAY(...)) rather than ctid IN (...), so each batch is a TID scan
+DELETE_BATCH = '''
+    DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM {table} WHERE user_id = %(user_id)s AND id <= %(last_id)s LIMIT %(batch_size)s
+    ))
+'''
+
+
+def wipe_history(user_id, batch_size=None, progress=None, conn=None):
+    """
+    Delete a user's meals, drinks and templates and rebuild their rollups;
+    returns rows deleted per table. `progress(counts)` is called after every batch.
+    """
+    batch_size = batch_size or Config.WIPE_BATCH_SIZE
+    own_conn = conn is None
+    conn = conn or dedicated_connection()
+    start = time.perf_counter()
+    counts = dict.fromkeys(WIPE_TABLES, 0)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(' UNION ALL '.join(
+                f'SELECT COALESCE(MAX(id), 0) FROM {table} WHERE user_id = %(user_id)s' for table in WIPE_TABLES
+            ), {'user_id': user_id})
+            last_ids = dict(zip(WIPE_TABLES, (row[0] for row in cur.fetchall())))
+        conn.commit()
+
+        for table in WIPE_TABLES:
+            params = {'user_id': user_id, 'last_id': last_ids[table], 'batch_size': batch_size}
+            while last_ids[table]:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(DELETE_BATCH.format(table=table), params)
+                        deleted = cur.rowcount
+                    conn.commit()
+                except Exception as e:
+                    logger.error(f"Error wiping {table} for user {user_id}: {e}")
+                    conn.rollback()
+                    raise
+                counts[table] += deleted
+                if progress is not None:
+                    progress(dict(counts))
+                if deleted < batch_size:
+                    break
+
+        try:
+            with conn.cursor() as cur:
+                rebuild(cur, user_id)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error rebuilding rollups after wiping user {user_id}: {e}")
+            conn.rollback()
+            raise
+    finally:
+        if own_conn:
+            conn.close()
+    elapsed = time.perf_counter() - start
+    WIPE_LATENCY.observe(elapsed)
+    logger.info("Wiped history of user %s in %.2fs: %s", user_id, elapsed, counts)
+    return counts
+
+
+def format_counts(counts):
+    return f"{counts['meals']} meals, {counts['drinks']} drinks and {counts['meal_templates']} saved meals"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--user', type=int, required=True, help='user whose history is deleted')
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    configure_logging()
+
+    def progress(counts):
+        print(f"\r{sum(counts.values())} rows deleted", end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    counts = wipe_history(args.user, args.batch_size, progress)
+    print(file=sys.stderr)
+    print(f"Deleted {format_counts(counts)} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()